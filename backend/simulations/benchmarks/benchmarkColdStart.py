@@ -0,0 +1,115 @@
+"""
+Cold start of the API, i.e. what a scale from zero instance spends before it answers its first simulation request.
+
+Every measurement runs in a fresh interpreter:
+    - import: seconds to import main (the FastAPI app and everything it pulls in)
+    - first request: seconds for the first simulation after that, a week on the kernel engine with the address in
+      the geocode cache, synthetic weather and the null result sink, so nothing goes over the network
+
+"lazy" is the tree as it is. "eager" imports googlemaps, BigQuery, pandas, requests and dateutil up front first, the
+way SimulatedWorld used to when it was imported.
+
+Run from backend/simulations:
+    python -m benchmarks.benchmarkColdStart
+    python -m benchmarks.benchmarkColdStart --repeats 10
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+
+SIMULATIONS_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Imported by SimulatedWorld at module load before they were deferred to the phase that needs them
+EAGER_MODULES = ["googlemaps", "google.cloud.bigquery", "pandas", "requests", "dateutil.relativedelta"]
+
+# Run in the fresh interpreter, prints its timings as JSON on the last line
+_COLD_START_SCRIPT = """
+import io
+import os
+import sys
+import json
+import time
+import contextlib
+import importlib
+
+start = time.perf_counter()
+for module_name in {eager_modules!r}:
+    importlib.import_module(module_name)
+import main
+import_seconds = time.perf_counter() - start
+
+from simulationObjects.SimulatedWorld import SimulatedWorld
+from simulationObjects.ConfigurationInputs import SimulationIncomingRequest
+from simulationObjects.GeocodeCache import get_shared_geocode_cache
+
+with open('sampleData/sampleCorrectClientRequest.json') as sample_request_file:
+    request = json.load(sample_request_file)
+request.update(num_hours_to_simulate=24 * 7, simulation_uuid="cold-start", simulation_engine="kernel",
+               weather_provider="synthetic", result_sink="null", weather_lookback_years=1)
+os.chdir({scratch_directory!r})
+get_shared_geocode_cache().put(request["address"], 40.67, -111.82, persist=False)
+
+start = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+    world = SimulatedWorld(SimulationIncomingRequest(**request))
+    world.run_entire_simulation()
+    world.wait_for_results_upload()
+first_request_seconds = time.perf_counter() - start
+
+print(json.dumps({{"import_seconds": import_seconds, "first_request_seconds": first_request_seconds,
+                  "heavy_modules_loaded": [module_name for module_name in {heavy_modules!r}
+                                           if module_name in sys.modules]}}))
+"""
+
+
+def measure_cold_start(eager: bool) -> dict:
+    """
+    :param eager: import EAGER_MODULES before main
+    :return: {"import_seconds": float, "first_request_seconds": float, "heavy_modules_loaded": [module names]}
+    """
+    with tempfile.TemporaryDirectory() as scratch_directory:
+        script = _COLD_START_SCRIPT.format(eager_modules=EAGER_MODULES if eager else [],
+                                           scratch_directory=scratch_directory, heavy_modules=EAGER_MODULES)
+        environment = dict(os.environ,
+                           GEOCODE_CACHE_FILE_PATH=os.path.join(scratch_directory, "geocodeCache.json"),
+                           WEATHER_CACHE_DIRECTORY=os.path.join(scratch_directory, "weatherCache"),
+                           SIMULATION_CHECKPOINT_DIRECTORY=os.path.join(scratch_directory, "checkpoints"))
+        completed = subprocess.run([sys.executable, "-c", script], cwd=SIMULATIONS_DIRECTORY, env=environment,
+                                   capture_output=True, text=True, check=True)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def run_cold_start_benchmark(repeats: int = 5) -> dict:
+    """
+    :param repeats: fresh interpreters per mode, the fastest of them is kept
+    :return: "lazy"/"eager" -> {"import_seconds", "first_request_seconds", "heavy_modules_loaded"}
+    """
+    results = {}
+    for mode in ("lazy", "eager"):
+        runs = [measure_cold_start(eager=mode == "eager") for _ in range(repeats)]
+        results[mode] = {"import_seconds": min(run["import_seconds"] for run in runs),
+                         "first_request_seconds": min(run["first_request_seconds"] for run in runs),
+                         "heavy_modules_loaded": runs[0]["heavy_modules_loaded"]}
+    return results
+
+
+def print_results(results: dict):
+    print(f"\n  {'mode':<8}{'import s':>12}{'first request s':>18}{'total s':>12}  heavy modules loaded")
+    for mode, timings in results.items():
+        print(f"  {mode:<8}{timings['import_seconds']:>12.3f}{timings['first_request_seconds']:>18.3f}"
+              f"{timings['import_seconds'] + timings['first_request_seconds']:>12.3f}  "
+              f"{', '.join(timings['heavy_modules_loaded']) or '-'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time and first request latency of a fresh API process")
+    parser.add_argument("--repeats", type=int, default=5, help="fastest of this many fresh interpreters is reported")
+    args = parser.parse_args()
+    print_results(run_cold_start_benchmark(args.repeats))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Memory held by the simulation components, e.g. one collector, pump and container per configuration of a ParameterSweep.
+
+Compares the slotted components against the same classes with a __dict__ per instance and a consumption schedule per
+container, i.e. how they were before __slots__ and shared schedules.
+
+Run from backend/simulations:
+    python -m benchmarks.benchmarkComponentMemory
+    python -m benchmarks.benchmarkComponentMemory --num-components 50000
+"""
+import json
+import argparse
+import warnings
+import tracemalloc
+
+from simulationObjects.ConfigurationInputs import SimulationIncomingRequest
+from simulationObjects.SolarCollector import SolarCollector
+from simulationObjects.WaterPump import WaterPump
+from simulationObjects.WaterContainer import WaterContainer
+from .benchmarkSimulation import SAMPLE_REQUEST_FILE_PATH
+
+
+def with_instance_dict(component_class):
+    """
+    Copy of a slotted component class that keeps its attributes in a __dict__ per instance instead
+    :param component_class: SolarCollector, WaterPump or WaterContainer
+    :return:
+    """
+    slot_names = set(component_class.__slots__) | {"__slots__"}
+    namespace = {name: value for name, value in vars(component_class).items() if name not in slot_names}
+    return type(component_class.__name__, (), namespace)
+
+
+def measure_allocated_bytes(build_component, num_components: int) -> int:
+    """
+    :param build_component: called once per component
+    :param num_components:
+    :return: bytes still allocated once all the components are built
+    """
+    # warnings raised while building are kept by whoever records them (e.g. pytest), which isn't component memory
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        tracemalloc.start()
+        try:
+            starting_bytes, _ = tracemalloc.get_traced_memory()
+            components = [build_component() for _ in range(num_components)]
+            allocated_bytes, _ = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    del components
+    return allocated_bytes - starting_bytes
+
+
+def run_component_memory_benchmark(num_components: int = 10000) -> dict:
+    """
+    Builds num_components of each component from the sample request, once as they are and once with a __dict__ per
+    instance (and for containers a consumption schedule of their own)
+    :param num_components:
+    :return: component name -> {"slotted": bytes, "instance_dict": bytes}
+    """
+    with open(SAMPLE_REQUEST_FILE_PATH) as sample_request_file:
+        configuration = SimulationIncomingRequest(**json.load(sample_request_file))
+
+    def build_unshared_container(container_class):
+        container = container_class(configuration.water_container, calendar_year=2023)
+        container._consumption_by_hour_of_year = container._consumption_by_hour_of_year.copy()
+        container._consumption_volume_by_hour_of_year = memoryview(container._consumption_by_hour_of_year[:, 0])
+        container._consumption_temperature_by_hour_of_year = memoryview(container._consumption_by_hour_of_year[:, 1])
+        return container
+
+    # builds one first, so the shared consumption schedule isn't counted against the slotted containers
+    WaterContainer(configuration.water_container, calendar_year=2023)
+    results = {}
+    for component_class, config in ((SolarCollector, configuration.solar), (WaterPump, configuration.water_pump)):
+        dict_class = with_instance_dict(component_class)
+        results[component_class.__name__] = {
+            "slotted": measure_allocated_bytes(lambda: component_class(config), num_components),
+            "instance_dict": measure_allocated_bytes(lambda: dict_class(config), num_components)}
+    dict_container_class = with_instance_dict(WaterContainer)
+    results[WaterContainer.__name__] = {
+        "slotted": measure_allocated_bytes(
+            lambda: WaterContainer(configuration.water_container, calendar_year=2023), num_components),
+        "instance_dict": measure_allocated_bytes(lambda: build_unshared_container(dict_container_class),
+                                                 num_components)}
+    return results
+
+
+def print_results(results: dict, num_components: int):
+    print(f"\n{num_components:,} of each component")
+    print(f"  {'component':<20}{'slotted MB':>14}{'__dict__ MB':>14}{'saved MB':>12}{'saved B each':>14}")
+    for component_name, allocated_bytes in results.items():
+        saved_bytes = allocated_bytes["instance_dict"] - allocated_bytes["slotted"]
+        print(f"  {component_name:<20}{allocated_bytes['slotted'] / 1e6:>14.2f}"
+              f"{allocated_bytes['instance_dict'] / 1e6:>14.2f}{saved_bytes / 1e6:>12.2f}"
+              f"{saved_bytes / num_components:>14,.0f}")
+    print("  the __dict__ containers also hold a consumption schedule each instead of sharing one")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory held by the simulation components")
+    parser.add_argument("--num-components", type=int, default=10000)
+    args = parser.parse_args()
+    print_results(run_component_memory_benchmark(args.num_components), args.num_components)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Per request setup cost of the external clients under concurrent load - no network needed.
+
+A local keep-alive HTTP server stands in for Google Maps / Open Meteo. Concurrent simulations each make their calls
+either through the shared, pooled ExternalClients session, or through a session of their own built for the request,
+i.e. how every SimulatedWorld used to build its own clients. Plain HTTP on localhost, so this only counts connection
+setup, a TLS handshake to a real API adds tens of milliseconds more per new connection.
+
+Run from backend/simulations:
+    python -m benchmarks.benchmarkExternalClients
+    python -m benchmarks.benchmarkExternalClients --concurrency 32 --num-simulations 2000
+"""
+import time
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from simulationObjects.ExternalClients import ExternalClients, make_pooled_session
+from simulationObjects.CONSTANTS import EXTERNAL_CLIENT_MAX_CONNECTIONS
+
+
+class _CountingHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keeps connections open between requests
+    disable_nagle_algorithm = True  # headers and body go out as separate writes
+    connections_opened = 0
+    connections_lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with _CountingHandler.connections_lock:
+            _CountingHandler.connections_opened += 1
+
+    def do_GET(self):
+        body = b'{"status": "OK"}'
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def measure_requests(url: str, get_session, concurrency: int, num_simulations: int, calls_per_simulation: int,
+                     close_session: bool) -> dict:
+    """
+    :param url:
+    :param get_session: called at the start of every simulation for the session it makes its calls with
+    :param concurrency: simulations running at the same time
+    :param num_simulations:
+    :param calls_per_simulation: e.g. a geocode and a weather fetch
+    :param close_session: close the session when the simulation is done, for sessions built per simulation
+    :return: {"mean_ms", "p95_ms", "connections_opened", "simulations_per_second"}
+    """
+    def run_simulation(_):
+        start = time.perf_counter()
+        session = get_session()
+        for _ in range(calls_per_simulation):
+            session.get(url, timeout=5).raise_for_status()
+        if close_session:
+            session.close()
+        return time.perf_counter() - start
+
+    _CountingHandler.connections_opened = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = np.array(list(executor.map(run_simulation, range(num_simulations))))
+    elapsed = time.perf_counter() - start
+    return {"mean_ms": 1e3 * latencies.mean(), "p95_ms": 1e3 * np.percentile(latencies, 95),
+            "connections_opened": _CountingHandler.connections_opened,
+            "simulations_per_second": num_simulations / elapsed}
+
+
+def run_external_clients_benchmark(concurrency: int = 8, num_simulations: int = 500, calls_per_simulation: int = 2,
+                                   max_connections: int = EXTERNAL_CLIENT_MAX_CONNECTIONS) -> dict:
+    """
+    :param concurrency:
+    :param num_simulations:
+    :param calls_per_simulation:
+    :param max_connections: pool size of the shared session
+    :return: "shared"/"per_simulation" -> see measure_requests
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _CountingHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/"
+    external_clients = ExternalClients(max_connections=max_connections)
+    try:
+        return {
+            "shared": measure_requests(url, external_clients.get_open_meteo_session, concurrency, num_simulations,
+                                       calls_per_simulation, close_session=False),
+            "per_simulation": measure_requests(url, lambda: make_pooled_session(max_connections), concurrency,
+                                               num_simulations, calls_per_simulation, close_session=True)}
+    finally:
+        external_clients.close()
+        server.shutdown()
+        server.server_close()
+
+
+def print_results(results: dict, concurrency: int, num_simulations: int):
+    print(f"\n{num_simulations:,} simulations, {concurrency} at a time")
+    print(f"  {'clients':<16}{'mean ms':>10}{'p95 ms':>10}{'connections':>14}{'simulations/s':>16}")
+    for clients_name, timings in results.items():
+        print(f"  {clients_name:<16}{timings['mean_ms']:>10.2f}{timings['p95_ms']:>10.2f}"
+              f"{timings['connections_opened']:>14,}{timings['simulations_per_second']:>16,.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per request setup cost of the external clients under load")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--num-simulations", type=int, default=500)
+    parser.add_argument("--calls-per-simulation", type=int, default=2)
+    args = parser.parse_args()
+    results = run_external_clients_benchmark(args.concurrency, args.num_simulations, args.calls_per_simulation)
+    print_results(results, args.concurrency, args.num_simulations)
+
+
+if __name__ == "__main__":
+    main()
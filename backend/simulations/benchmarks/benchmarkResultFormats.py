@@ -0,0 +1,119 @@
+"""
+Bytes handed to the result sink and time to write them, for the hourly results of one simulation, a year by default.
+
+The rows come from a kernel engine run of the sample request on synthetic weather, then are written out as:
+    - csv: what the simulation output used to always be, what BigQuery loaded
+    - csv_gzip: the same CSV gzipped, for reference
+    - parquet_<codec>: MetricsBuffer.write_parquet with BIGQUERY_SCHEMA, skipped if pyarrow isn't installed
+
+Run from backend/simulations:
+    python -m benchmarks.benchmarkResultFormats
+    python -m benchmarks.benchmarkResultFormats --num-hours 8760 --repeats 5
+"""
+import io
+import os
+import csv
+import gzip
+import time
+import argparse
+import tempfile
+import contextlib
+
+from simulationObjects.CONSTANTS import BIGQUERY_SCHEMA, SIMULATION_ENGINE_KERNEL
+from simulationObjects.MetricsBuffer import MetricsBuffer
+from simulationObjects.ResultSinks import is_pyarrow_installed
+from .benchmarkSimulation import make_benchmark_world
+from .syntheticWeather import make_synthetic_weather
+
+PARQUET_CODECS = ["zstd", "snappy"]
+
+
+def simulate_metrics_buffer(num_hours: int) -> MetricsBuffer:
+    """
+    Runs in a scratch working directory with stdout silenced, same as benchmarkSimulation
+    :param num_hours:
+    :return: the metrics buffer of the finished simulation
+    """
+    original_working_directory = os.getcwd()
+    with tempfile.TemporaryDirectory() as scratch_directory:
+        os.chdir(scratch_directory)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                world = make_benchmark_world(num_hours, make_synthetic_weather(), SIMULATION_ENGINE_KERNEL)
+                world.get_weather_data()
+                world.start_simulation_with_kernel()
+                world._output_buffer.close()
+        finally:
+            os.chdir(original_working_directory)
+    return world._metrics_buffer
+
+
+def write_csv(metrics_buffer: MetricsBuffer, output_file_path: str):
+    with open(output_file_path, 'w', newline='') as output_file:
+        metrics_buffer.write_csv(csv.writer(output_file))
+
+
+def write_csv_gzip(metrics_buffer: MetricsBuffer, output_file_path: str):
+    with gzip.open(output_file_path, 'wt', newline='') as output_file:
+        metrics_buffer.write_csv(csv.writer(output_file))
+
+
+def measure_result_format(write_results, metrics_buffer: MetricsBuffer, output_file_path: str, repeats: int) -> dict:
+    """
+    :param write_results: called with (metrics_buffer, output_file_path)
+    :param metrics_buffer:
+    :param output_file_path:
+    :param repeats: fastest of this many writes is kept
+    :return: {"seconds": float, "bytes": int}
+    """
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        write_results(metrics_buffer, output_file_path)
+        seconds.append(time.perf_counter() - start)
+    return {"seconds": min(seconds), "bytes": os.path.getsize(output_file_path)}
+
+
+def run_result_formats_benchmark(num_hours: int = 24 * 365, repeats: int = 3) -> dict:
+    """
+    :param num_hours: hours simulated, one row each
+    :param repeats:
+    :return: {"num_rows": int, "formats": format name -> {"seconds", "bytes"}}
+    """
+    metrics_buffer = simulate_metrics_buffer(num_hours)
+    result_formats = {"csv": (write_csv, ".csv"), "csv_gzip": (write_csv_gzip, ".csv.gz")}
+    if is_pyarrow_installed():
+        for codec in PARQUET_CODECS:
+            result_formats[f"parquet_{codec}"] = (
+                lambda buffer, path, codec=codec: buffer.write_parquet(path, BIGQUERY_SCHEMA, compression=codec),
+                ".parquet")
+
+    results = {"num_rows": metrics_buffer.num_rows, "formats": {}}
+    with tempfile.TemporaryDirectory() as scratch_directory:
+        for format_name, (write_results, suffix) in result_formats.items():
+            results["formats"][format_name] = measure_result_format(
+                write_results, metrics_buffer, os.path.join(scratch_directory, f"results{suffix}"), repeats)
+    return results
+
+
+def print_results(results: dict):
+    csv_bytes = results["formats"]["csv"]["bytes"]
+    print(f"\n{results['num_rows']:,} rows")
+    print(f"  {'format':<18}{'KB':>10}{'vs csv':>10}{'write ms':>12}")
+    for format_name, measurement in results["formats"].items():
+        print(f"  {format_name:<18}{measurement['bytes'] / 1e3:>10.1f}{measurement['bytes'] / csv_bytes:>9.2f}x"
+              f"{1e3 * measurement['seconds']:>12.2f}")
+    if not is_pyarrow_installed():
+        print("  Parquet skipped, pip install pyarrow to compare it")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bytes and write time of one simulation's results per format")
+    parser.add_argument("--num-hours", type=int, default=24 * 365)
+    parser.add_argument("--repeats", type=int, default=3, help="fastest of this many writes is reported")
+    args = parser.parse_args()
+    print_results(run_result_formats_benchmark(args.num_hours, args.repeats))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+Offline benchmarks for the simulation hot path - no Google Maps, Open Meteo or BigQuery needed.
+
+Geocoding and weather are served from the caches, seeded with synthetic (or recorded) weather, and results go to the
+null result sink. Everything runs in a scratch working directory so the real output file and caches aren't touched.
+
+Run from backend/simulations:
+    python -m benchmarks.benchmarkSimulation
+    python -m benchmarks.benchmarkSimulation --horizons week --repeats 5 --json timings.json
+    python -m benchmarks.benchmarkSimulation --baseline timings.json  # shows % change against an earlier run
+"""
+import os
+import io
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+from collections import defaultdict
+
+import numpy as np
+
+from simulationObjects.ConfigurationInputs import SimulationIncomingRequest
+from simulationObjects.SimulatedWorld import SimulatedWorld
+from simulationObjects.WeatherCache import WeatherCache
+from simulationObjects.GeocodeCache import GeocodeCache
+from simulationObjects.WeatherProviders import split_into_yearly_chunks
+from simulationObjects.SolarCollector import SolarCollector
+from simulationObjects.WaterPump import WaterPump
+from simulationObjects.WaterContainer import WaterContainer
+from simulationObjects.CONSTANTS import RESULT_SINK_NULL, SIMULATION_ENGINE_KERNEL, \
+    SIMULATION_ENGINE_FAST_FORWARD
+from .syntheticWeather import make_synthetic_weather, load_weather_fixture, SYNTHETIC_WEATHER_LATITUDE, \
+    SYNTHETIC_WEATHER_LONGITUDE
+
+HORIZONS = {"week": 24 * 7, "month": 24 * 30, "year": 24 * 365}
+
+SAMPLE_REQUEST_FILE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'sampleData',
+                                        'sampleCorrectClientRequest.json')
+
+# Hourly methods of each component, timed one by one inside the object engine loop
+COMPONENT_HOURLY_METHODS = [
+    (SolarCollector, "add_one_hour_solar_energy"),
+    (WaterContainer, "run_hour_of_usage"),
+    (WaterPump, "adjust_flow_to_current_state"),
+    (WaterPump, "get_flow_rate"),
+]
+
+
+def make_benchmark_world(num_hours: int, weather, simulation_engine: str = None) -> SimulatedWorld:
+    """
+    A world for the sample request whose address and every year of weather are already cached, so nothing goes over
+    the network.
+    Uses its own caches in the current working directory instead of the shared ones
+    :param num_hours:
+    :param weather: (timestamps, DNI values)
+    :param simulation_engine:
+    :return:
+    """
+    with open(SAMPLE_REQUEST_FILE_PATH) as sample_request_file:
+        request = json.load(sample_request_file)
+    request.update(num_hours_to_simulate=num_hours, simulation_uuid="benchmark", result_sink=RESULT_SINK_NULL,
+                   simulation_engine=simulation_engine)
+
+    world = SimulatedWorld(SimulationIncomingRequest(**request))
+    world._geocode_cache = GeocodeCache(cache_file_path=os.path.abspath("geocodeCache.json"))
+    world._weather_cache = WeatherCache(cache_directory=os.path.abspath("weatherCache"))
+    world._geocode_cache.put(world._address_of_system, SYNTHETIC_WEATHER_LATITUDE, SYNTHETIC_WEATHER_LONGITUDE,
+                             persist=False)
+    timestamps, dni_values = weather
+    for chunk_start_date, chunk_end_date in split_into_yearly_chunks(*world.get_weather_date_range()):
+        first_hour, after_last_hour = np.searchsorted(timestamps, [
+            np.datetime64(chunk_start_date, 'm'), np.datetime64(chunk_end_date, 'D') + np.timedelta64(1, 'D')])
+        world._weather_cache.put(SYNTHETIC_WEATHER_LATITUDE, SYNTHETIC_WEATHER_LONGITUDE, chunk_start_date,
+                                 chunk_end_date, timestamps[first_hour:after_last_hour],
+                                 dni_values[first_hour:after_last_hour])
+    world.generate_lat_long()
+    return world
+
+
+@contextlib.contextmanager
+def timed_methods(methods: list, timings: dict):
+    """
+    Swaps each class's method for one that adds its run time to timings["Class.method"], for the duration of the
+    with block
+    """
+    originals = [(owner, name, getattr(owner, name)) for owner, name in methods]
+
+    def make_timed(original, phase_name):
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                timings[phase_name] += time.perf_counter() - start
+        return timed
+
+    try:
+        for owner, name, original in originals:
+            setattr(owner, name, make_timed(original, f"{owner.__name__}.{name}"))
+        yield
+    finally:
+        for owner, name, original in originals:
+            setattr(owner, name, original)
+
+
+def benchmark_horizon(num_hours: int, weather) -> dict:
+    """
+    :param num_hours:
+    :param weather: (timestamps, DNI values)
+    :return: phase name -> seconds
+    """
+    timings = defaultdict(float)
+
+    # Per phase breakdown, same steps as SimulatedWorld.start_simulation
+    world = make_benchmark_world(num_hours, weather)
+    start = time.perf_counter()
+    world.get_weather_data()
+    timings["get_weather_data"] = time.perf_counter() - start
+
+    world.calculate_output_file_header()
+    timestamps, hour_of_year_by_hour, _ = world.get_hours_to_simulate()
+    with timed_methods(COMPONENT_HOURLY_METHODS, timings):
+        for i in range(num_hours):
+            world._current_time_in_simulation = timestamps[i]
+            world._current_hour_of_year = int(hour_of_year_by_hour[i])
+
+            start = time.perf_counter()
+            world.write_out_simulation_results()
+            timings["write_out_simulation_results"] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            world.run_one_hourly_iteration_of_simulation()
+            timings["run_one_hourly_iteration_of_simulation"] += time.perf_counter() - start
+
+    start = time.perf_counter()
+    world.write_out_metrics_buffer()
+    timings["write_out_metrics_buffer"] = time.perf_counter() - start
+    world._output_buffer.close()
+
+    # End to end, per engine
+    for phase_name, simulation_engine in (("start_simulation", None),
+                                          ("start_simulation_with_kernel", SIMULATION_ENGINE_KERNEL),
+                                          ("start_simulation_with_fast_forward", SIMULATION_ENGINE_FAST_FORWARD)):
+        world = make_benchmark_world(num_hours, weather, simulation_engine)
+        world.get_weather_data()
+        start = time.perf_counter()
+        if simulation_engine in (SIMULATION_ENGINE_KERNEL, SIMULATION_ENGINE_FAST_FORWARD):
+            world.start_simulation_with_kernel()
+        else:
+            world.start_simulation()
+        timings[phase_name] = time.perf_counter() - start
+        world._output_buffer.close()
+
+    return dict(timings)
+
+
+def run_benchmarks(horizons: list, repeats: int = 3, weather=None) -> dict:
+    """
+    Runs in a scratch working directory with stdout silenced, the simulation prints every hour
+    :param horizons: names from HORIZONS
+    :param repeats: best of this many runs is kept for every phase
+    :param weather: (timestamps, DNI values), synthetic if not given
+    :return: horizon name -> phase name -> seconds
+    """
+    weather = weather if weather is not None else make_synthetic_weather()
+    results = {}
+    original_working_directory = os.getcwd()
+    with tempfile.TemporaryDirectory() as scratch_directory:
+        os.chdir(scratch_directory)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()) as silenced_stdout:
+                for horizon in horizons:
+                    best_timings = {}
+                    for _ in range(repeats):
+                        for phase_name, seconds in benchmark_horizon(HORIZONS[horizon], weather).items():
+                            best_timings[phase_name] = min(seconds, best_timings.get(phase_name, seconds))
+                        silenced_stdout.seek(0)
+                        silenced_stdout.truncate()
+                    results[horizon] = best_timings
+        finally:
+            os.chdir(original_working_directory)
+    return results
+
+
+def print_results(results: dict, baseline: dict = None):
+    for horizon, timings in results.items():
+        num_hours = HORIZONS[horizon]
+        print(f"\n{horizon} ({num_hours} hours)")
+        print(f"  {'phase':<45}{'total s':>12}{'us/hour':>12}{'vs baseline':>14}")
+        for phase_name, seconds in sorted(timings.items(), key=lambda item: -item[1]):
+            change = ""
+            baseline_seconds = (baseline or {}).get(horizon, {}).get(phase_name)
+            if baseline_seconds:
+                change = f"{100 * (seconds - baseline_seconds) / baseline_seconds:+.1f}%"
+            print(f"  {phase_name:<45}{seconds:>12.4f}{1e6 * seconds / num_hours:>12.2f}{change:>14}")
+        print(f"  object engine: {num_hours / timings['start_simulation']:,.0f} hours/s, "
+              f"kernel engine: {num_hours / timings['start_simulation_with_kernel']:,.0f} hours/s, "
+              f"fast forward engine: {num_hours / timings['start_simulation_with_fast_forward']:,.0f} hours/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the simulation hot path")
+    parser.add_argument("--horizons", nargs="+", choices=HORIZONS.keys(), default=list(HORIZONS.keys()))
+    parser.add_argument("--repeats", type=int, default=3, help="best of this many runs is reported")
+    parser.add_argument("--weather-fixture", help="recorded weather .npz, see syntheticWeather.save_weather_fixture")
+    parser.add_argument("--json", help="also write the timings to this file")
+    parser.add_argument("--baseline", help="timings file from an earlier run to compare against")
+    args = parser.parse_args()
+
+    weather = load_weather_fixture(args.weather_fixture) if args.weather_fixture else None
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    results = run_benchmarks(args.horizons, args.repeats, weather)
+    print_results(results, baseline)
+
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump(results, json_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Memory held by the fetched weather history of one simulation, 20 years of hourly DNI by default.
+
+Compares the typed arrays SimulatedWorld keeps now (datetime64[m] timestamps + float32 DNI) against how get_weather_data
+used to keep them: Python lists of DNI values and timestamp strings, plus a DataFrame indexed by those strings.
+
+Run from backend/simulations:
+    python -m benchmarks.benchmarkWeatherMemory
+    python -m benchmarks.benchmarkWeatherMemory --num-years 5
+"""
+import time
+import argparse
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from simulationObjects.HourOfYearClimatology import hour_of_year_indices
+from .syntheticWeather import make_synthetic_weather
+
+
+def build_string_indexed_weather(timestamps, dni_values) -> dict:
+    """
+    Weather as get_weather_data used to keep it
+    :param timestamps: datetime64[m] array
+    :param dni_values: float32 array
+    :return:
+    """
+    meteo_weather_data = {"DNI_data": dni_values.tolist(),
+                          "timestamps": np.datetime_as_string(timestamps, unit='m').tolist()}
+    pandas_data = pd.DataFrame(
+        {"DNI_value": pd.Series(meteo_weather_data["DNI_data"], index=meteo_weather_data["timestamps"])})
+    return {"meteo_weather_data": meteo_weather_data, "pandas_data": pandas_data}
+
+
+def build_typed_weather(timestamps, dni_values) -> dict:
+    """
+    Weather as get_weather_data keeps it now
+    :param timestamps: datetime64[m] array
+    :param dni_values: float32 array
+    :return:
+    """
+    return {"weather_timestamps": np.array(timestamps, dtype='datetime64[m]'),
+            "weather_dni": np.array(dni_values, dtype=np.float32)}
+
+
+def measure_allocated_bytes(build_weather, timestamps, dni_values) -> int:
+    """
+    :param build_weather: build_string_indexed_weather or build_typed_weather
+    :param timestamps:
+    :param dni_values:
+    :return: bytes still allocated once the weather is built
+    """
+    tracemalloc.start()
+    try:
+        starting_bytes, _ = tracemalloc.get_traced_memory()
+        weather = build_weather(timestamps, dni_values)
+        allocated_bytes, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del weather
+    return allocated_bytes - starting_bytes
+
+
+def time_hour_of_year_lookup(timestamps) -> float:
+    """
+    :param timestamps: timestamp strings or datetime64 array
+    :return: seconds to work out the hour of year slot of every timestamp
+    """
+    start = time.perf_counter()
+    hour_of_year_indices(timestamps)
+    return time.perf_counter() - start
+
+
+def run_weather_memory_benchmark(num_years: int = 20) -> dict:
+    """
+    :param num_years: years of hourly weather history, same as the lookback of a simulation
+    :return: {"num_hours": int, "string_indexed": {...}, "typed": {...}}, each with "bytes" and "lookup_seconds"
+    """
+    timestamps, dni_values = make_synthetic_weather(num_years=num_years)
+    string_indexed_weather = build_string_indexed_weather(timestamps, dni_values)
+    typed_weather = build_typed_weather(timestamps, dni_values)
+    return {
+        "num_hours": len(timestamps),
+        "string_indexed": {
+            "bytes": measure_allocated_bytes(build_string_indexed_weather, timestamps, dni_values),
+            "lookup_seconds": time_hour_of_year_lookup(string_indexed_weather["meteo_weather_data"]["timestamps"])},
+        "typed": {
+            "bytes": measure_allocated_bytes(build_typed_weather, timestamps, dni_values),
+            "lookup_seconds": time_hour_of_year_lookup(typed_weather["weather_timestamps"])}}
+
+
+def print_results(results: dict):
+    print(f"\n{results['num_hours']:,} hours of weather")
+    print(f"  {'storage':<20}{'MB':>10}{'hour of year lookup s':>24}")
+    for storage_name in ("string_indexed", "typed"):
+        print(f"  {storage_name:<20}{results[storage_name]['bytes'] / 1e6:>10.2f}"
+              f"{results[storage_name]['lookup_seconds']:>24.4f}")
+    print(f"  typed storage is {results['string_indexed']['bytes'] / results['typed']['bytes']:.1f}x smaller")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory held by the fetched weather history of one simulation")
+    parser.add_argument("--num-years", type=int, default=20)
+    args = parser.parse_args()
+    print_results(run_weather_memory_benchmark(args.num_years))
+
+
+if __name__ == "__main__":
+    main()
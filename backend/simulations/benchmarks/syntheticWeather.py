@@ -0,0 +1,41 @@
+import numpy as np
+
+from simulationObjects.WeatherProviders import SyntheticClearSkyWeatherProvider
+
+# Roughly where the sample request's address is, Holladay UT
+SYNTHETIC_WEATHER_LATITUDE = 40.67
+SYNTHETIC_WEATHER_LONGITUDE = -111.82
+
+
+def make_synthetic_weather(start_date: str = "2003-03-03", num_years: int = 20,
+                           latitude: float = SYNTHETIC_WEATHER_LATITUDE, seed: int = 0):
+    """
+    Hourly DNI shaped like the Open Meteo response, so benchmarks don't need the network. Clear sky DNI dimmed by a
+    random cloudiness per hour, see SyntheticClearSkyWeatherProvider
+    :param start_date: first hour is midnight of this day
+    :param num_years:
+    :param latitude: in degrees, decides day length and peak DNI through the year
+    :param seed: same seed, same weather
+    :return: (timestamps as datetime64[m], DNI values in W/m^2 as float32)
+    """
+    end_date = np.datetime64(f"{int(start_date[:4]) + num_years}{start_date[4:]}") - np.timedelta64(1, 'D')
+    return SyntheticClearSkyWeatherProvider(cloudiness_seed=seed).get_hourly_dni(
+        latitude, SYNTHETIC_WEATHER_LONGITUDE, start_date, str(end_date))
+
+
+def load_weather_fixture(file_path: str):
+    """
+    Loads recorded weather saved with save_weather_fixture
+    :param file_path: .npz file
+    :return: (timestamps as datetime64[m], DNI values in W/m^2 as float32)
+    """
+    with np.load(file_path) as weather_fixture:
+        return weather_fixture["timestamps"].astype('datetime64[m]'), weather_fixture["dni"].astype(np.float32)
+
+
+def save_weather_fixture(file_path: str, timestamps, dni_values):
+    """
+    e.g. to record a real Open Meteo response once: save_weather_fixture(path, *weather_cache.get(...))
+    """
+    np.savez_compressed(file_path, timestamps=np.asarray(timestamps, dtype='datetime64[m]'),
+                        dni=np.asarray(dni_values, dtype=np.float32))
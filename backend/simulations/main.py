@@ -1,10 +1,19 @@
 from fastapi import FastAPI, Body, Request
 import os
 import json
+import asyncio
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 from simulationObjects.SimulatedWorld import SimulatedWorld
+from simulationObjects.LocationAndWeather import geocode_address
+from simulationObjects.GeocodeCache import get_shared_geocode_cache
+from simulationObjects.ExternalClients import get_shared_external_clients, get_external_clients_started_with_app
 from simulationObjects.ConfigurationInputs import SimulationIncomingRequest
-from fastapi.responses import JSONResponse, HTMLResponse
+from simulationObjects.SimulationJobManager import SimulationJobManager
+from simulationObjects.SimulationStream import SimulationStream, TooManySimulationStreams, format_server_sent_event, \
+    FINAL_STREAM_EVENTS
+from simulationObjects.CONSTANTS import SIMULATION_JOB_MAX_WORKERS, SIMULATION_JOB_HISTORY_SIZE
+from fastapi.responses import JSONResponse, HTMLResponse, StreamingResponse
 from typing_extensions import Annotated
 from fastapi.templating import Jinja2Templates
 from fastapi.openapi.utils import get_openapi
@@ -16,7 +25,37 @@ templates = Jinja2Templates(directory="templates")
 
 load_dotenv()  # only relevant for local - P4 cleanup later
 
-app = FastAPI(swagger_ui_parameters={"syntaxHighlight.theme": "obsidian"})
+# worker processes are only started once the first job is submitted
+simulation_job_manager = SimulationJobManager(
+    max_workers=int(os.getenv('SIMULATION_JOB_MAX_WORKERS', SIMULATION_JOB_MAX_WORKERS)),
+    job_history_size=int(os.getenv('SIMULATION_JOB_HISTORY_SIZE', SIMULATION_JOB_HISTORY_SIZE)))
+
+
+def warm_up_geocode_cache():
+    """
+    Pre-loads known addresses into the geocode cache if GEOCODE_CACHE_WARM_UP_FILE points at a file of them
+    """
+    warm_up_file_path = os.getenv('GEOCODE_CACHE_WARM_UP_FILE')
+    if warm_up_file_path:
+        get_shared_geocode_cache().warm_up_from_file(warm_up_file_path, geocode_function=geocode_address)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Builds the Google Maps, Open Meteo and BigQuery clients once before the first request is served, every
+    simulation in the API process shares them. Job worker processes are forked without them and build their own on
+    first use, see ExternalClients._forget_external_clients_in_forked_child
+    """
+    external_clients = get_shared_external_clients()
+    await asyncio.to_thread(external_clients.start, get_external_clients_started_with_app())
+    warm_up_geocode_cache()
+    yield
+    simulation_job_manager.shutdown()
+    external_clients.close()
+
+
+app = FastAPI(lifespan=lifespan, swagger_ui_parameters={"syntaxHighlight.theme": "obsidian"})
 
 app.mount("/assets", StaticFiles(directory="templates/assets"), name="assets")
 
@@ -29,9 +68,17 @@ async def return_home_page(request: Request):
     return templates.TemplateResponse("home_page.html", {"request": request})
 
 
-@app.post("/createSimulation")
-async def create_simulation(incoming_simulation_parameters: Annotated[SimulationIncomingRequest, Body(
-    examples={
+@app.get("/health")
+async def check_external_clients_health():
+    """
+    Checks every external service the simulations depend on through the shared clients, 503 if any is unhealthy
+    """
+    health = await asyncio.to_thread(get_shared_external_clients().check_health)
+    healthy = all(client_health["healthy"] for client_health in health.values())
+    return JSONResponse(status_code=200 if healthy else 503, content=health)
+
+
+SIMULATION_REQUEST_EXAMPLES = {
         "normal": {"summary": "A 1 Month simulation from beautiful Holladay UT",
                    "description": "**standard example** - 7 days of modelling the system with reasonable values",
                    "value": {
@@ -1161,14 +1208,43 @@ async def create_simulation(incoming_simulation_parameters: Annotated[Simulation
                 }
             }}
 
-    })]):
+    }
+
+# Same house as the standard example, with weekend lie ins, longer winter showers and a full house over Christmas
+_normal_consumption_pattern = SIMULATION_REQUEST_EXAMPLES["normal"]["value"]["water_container"]["consumption_pattern"]
+SIMULATION_REQUEST_EXAMPLES["weekday-weekend-seasonal"] = {
+    "summary": "A 1 Year simulation - **with weekend, winter and holiday consumption profiles**",
+    "description": "**profiles example** - 1 Year of modelling the system with the water used changing between "
+                   "weekdays and weekends, through the seasons and over the holidays",
+    "value": dict(SIMULATION_REQUEST_EXAMPLES["normal"]["value"],
+                  simulation_uuid="weekday_weekend_seasonal_example",
+                  num_hours_to_simulate=24 * 365,
+                  water_container=dict(
+                      SIMULATION_REQUEST_EXAMPLES["normal"]["value"]["water_container"],
+                      weekend_consumption_pattern={
+                          f"{hour:02d}:00": _normal_consumption_pattern[f"{(hour - 2) % 24:02d}:00"]
+                          for hour in range(24)},
+                      monthly_consumption_patterns={
+                          month: {hour: dict(usage, water_used=usage["water_used"] * 1.25)
+                                  for hour, usage in _normal_consumption_pattern.items()}
+                          for month in ("December", "January", "February")},
+                      holiday_consumption_pattern={
+                          hour: dict(usage, water_used=usage["water_used"] * 2)
+                          for hour, usage in _normal_consumption_pattern.items()},
+                      holidays=["12-24", "12-25", "12-26", "01-01"]))}
+
+
+@app.post("/createSimulation")
+async def create_simulation(incoming_simulation_parameters: Annotated[SimulationIncomingRequest, Body(
+        examples=SIMULATION_REQUEST_EXAMPLES)]):
     # TODO - Implement marshmallow or similar for schema enforcement and sanitization
     print("Simulation Starting - Received Input Below")
     print(incoming_simulation_parameters)
 
     try:
         new_world = SimulatedWorld(incoming_simulation_parameters)
-        new_world.run_entire_simulation()
+        # on a worker thread, so a long simulation doesn't hold up every other request on the event loop
+        await asyncio.to_thread(new_world.run_entire_simulation)
     except KeyError as e:
         print(f'Request failed with exception {str(e)}')
         JSONResponse(status_code=400,
@@ -1181,6 +1257,85 @@ async def create_simulation(incoming_simulation_parameters: Annotated[Simulation
     return "Simulation Successful ", 200
 
 
+@app.post("/simulationJobs", status_code=202)
+async def create_simulation_job(incoming_simulation_parameters: Annotated[SimulationIncomingRequest, Body(
+        examples=SIMULATION_REQUEST_EXAMPLES)]):
+    """
+    Queues the simulation to run in the background and returns its job id straight away, poll
+    /simulationJobs/{job_id}/progress to follow it and /simulationJobs/{job_id}/result once it's done
+    """
+    job_id = simulation_job_manager.submit(incoming_simulation_parameters)
+    print(f"Simulation job {job_id} queued")
+    return {"job_id": job_id, "status": "queued"}
+
+
+@app.get("/simulationJobs/{job_id}")
+async def get_simulation_job_status(job_id: str):
+    try:
+        return simulation_job_manager.get_status(job_id)
+    except KeyError as e:
+        return JSONResponse(status_code=404, content={"exception": str(e), "message": "Unknown simulation job"})
+
+
+@app.get("/simulationJobs/{job_id}/progress")
+async def get_simulation_job_progress(job_id: str):
+    try:
+        return simulation_job_manager.get_progress(job_id)
+    except KeyError as e:
+        return JSONResponse(status_code=404, content={"exception": str(e), "message": "Unknown simulation job"})
+
+
+@app.get("/simulationJobs/{job_id}/result")
+async def get_simulation_job_result(job_id: str):
+    try:
+        result = simulation_job_manager.get_result(job_id)
+    except KeyError as e:
+        return JSONResponse(status_code=404, content={"exception": str(e), "message": "Unknown simulation job"})
+    except Exception as e:
+        return JSONResponse(status_code=500, content={"exception": str(e),
+                                                      "message": "Simulation encoutered the following critical exception that stopped successful simulation run"})
+    if result is None:
+        return JSONResponse(status_code=202, content=simulation_job_manager.get_status(job_id))
+    return {"job_id": job_id, "status": "succeeded", "result": result}
+
+
+@app.post("/simulationStream")
+async def stream_simulation(incoming_simulation_parameters: Annotated[SimulationIncomingRequest, Body(
+        examples=SIMULATION_REQUEST_EXAMPLES)]):
+    """
+    Runs the simulation and streams it back as Server-Sent Events while it runs: "start", then "rows" (a day of
+    hourly rows at a time) each followed by "progress", then "done" or "error". The simulation only runs as fast as
+    the client reads, and stops if the client goes away. Only a few streams run at once, 503 once they're all taken
+    """
+    try:
+        new_world = SimulatedWorld(incoming_simulation_parameters)
+    except KeyError as e:
+        return JSONResponse(status_code=400,
+                            content={"exception": str(e), "message": "Input Parameters incorrectly sent"})
+    simulation_stream = SimulationStream(new_world)
+    try:
+        simulation_stream.start()
+    except TooManySimulationStreams as e:
+        return JSONResponse(status_code=503, content={"exception": str(e), "message": "Simulation stream not started"})
+
+    async def server_sent_events():
+        try:
+            while True:
+                # short timeout so a client that went away isn't waited on for long
+                event = await asyncio.to_thread(simulation_stream.get_event, 1)
+                if event is None:
+                    continue
+                event_name, data = event
+                yield format_server_sent_event(event_name, data)
+                if event_name in FINAL_STREAM_EVENTS:
+                    break
+        finally:
+            simulation_stream.close()
+
+    return StreamingResponse(server_sent_events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 def custom_openapi():
     if app.openapi_schema:
         return app.openapi_schema
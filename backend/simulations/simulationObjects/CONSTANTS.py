@@ -2,8 +2,88 @@ SPECIFIC_HEAT_CAPACITY_OF_WATER = 4184  # Joules to increase temp of 1kg of waye
 # Simplifying assumption that 1Kg water is 1L,
 # even though this varies based on purity and temp of water
 
+HOURS_IN_LEAP_YEAR = 24 * 366  # one slot for every month-day-hour, 29-Feb included
+CONSUMPTION_SCHEDULE_CACHE_SIZE = 64  # compiled consumption schedules shared between water containers, ~70KB each
+
+# "object" steps the component objects hour by hour, "kernel" runs the whole simulation in SimulationKernel,
+# "fast_forward" is the kernel but jumps over runs of idle hours (no sun, no water used) in closed form
+SIMULATION_ENGINE_OBJECT = "object"
+SIMULATION_ENGINE_KERNEL = "kernel"
+SIMULATION_ENGINE_FAST_FORWARD = "fast_forward"
+FAST_FORWARD_MIN_IDLE_HOURS = 3  # shorter runs of idle hours are stepped through
+
+# Background simulation jobs, each can be overridden with an env variable of the same name
+SIMULATION_JOB_MAX_WORKERS = 2  # simulations are CPU bound, keep at or below the number of cores
+SIMULATION_JOB_HISTORY_SIZE = 1000  # finished jobs kept for status/result lookups
+
+# Where results are stored, chosen per request or with the SIMULATION_RESULT_SINK env variable, see ResultSinks
+RESULT_SINK_BIGQUERY = "bigquery"
+RESULT_SINK_SQLITE = "sqlite"
+RESULT_SINK_NULL = "null"
+RESULT_SINK_SQLITE_DATABASE_PATH = 'outputData/simulationResults.sqlite3'
+RESULT_UPLOAD_MAX_WORKERS = 4
+RESULT_CACHE_MAX_ENTRIES = 64  # finished simulations kept per process for identical resubmissions, ~1.5MB per year
+
+# Format results are handed to the sink in, chosen per request or with the SIMULATION_RESULT_FORMAT env variable.
+# Parquet by default when pyarrow is installed and the sink takes it, otherwise CSV, see ResultSinks.get_result_format
+RESULT_FORMAT_PARQUET = "parquet"
+RESULT_FORMAT_CSV = "csv"
+PARQUET_COMPRESSION = "zstd"  # column compression, one of the codecs BigQuery loads Parquet with
+
+# What is uploaded, chosen per request or with the SIMULATION_UPLOAD_MODE env variable: the hourly rows (default), only
+# the daily and monthly rollups of BIGQUERY_ROLLUP_SCHEMA, or both, see ResultRollups
+UPLOAD_MODE_HOURLY = "hourly"
+UPLOAD_MODE_AGGREGATES = "aggregates"
+UPLOAD_MODE_BOTH = "both"
+ROLLUP_PERIOD_DAY = "day"
+ROLLUP_PERIOD_MONTH = "month"
+
+# Each simulation's output rows stay in memory up to this size, then spill over to a temp file of its own, see
+# SimulationOutputBuffer. Can be overridden with an env variable of the same name
+SIMULATION_OUTPUT_BUFFER_MAX_MEMORY_BYTES = 16 * 1024 * 1024  # a year of hourly rows is ~1.5MB of CSV
+
+# Streaming a simulation's progress and rows as Server-Sent Events, see SimulationStream
+SIMULATION_STREAM_ROWS_PER_BATCH = 24  # a day of hourly rows per event
+SIMULATION_STREAM_MAX_QUEUED_EVENTS = 64  # the simulation waits for the client once this many events are unsent
+SIMULATION_STREAM_MAX_CONCURRENT = 2  # streamed simulations run in the API process, more are turned away with a 503
+
+# Checkpoints let a failed simulation resume where it left off, see SimulationCheckpoints
+SIMULATION_CHECKPOINT_DIRECTORY = 'simulationCheckpoints'
+SIMULATION_CHECKPOINT_INTERVAL_HOURS = 24 * 30  # hours simulated between checkpoints, 0 turns checkpoints off
+SIMULATION_CHECKPOINT_TIME_TO_LIVE_SECONDS = 7 * 24 * 60 * 60  # 1 week, runs that never finished are left behind
+
+# Where weather history comes from, chosen per request or with the SIMULATION_WEATHER_PROVIDER env variable,
+# see WeatherProviders
+WEATHER_PROVIDER_OPEN_METEO = "open_meteo"
+WEATHER_PROVIDER_SYNTHETIC = "synthetic"
+OPEN_METEO_ARCHIVE_API_URL = 'https://archive-api.open-meteo.com/v1/archive'
+OPEN_METEO_TIMEZONE = 'America/New_York'
+OPEN_METEO_TIMEOUT_SECONDS = (5, 60)  # connect, read - a year of hourly data is ~200KB
+OPEN_METEO_MAX_RETRIES = 3  # retried with backoff on connection errors, 429 and 5xx
+OPEN_METEO_MAX_CONCURRENT_REQUESTS = 4  # history is fetched one calendar year per request
+WEATHER_LOOKBACK_YEARS = 20  # default years of history averaged into the DNI climatology
+
 BIGQUERY_TABLE_ID = "solar-phyics-simulator.simulations_dataset.simulations_hourly_metrics"
-OUTPUT_METRICS_FILE_PATH = 'outputData/sampleSimulationOutput.csv'
+GOOGLE_MAPS_API_URL = 'https://maps.googleapis.com'
+
+# Clients for Google Maps, Open Meteo and BigQuery, built once per process, see ExternalClients. Each can be
+# overridden with an env variable of the same name
+EXTERNAL_CLIENT_MAX_CONNECTIONS = 10  # per client, requests beyond this wait for a free connection
+EXTERNAL_CLIENT_HEALTH_CHECK_TIMEOUT_SECONDS = 5
+# built when the app starts, comma separated, the others are built on first use
+EXTERNAL_CLIENTS_STARTED_WITH_APP = "google_maps,open_meteo,bigquery"
+
+# Weather cache defaults, each can be overridden with an env variable of the same name
+WEATHER_CACHE_DIRECTORY = 'weatherCache'
+WEATHER_CACHE_GRID_SIZE_DEGREES = 0.05  # ~5km, addresses in the same grid cell share weather history
+WEATHER_CACHE_TIME_TO_LIVE_SECONDS = 7 * 24 * 60 * 60  # 1 week
+WEATHER_CACHE_MAX_DISK_BYTES = 512 * 1024 * 1024  # 20 years of hourly data is ~2MB per location
+WEATHER_CACHE_MAX_MEMORY_BYTES = 128 * 1024 * 1024
+
+# Geocode cache defaults, each can be overridden with an env variable of the same name
+GEOCODE_CACHE_FILE_PATH = 'geocodeCache/geocodeCache.json'
+GEOCODE_CACHE_TIME_TO_LIVE_SECONDS = 90 * 24 * 60 * 60  # 90 days, addresses rarely move
+GEOCODE_CACHE_MAX_ENTRIES = 10000
 BIGQUERY_SCHEMA = [
     {"name": "uuid", "type": "STRING"},
     {"name": "Timestamp", "type": "TIMESTAMP"},
@@ -22,5 +102,21 @@ BIGQUERY_SCHEMA = [
     {"name": "energy_consumed_by_heater", "type": "FLOAT"},
     {"name": "energy_absorbed_from_pipes", "type": "FLOAT"}
     ,
+    # Left over from the table's first CSV import and 0 on most rows. For runs with compress_idle_hours it is the number
+    # of rows left out just before this one, i.e. idle hours between this row and the one before it that were
+    # fast-forwarded and not written, see MetricsBuffer.write_csv
     {"name": "int64_field_16", "type": "INTEGER"}
 ]
+
+# Daily and monthly totals of a simulation, one row per period. Every FLOAT column is the sum of that metric over the
+# hours starting in the period, energy_consumed_by_heater as the J the heater used, see ResultRollups.get_flows_by_hour
+BIGQUERY_ROLLUP_TABLE_ID = "solar-phyics-simulator.simulations_dataset.simulations_rollups"
+BIGQUERY_ROLLUP_SCHEMA = [
+    {"name": "uuid", "type": "STRING"},
+    {"name": "period", "type": "STRING"},  # "day" or "month"
+    {"name": "period_start", "type": "DATE"},
+    {"name": "num_hours", "type": "INTEGER"},  # hours simulated in the period, less than a full one at either end
+    {"name": "energy_captured_by_solar", "type": "FLOAT"},
+    {"name": "energy_consumed_by_heater", "type": "FLOAT"},
+    {"name": "volume_of_water_sent_out_of_water_container", "type": "FLOAT"}
+]
@@ -1,4 +1,4 @@
-from typing import Union, Dict
+from typing import Union, Dict, List
 from pydantic import BaseModel
 
 
@@ -27,6 +27,11 @@ class WaterContainerInput(BaseModel):
     efficiency_of_traditional_boiler: float
     minimum_average_water_temperature: float
     consumption_pattern: Dict[str, ConsumptionPatternOneHour]  # Keys are the hours, e.g. "01:00" as a key for 1am
+    # Optional profiles on top of consumption_pattern, same shape. Most specific wins: holiday, weekend, month, default
+    weekend_consumption_pattern: Union[Dict[str, ConsumptionPatternOneHour], None] = None  # Saturdays and Sundays
+    monthly_consumption_patterns: Union[Dict[str, Dict[str, ConsumptionPatternOneHour]], None] = None  # e.g. "July"
+    holiday_consumption_pattern: Union[Dict[str, ConsumptionPatternOneHour], None] = None
+    holidays: Union[List[str], None] = None  # "MM-DD" dates that use holiday_consumption_pattern, e.g. "12-25"
 
 
 class SimulationIncomingRequest(BaseModel):
@@ -37,3 +42,12 @@ class SimulationIncomingRequest(BaseModel):
     solar: SolarInput
     water_pump: WaterPumpInput
     water_container: WaterContainerInput
+    simulation_engine: Union[str, None] = None  # "object" (default), "kernel" or "fast_forward", see SimulationKernel
+    result_sink: Union[str, None] = None  # "bigquery", "sqlite" or "null", see ResultSinks
+    result_format: Union[str, None] = None  # "parquet" or "csv", see ResultSinks.get_result_format
+    upload_mode: Union[str, None] = None  # "hourly" (default), "aggregates" or "both", see ResultRollups
+    weather_provider: Union[str, None] = None  # "open_meteo" or "synthetic", see WeatherProviders
+    weather_lookback_years: Union[int, None] = None  # years of weather history averaged, defaults to 20
+    bypass_result_cache: bool = False  # always simulate from scratch, even if an identical request ran before
+    compress_idle_hours: bool = False  # with "fast_forward", leave rows inside runs of idle hours out of the output
+    checkpoint_interval_hours: Union[int, None] = None  # hours between checkpoints, 0 for none, defaults to 720
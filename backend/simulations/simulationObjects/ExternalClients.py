@@ -0,0 +1,209 @@
+import os
+import threading
+
+from .CONSTANTS import BIGQUERY_TABLE_ID, GOOGLE_MAPS_API_URL, OPEN_METEO_ARCHIVE_API_URL, OPEN_METEO_MAX_RETRIES, \
+    EXTERNAL_CLIENT_MAX_CONNECTIONS, EXTERNAL_CLIENT_HEALTH_CHECK_TIMEOUT_SECONDS, EXTERNAL_CLIENTS_STARTED_WITH_APP
+
+EXTERNAL_CLIENT_GOOGLE_MAPS = "google_maps"
+EXTERNAL_CLIENT_OPEN_METEO = "open_meteo"
+EXTERNAL_CLIENT_BIGQUERY = "bigquery"
+EXTERNAL_CLIENT_NAMES = (EXTERNAL_CLIENT_GOOGLE_MAPS, EXTERNAL_CLIENT_OPEN_METEO, EXTERNAL_CLIENT_BIGQUERY)
+
+
+def make_pooled_session(max_connections: int, max_retries: int = 0):
+    """
+    requests session that keeps up to max_connections connections open and never opens more, requests beyond that
+    wait for one to be free
+    :param max_connections:
+    :param max_retries: retries with backoff on connection errors, 429 and 5xx responses
+    :return: requests.Session
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    session = requests.Session()
+    retry = Retry(total=max_retries, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                  allowed_methods=("GET", "HEAD"))
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=1, pool_maxsize=max_connections, pool_block=True)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+class ExternalClients:
+    """
+    Clients for the services simulations talk to, built once per process and shared by every simulation in it, so
+    TLS handshakes, credential discovery and connection setup are paid once instead of per simulation:
+        - google_maps: googlemaps.Client for geocoding, over its own pooled session
+        - open_meteo: pooled session for the Open Meteo archive API, retries with backoff
+        - bigquery: bigquery.Client for results
+
+    Each is built on first use, or up front with start(), e.g. by the FastAPI lifespan so the first request doesn't
+    wait on them.
+    """
+    _google_maps_api_key: str = None
+    _max_connections: int = None
+    _open_meteo_max_retries: int = None
+    _health_check_timeout_seconds: float = None
+    _gmaps_client = None  # googlemaps.Client
+    _open_meteo_session = None  # requests.Session
+    _bigquery_client = None  # bigquery.Client
+    _lock: threading.Lock = None
+
+    def __init__(self, google_maps_api_key: str = None, max_connections: int = EXTERNAL_CLIENT_MAX_CONNECTIONS,
+                 open_meteo_max_retries: int = OPEN_METEO_MAX_RETRIES,
+                 health_check_timeout_seconds: float = EXTERNAL_CLIENT_HEALTH_CHECK_TIMEOUT_SECONDS,
+                 gmaps_client=None, open_meteo_session=None, bigquery_client=None):
+        """
+        :param google_maps_api_key:
+        :param max_connections: connections kept open to each service
+        :param open_meteo_max_retries:
+        :param health_check_timeout_seconds:
+        :param gmaps_client: built on first use if not given
+        :param open_meteo_session: built on first use if not given
+        :param bigquery_client: built on first use if not given
+        """
+        self._google_maps_api_key = google_maps_api_key
+        self._max_connections = max_connections
+        self._open_meteo_max_retries = open_meteo_max_retries
+        self._health_check_timeout_seconds = health_check_timeout_seconds
+        self._gmaps_client = gmaps_client
+        self._open_meteo_session = open_meteo_session
+        self._bigquery_client = bigquery_client
+        self._lock = threading.Lock()
+
+    def get_gmaps_client(self):
+        with self._lock:
+            if self._gmaps_client is None:
+                import googlemaps
+                self._gmaps_client = googlemaps.Client(
+                    key=self._google_maps_api_key, base_url=GOOGLE_MAPS_API_URL,
+                    requests_session=make_pooled_session(self._max_connections))
+            return self._gmaps_client
+
+    def get_open_meteo_session(self):
+        with self._lock:
+            if self._open_meteo_session is None:
+                self._open_meteo_session = make_pooled_session(self._max_connections, self._open_meteo_max_retries)
+            return self._open_meteo_session
+
+    def get_bigquery_client(self):
+        with self._lock:
+            if self._bigquery_client is None:
+                from google.cloud import bigquery
+                self._bigquery_client = bigquery.Client()
+            return self._bigquery_client
+
+    def get_client(self, client_name: str):
+        """
+        :param client_name: one of EXTERNAL_CLIENT_NAMES
+        :return:
+        :raises KeyError: unknown client name
+        """
+        if client_name == EXTERNAL_CLIENT_GOOGLE_MAPS:
+            return self.get_gmaps_client()
+        if client_name == EXTERNAL_CLIENT_OPEN_METEO:
+            return self.get_open_meteo_session()
+        if client_name == EXTERNAL_CLIENT_BIGQUERY:
+            return self.get_bigquery_client()
+        raise KeyError(f"Unknown external client {client_name}")
+
+    def start(self, client_names=EXTERNAL_CLIENT_NAMES) -> dict:
+        """
+        Builds the clients up front. One that fails to build, e.g. no credentials when running locally, is left to
+        be built again on first use rather than stopping the app from starting
+        :param client_names:
+        :return: client name -> None if built, otherwise why not
+        """
+        errors = {}
+        for client_name in client_names:
+            try:
+                self.get_client(client_name)
+                errors[client_name] = None
+            except Exception as e:
+                print(f"Could not build {client_name} client at startup, trying again on first use: {str(e)}")
+                errors[client_name] = str(e)
+        return errors
+
+    def check_health(self, client_names=EXTERNAL_CLIENT_NAMES) -> dict:
+        """
+        One cheap request per service through its client. Google Maps and Open Meteo only need to answer without a
+        server error, BigQuery has to be able to read the results table
+        :param client_names:
+        :return: client name -> {"healthy": bool, "detail": str}
+        """
+        health = {}
+        for client_name in client_names:
+            try:
+                if client_name == EXTERNAL_CLIENT_BIGQUERY:
+                    self.get_bigquery_client().get_table(BIGQUERY_TABLE_ID)
+                    detail = f"{BIGQUERY_TABLE_ID} readable"
+                else:
+                    if client_name == EXTERNAL_CLIENT_GOOGLE_MAPS:
+                        session, url = self.get_gmaps_client().session, GOOGLE_MAPS_API_URL
+                    elif client_name == EXTERNAL_CLIENT_OPEN_METEO:
+                        session, url = self.get_open_meteo_session(), OPEN_METEO_ARCHIVE_API_URL
+                    else:
+                        raise KeyError(f"Unknown external client {client_name}")
+                    response = session.head(url, timeout=self._health_check_timeout_seconds)
+                    if response.status_code >= 500:
+                        raise ConnectionError(f"{url} answered {response.status_code}")
+                    detail = f"{url} answered {response.status_code}"
+                health[client_name] = {"healthy": True, "detail": detail}
+            except Exception as e:
+                health[client_name] = {"healthy": False, "detail": str(e)}
+        return health
+
+    def close(self):
+        """
+        Closes every client's connections, they are built again if used afterwards
+        :return:
+        """
+        with self._lock:
+            if self._gmaps_client is not None:
+                self._gmaps_client.session.close()
+            for client in (self._open_meteo_session, self._bigquery_client):
+                if client is not None:
+                    client.close()
+            self._gmaps_client = self._open_meteo_session = self._bigquery_client = None
+
+
+_shared_external_clients: ExternalClients = None
+_shared_external_clients_lock = threading.Lock()
+
+
+def _forget_external_clients_in_forked_child():
+    # a forked process, e.g. a job worker, gets copies of the parent's sessions, sockets and locks. Sharing those
+    # connections with the parent mixes up responses, so the child builds its own clients on first use
+    global _shared_external_clients, _shared_external_clients_lock
+    _shared_external_clients = None
+    _shared_external_clients_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_external_clients_in_forked_child)
+
+
+def get_shared_external_clients() -> ExternalClients:
+    """
+    One set of clients per process, settings can be overridden by env variables
+    :return:
+    """
+    global _shared_external_clients
+    with _shared_external_clients_lock:
+        if _shared_external_clients is None:
+            _shared_external_clients = ExternalClients(
+                google_maps_api_key=os.getenv('GOOGLE_MAPS_API_KEY'),
+                max_connections=int(os.getenv('EXTERNAL_CLIENT_MAX_CONNECTIONS', EXTERNAL_CLIENT_MAX_CONNECTIONS)),
+                health_check_timeout_seconds=float(os.getenv('EXTERNAL_CLIENT_HEALTH_CHECK_TIMEOUT_SECONDS',
+                                                             EXTERNAL_CLIENT_HEALTH_CHECK_TIMEOUT_SECONDS)))
+        return _shared_external_clients
+
+
+def get_external_clients_started_with_app() -> list:
+    """
+    :return: names of the clients the app builds when it starts, from the EXTERNAL_CLIENTS_STARTED_WITH_APP env
+             variable, e.g. "open_meteo" or "" for none
+    """
+    client_names = os.getenv('EXTERNAL_CLIENTS_STARTED_WITH_APP', EXTERNAL_CLIENTS_STARTED_WITH_APP)
+    return [client_name.strip() for client_name in client_names.split(",") if client_name.strip()]
@@ -0,0 +1,176 @@
+import os
+import re
+import json
+import time
+import tempfile
+import threading
+import unicodedata
+from collections import OrderedDict
+
+from .CONSTANTS import GEOCODE_CACHE_FILE_PATH, GEOCODE_CACHE_TIME_TO_LIVE_SECONDS, GEOCODE_CACHE_MAX_ENTRIES
+
+# Common spellings that Google Maps treats as the same address, mapped to one form so they share a cache entry
+_ADDRESS_ABBREVIATIONS = {
+    "street": "st", "avenue": "ave", "road": "rd", "boulevard": "blvd", "drive": "dr", "lane": "ln",
+    "court": "ct", "place": "pl", "highway": "hwy", "suite": "ste", "apartment": "apt", "north": "n",
+    "south": "s", "east": "e", "west": "w"
+}
+
+
+def normalize_address(address: str) -> str:
+    """
+    Reduces an address to a canonical form, e.g. " 6405 S 3000 East, Suite 300 Holladay, UT" and
+    "6405 s 3000 e suite 300 holladay ut" both become "6405 s 3000 e ste 300 holladay ut"
+    :param address:
+    :return: normalized address used as the cache key
+    """
+    address = unicodedata.normalize("NFKC", address).lower()
+    address = re.sub(r"[^\w\s]", " ", address)
+    return " ".join(_ADDRESS_ABBREVIATIONS.get(word, word) for word in address.split())
+
+
+class GeocodeCache:
+    """
+    Persistent address -> (lat, lng) cache in front of the Google Maps geocode call.
+
+    Entries are kept in an LRU bounded by number of entries, expire after the time to live and are written through to
+    a JSON file so they survive restarts.
+    """
+    _cache_file_path: str = None
+    _time_to_live_seconds: float = None
+    _max_entries: int = None
+    _entries: OrderedDict = None  # normalized address -> [time stored, lat, lng]
+    _lock: threading.Lock = None
+    hits: int = 0
+    misses: int = 0
+
+    def __init__(self, cache_file_path: str = GEOCODE_CACHE_FILE_PATH,
+                 time_to_live_seconds: float = GEOCODE_CACHE_TIME_TO_LIVE_SECONDS,
+                 max_entries: int = GEOCODE_CACHE_MAX_ENTRIES):
+        self._cache_file_path = cache_file_path
+        self._time_to_live_seconds = time_to_live_seconds
+        self._max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._load()
+
+    def get(self, address: str):
+        """
+        :return: (lat, lng) or None on a miss
+        """
+        key = normalize_address(address)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.time() - entry[0] > self._time_to_live_seconds:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def put(self, address: str, latitude: float, longitude: float, persist: bool = True):
+        with self._lock:
+            self._add_entry(normalize_address(address), time.time(), latitude, longitude)
+            if persist:
+                self._save()
+
+    def warm_up_from_file(self, file_path: str, geocode_function=None) -> int:
+        """
+        Bulk loads known addresses so their first simulation is already a hit. Accepts either
+            - a .json list where each item is {"address": ..., "lat": ..., "lng": ...} or just an address string
+            - any other file with one address per line
+        Addresses without coordinates are resolved with geocode_function, skipped if it isn't given or already cached.
+        One that fails to resolve, e.g. no result or no API key, is logged and skipped so the rest are still loaded
+        :param file_path:
+        :param geocode_function: callable taking an address and returning (lat, lng)
+        :return: number of addresses added to the cache
+        """
+        with open(file_path) as known_addresses_file:
+            if file_path.endswith(".json"):
+                known_addresses = json.load(known_addresses_file)
+            else:
+                known_addresses = [line.strip() for line in known_addresses_file if line.strip()]
+
+        num_added = num_failed = 0
+        for known_address in known_addresses:
+            if isinstance(known_address, dict):
+                self.put(known_address["address"], known_address["lat"], known_address["lng"], persist=False)
+            elif geocode_function is not None and self.get(known_address) is None:
+                try:
+                    latitude, longitude = geocode_function(known_address)
+                except Exception as e:
+                    print(f"Could not geocode {known_address} to warm up the geocode cache, skipping it: {str(e)}")
+                    num_failed += 1
+                    continue
+                self.put(known_address, latitude, longitude, persist=False)
+            else:
+                continue
+            num_added += 1
+
+        with self._lock:
+            self._save()
+        print(f"Warmed up geocode cache with {num_added} addresses from {file_path}, {num_failed} failed")
+        return num_added
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+    def _add_entry(self, key, stored_at, latitude, longitude):
+        self._entries[key] = [stored_at, latitude, longitude]
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def _load(self):
+        try:
+            with open(self._cache_file_path) as cache_file:
+                stored_entries = json.load(cache_file)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        for key, (stored_at, latitude, longitude) in stored_entries.items():
+            if now - stored_at <= self._time_to_live_seconds:
+                self._add_entry(key, stored_at, latitude, longitude)
+
+    def _save(self):
+        cache_directory = os.path.dirname(self._cache_file_path) or "."
+        os.makedirs(cache_directory, exist_ok=True)
+        # write then rename so another process never reads a half written file
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=cache_directory, suffix=".tmp")
+        with os.fdopen(file_descriptor, 'w') as temporary_file:
+            json.dump(self._entries, temporary_file)
+        os.replace(temporary_path, self._cache_file_path)
+
+
+_shared_geocode_cache: GeocodeCache = None
+_shared_geocode_cache_lock = threading.Lock()
+
+
+def _forget_geocode_cache_in_forked_child():
+    # another thread may have held the cache's lock when the process was forked, the child starts its own cache
+    global _shared_geocode_cache, _shared_geocode_cache_lock
+    _shared_geocode_cache = None
+    _shared_geocode_cache_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_geocode_cache_in_forked_child)
+
+
+def get_shared_geocode_cache() -> GeocodeCache:
+    """
+    One cache per process, settings can be overridden by env variables
+    :return:
+    """
+    global _shared_geocode_cache
+    with _shared_geocode_cache_lock:
+        if _shared_geocode_cache is None:
+            _shared_geocode_cache = GeocodeCache(
+                cache_file_path=os.getenv('GEOCODE_CACHE_FILE_PATH', GEOCODE_CACHE_FILE_PATH),
+                time_to_live_seconds=float(
+                    os.getenv('GEOCODE_CACHE_TIME_TO_LIVE_SECONDS', GEOCODE_CACHE_TIME_TO_LIVE_SECONDS)),
+                max_entries=int(os.getenv('GEOCODE_CACHE_MAX_ENTRIES', GEOCODE_CACHE_MAX_ENTRIES))
+            )
+        return _shared_geocode_cache
@@ -0,0 +1,66 @@
+import numpy as np
+
+from .CONSTANTS import HOURS_IN_LEAP_YEAR
+
+# Days before the 1st of each month in a leap year, so 29-Feb always has its own slot and
+# 1-Mar lands on the same slot whether or not the year the data came from was a leap year
+_DAYS_BEFORE_MONTH_IN_LEAP_YEAR = np.array([0, 31, 60, 91, 121, 152, 182, 213, 244, 274, 305, 335])
+
+
+def hour_of_year_index(month: int, day: int, hour: int) -> int:
+    """
+    Slot of a month-day-hour in a dense 8784 slot (366 days * 24 hours) year
+    :param month: 1-12
+    :param day: 1-31
+    :param hour: 0-23
+    :return: index between 0 and 8783
+    """
+    return (int(_DAYS_BEFORE_MONTH_IN_LEAP_YEAR[month - 1]) + day - 1) * 24 + hour
+
+
+def hour_of_year_index_from_timestamp(timestamp: str) -> int:
+    """
+    Same as hour_of_year_index, but straight from an Open Meteo timestamp string, e.g. 2003-03-10T22:00
+    :param timestamp:
+    :return: index between 0 and 8783
+    """
+    return hour_of_year_index(int(timestamp[5:7]), int(timestamp[8:10]), int(timestamp[11:13]))
+
+
+def hour_of_year_indices(timestamps) -> np.ndarray:
+    """
+    Vectorized version of hour_of_year_index_from_timestamp
+    :param timestamps: iterable of Open Meteo timestamp strings or a datetime64 array
+    :return: int array with one slot index per timestamp
+    """
+    timestamps = np.asarray(timestamps, dtype='datetime64[m]')
+    months = timestamps.astype('datetime64[M]')
+    days = timestamps.astype('datetime64[D]')
+
+    month_index = months.astype(np.int64) % 12
+    day_of_month = (days - months.astype('datetime64[D]')).astype(np.int64)
+    hour_of_day = (timestamps.astype('datetime64[h]') - days.astype('datetime64[h]')).astype(np.int64)
+
+    return (_DAYS_BEFORE_MONTH_IN_LEAP_YEAR[month_index] + day_of_month) * 24 + hour_of_day
+
+
+def build_dni_climatology(timestamps, dni_values) -> np.ndarray:
+    """
+    Averages every year of DNI data in one pass into a month-day-hour table, so the simulation can look up the
+    expected DNI for an hour with a single array read instead of scanning the whole dataset.
+
+    Missing DNI values (None/NaN) are skipped like pandas' mean does, slots without any data are NaN
+    :param timestamps: Open Meteo timestamp strings or datetime64 array
+    :param dni_values: DNI values in W/m^2, same length as timestamps
+    :return: float array of HOURS_IN_LEAP_YEAR mean DNI values
+    """
+    slots = hour_of_year_indices(timestamps)
+    dni_values = np.asarray(dni_values, dtype=np.float64)
+    has_value = ~np.isnan(dni_values)
+
+    dni_totals = np.bincount(slots[has_value], weights=dni_values[has_value], minlength=HOURS_IN_LEAP_YEAR)
+    dni_counts = np.bincount(slots[has_value], minlength=HOURS_IN_LEAP_YEAR)
+
+    climatology = np.full(HOURS_IN_LEAP_YEAR, np.nan)
+    np.divide(dni_totals, dni_counts, out=climatology, where=dni_counts > 0)
+    return climatology
@@ -0,0 +1,98 @@
+from datetime import datetime
+
+import numpy as np
+
+from .ExternalClients import ExternalClients, get_shared_external_clients
+from .GeocodeCache import GeocodeCache
+from .HourOfYearClimatology import hour_of_year_indices
+from .WeatherCache import WeatherCache
+from .WeatherProviders import WeatherProvider, fetch_weather_history
+
+
+def geocode_address(address: str, gmaps_client=None):
+    """
+    :param address:
+    :param gmaps_client: googlemaps.Client, defaults to the shared ExternalClients one
+    :return: (lat, lng) of the first result Google Maps returns for the address
+    """
+    gmaps_client = gmaps_client or get_shared_external_clients().get_gmaps_client()
+    result = gmaps_client.geocode(address)[0]  # Returns multiple results, pick first by default
+    geo_data = result["geometry"]["location"]
+    return geo_data["lat"], geo_data["lng"]
+
+
+def look_up_lat_long(address: str, geocode_cache: GeocodeCache, external_clients: ExternalClients):
+    """
+    :param address:
+    :param geocode_cache: checked first, and given the coordinates on a miss
+    :param external_clients: Google Maps is only called on a geocode cache miss
+    :return: (lat, lng)
+    :raises LookupError: geocoding failed
+    """
+    cached_lat_long = geocode_cache.get(address)
+    if cached_lat_long is not None:
+        print("Fetched Coordinates from geocode cache")
+        return cached_lat_long
+
+    try:
+        latitude, longitude = geocode_address(address, external_clients.get_gmaps_client())
+        print("Fetched Coordinates from address input")
+    except:
+        raise LookupError("Geo lat_lon lookup failed")
+    geocode_cache.put(address, latitude, longitude)
+    return latitude, longitude
+
+
+def parse_date_of_simulation_start(optional_date_of_simulation: str = None) -> datetime:
+    """
+    :param optional_date_of_simulation: e.g. "10-March-2023", today if not given
+    :return: midnight at the start of that day
+    """
+    if optional_date_of_simulation:
+        return datetime.strptime(optional_date_of_simulation, "%d-%B-%Y")
+    return datetime.strptime(datetime.now().strftime("%d-%B-%Y"), "%d-%B-%Y")
+
+
+def get_weather_date_range(date_of_simulation_start: datetime, weather_lookback_years: int):
+    """
+    :return: (start date, end date) of the weather history used, as YYYY-MM-DD
+    """
+    from dateutil.relativedelta import relativedelta
+
+    today_date_formatted = (date_of_simulation_start - relativedelta(days=7)).strftime(
+        '%Y-%m-%d')  # one week back to ensure they have the data
+    lookback_start_date_formatted = (
+            date_of_simulation_start - relativedelta(years=weather_lookback_years) - relativedelta(
+        days=7)).strftime('%Y-%m-%d')
+    return lookback_start_date_formatted, today_date_formatted
+
+
+def fetch_weather(weather_provider: WeatherProvider, weather_cache: WeatherCache, latitude: float, longitude: float,
+                  date_of_simulation_start: datetime, weather_lookback_years: int):
+    """
+    Weather history for the lookback years before the simulation starts, a year at a time - years fetched recently
+    for this location come from the weather cache
+    :return: (datetime64[m] timestamps, float32 DNI values, NaN where missing)
+    """
+    print("Fetching weather data")
+    lookback_start_date, lookback_end_date = get_weather_date_range(date_of_simulation_start, weather_lookback_years)
+    timestamps, dni_values = fetch_weather_history(weather_provider, weather_cache, latitude, longitude,
+                                                   lookback_start_date, lookback_end_date)
+    print("Fetched Weather Data")
+    return np.asarray(timestamps, dtype='datetime64[m]'), np.asarray(dni_values, dtype=np.float32)
+
+
+def get_hours_to_simulate(weather_timestamps: np.ndarray, dni_climatology_by_hour_of_year: np.ndarray,
+                          num_hours_to_simulate: int):
+    """
+    Everything the kernels need to know about each hour of the run, taken from the fetched weather data
+    :return: (timestamps logged for each hour, hour of year slot for each hour, DNI value for each hour)
+    :raises IndexError: fewer hours of weather than hours to simulate
+    """
+    weather_timestamps = weather_timestamps[:num_hours_to_simulate]
+    if len(weather_timestamps) < num_hours_to_simulate:
+        raise IndexError(f"Only {len(weather_timestamps)} hours of weather data for {num_hours_to_simulate} hours")
+    hour_of_year_by_hour = hour_of_year_indices(weather_timestamps)
+    # only the hours being logged are turned into Open Meteo style strings, e.g. 2003-03-10T22:00
+    timestamps = np.datetime_as_string(weather_timestamps, unit='m').tolist()
+    return timestamps, hour_of_year_by_hour, dni_climatology_by_hour_of_year[hour_of_year_by_hour]
@@ -0,0 +1,189 @@
+import csv
+
+import numpy as np
+
+from .CONSTANTS import PARQUET_COMPRESSION
+
+
+def make_arrow_schema(bigquery_schema: list):
+    """
+    Parquet columns BigQuery loads straight into a table of bigquery_schema. TIMESTAMP columns are UTC, same as a
+    timestamp without a zone in a CSV load
+    :param bigquery_schema: [{"name", "type"}], e.g. BIGQUERY_SCHEMA
+    :return: pyarrow.Schema
+    :raises KeyError: a column type there's no Parquet type for
+    """
+    import pyarrow as pa
+
+    arrow_types = {"STRING": pa.string(), "TIMESTAMP": pa.timestamp("us", tz="UTC"), "FLOAT": pa.float64(),
+                   "INTEGER": pa.int64()}
+    return pa.schema([pa.field(column["name"], arrow_types[column["type"]]) for column in bigquery_schema])
+
+
+class MetricsBuffer:
+    """
+    Columnar store for the metrics logged every hour of a simulation. Space for every hour is allocated up front, one
+    float64 array per metric, so logging an hour is a couple of array stores instead of building and writing a CSV row.
+    The uuid is stored once and only repeated when the rows are written out at the end.
+    """
+    _simulation_uuid: str = None
+    _metric_names: tuple = None
+    _num_padding_columns: int = 0  # trailing 0 columns written after the metrics, see BIGQUERY_SCHEMA
+    _timestamps: np.ndarray = None
+    _values: np.ndarray = None  # metric x hour
+    _column_index_by_metric_name: dict = None
+    _interpolated: np.ndarray = None  # True for rows compressed output leaves out, see set_interpolated
+    num_rows: int = 0
+
+    def __init__(self, simulation_uuid, metric_names: list, num_hours: int, num_padding_columns: int = 0):
+        """
+        :param simulation_uuid: written as the first column of every row
+        :param metric_names: column names after uuid and Timestamp, in the order values are logged
+        :param num_hours: rows to allocate, appending more than this raises an IndexError
+        :param num_padding_columns: number of 0 columns added to the end of every row when written out
+        """
+        self._simulation_uuid = simulation_uuid
+        self._metric_names = tuple(metric_names)
+        self._num_padding_columns = num_padding_columns
+        self._timestamps = np.empty(num_hours, dtype=object)
+        self._values = np.zeros((len(self._metric_names), num_hours))
+        self._column_index_by_metric_name = {name: index for index, name in enumerate(self._metric_names)}
+        self._interpolated = np.zeros(num_hours, dtype=bool)
+        self.num_rows = 0
+
+    def append_row(self, timestamp, metric_values):
+        """
+        :param timestamp:
+        :param metric_values: one value per metric name, same order
+        :return:
+        """
+        row = self.num_rows
+        self._timestamps[row] = timestamp
+        self._values[:, row] = metric_values
+        self.num_rows = row + 1
+
+    def set_columns(self, timestamps, metrics: dict, first_row: int = 0):
+        """
+        Fills the buffer in one go, e.g. from SimulationKernel.run_simulation_kernel
+        :param timestamps: timestamp for each row
+        :param metrics: metric name -> column of values, one per timestamp
+        :param first_row: row the first timestamp goes in, rows after the last one set are dropped
+        :return:
+        """
+        end_row = first_row + len(timestamps)
+        self._timestamps[first_row:end_row] = timestamps
+        for metric_name, column in metrics.items():
+            self._values[self._column_index_by_metric_name[metric_name], first_row:end_row] = column
+        self.num_rows = end_row
+
+    def set_interpolated(self, interpolated_by_row, first_row: int = 0):
+        """
+        Marks rows that were worked out in closed form rather than simulated, e.g. by
+        SimulationKernel.run_simulation_with_fast_forward, so compressed output can leave them out
+        :param interpolated_by_row: bool for each row from first_row on
+        :param first_row:
+        :return:
+        """
+        self._interpolated[first_row:first_row + len(interpolated_by_row)] = interpolated_by_row
+
+    def get_column(self, metric_name: str) -> np.ndarray:
+        return self._values[self._column_index_by_metric_name[metric_name], :self.num_rows]
+
+    def get_columns(self) -> dict:
+        """
+        :return: metric name -> column of logged values
+        """
+        return {metric_name: self.get_column(metric_name) for metric_name in self._metric_names}
+
+    def get_timestamps(self) -> np.ndarray:
+        return self._timestamps[:self.num_rows]
+
+    def get_rows(self, first_row: int = 0, end_row: int = None) -> list:
+        """
+        :param first_row:
+        :param end_row: defaults to the number of rows logged
+        :return: [timestamp, metrics...] for each row in the range, as plain python values
+        """
+        end_row = self.num_rows if end_row is None else min(end_row, self.num_rows)
+        metric_rows = self._values[:, first_row:end_row].T.tolist()
+        return [[timestamp, *metric_row] for timestamp, metric_row in
+                zip(self._timestamps[first_row:end_row].tolist(), metric_rows)]
+
+    def write_csv(self, output_csv_file_writer: csv.writer, compress_interpolated_rows: bool = False):
+        """
+        Writes every logged row, same layout as the output file has always had:
+        uuid, Timestamp, metrics..., padding
+        :param output_csv_file_writer:
+        :param compress_interpolated_rows: leave out rows marked with set_interpolated. The first padding column of
+                                           each row written then holds how many rows were left out just before it,
+                                           int64_field_16 of BIGQUERY_SCHEMA
+        :return:
+        """
+        if not compress_interpolated_rows:
+            metric_rows = self._values[:, :self.num_rows].T.tolist()
+            padding = [0] * self._num_padding_columns
+            output_csv_file_writer.writerows([self._simulation_uuid, timestamp, *metric_row, *padding]
+                                             for timestamp, metric_row in zip(self.get_timestamps(), metric_rows))
+            return
+
+        rows_written, rows_left_out_before = self._get_compressed_rows()
+        padding = [0] * (self._num_padding_columns - 1)
+        output_csv_file_writer.writerows(
+            [self._simulation_uuid, timestamp, *metric_row, num_rows_left_out, *padding]
+            for timestamp, metric_row, num_rows_left_out in zip(
+                self._timestamps[rows_written], self._values[:, rows_written].T.tolist(),
+                rows_left_out_before.tolist()))
+
+    def write_parquet(self, output_file_path: str, bigquery_schema: list = None,
+                      compression: str = PARQUET_COMPRESSION, compress_interpolated_rows: bool = False):
+        """
+        Writes every logged row to a Parquet file, same layout as write_csv with a type for every column. Needs
+        pyarrow, which is optional
+        :param output_file_path:
+        :param bigquery_schema: name and type of each column in order, e.g. BIGQUERY_SCHEMA. Defaults to uuid,
+                                Timestamp, the metric names and padding_<n> INTEGER columns
+        :param compression: Parquet codec, e.g. "zstd", "snappy" or "none"
+        :param compress_interpolated_rows: see write_csv
+        :return:
+        :raises ValueError: bigquery_schema doesn't have a column for each one written
+        """
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Writing Parquet output needs pyarrow, pip install pyarrow", e)
+
+        if bigquery_schema is None:
+            bigquery_schema = [{"name": "uuid", "type": "STRING"}, {"name": "Timestamp", "type": "TIMESTAMP"}] + \
+                              [{"name": metric_name, "type": "FLOAT"} for metric_name in self._metric_names] + \
+                              [{"name": f"padding_{index}", "type": "INTEGER"}
+                               for index in range(self._num_padding_columns)]
+        if len(bigquery_schema) != 2 + len(self._metric_names) + self._num_padding_columns:
+            raise ValueError(f"Schema has {len(bigquery_schema)} columns, rows have "
+                             f"{2 + len(self._metric_names) + self._num_padding_columns}")
+
+        if compress_interpolated_rows:
+            rows_written, rows_left_out_before = self._get_compressed_rows()
+        else:
+            rows_written, rows_left_out_before = slice(0, self.num_rows), None
+        timestamps = self._timestamps[rows_written]
+        padding_columns = [np.zeros(len(timestamps), dtype=np.int64) for _ in range(self._num_padding_columns)]
+        if rows_left_out_before is not None:
+            padding_columns[0] = rows_left_out_before
+        columns = [np.full(len(timestamps), str(self._simulation_uuid), dtype=object),
+                   timestamps.astype("datetime64[us]"), *self._values[:, rows_written], *padding_columns]
+
+        schema = make_arrow_schema(bigquery_schema)
+        table = pa.Table.from_arrays([pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                                     schema=schema)
+        pq.write_table(table, output_file_path, compression=compression)
+
+    def _get_compressed_rows(self):
+        """
+        :return: (index of each row compressed output keeps, how many rows were left out just before it)
+        :raises ValueError: no padding column to hold the number of rows left out
+        """
+        if not self._num_padding_columns:
+            raise ValueError("Compressed output needs a padding column to count the rows left out")
+        rows_written = np.flatnonzero(~self._interpolated[:self.num_rows])
+        return rows_written, np.diff(rows_written, prepend=-1) - 1
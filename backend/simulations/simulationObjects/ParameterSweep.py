@@ -0,0 +1,249 @@
+import time
+from datetime import datetime
+
+import numpy as np
+
+from .CONSTANTS import SPECIFIC_HEAT_CAPACITY_OF_WATER, WEATHER_LOOKBACK_YEARS
+from .ExternalClients import get_shared_external_clients
+from .GeocodeCache import get_shared_geocode_cache
+from .WeatherCache import get_shared_weather_cache
+from .WeatherProviders import WeatherProvider, get_weather_provider
+from .HourOfYearClimatology import build_dni_climatology
+from .LocationAndWeather import look_up_lat_long, parse_date_of_simulation_start, fetch_weather, \
+    get_hours_to_simulate
+from .SimulationKernel import KERNEL_METRIC_COLUMNS
+from .SolarCollector import SolarCollector
+from .WaterPump import WaterPump
+from .WaterContainer import WaterContainer
+
+# Results are indexed [configuration, hour, metric], metrics in the same order as the output file header
+SWEEP_METRIC_COLUMNS = KERNEL_METRIC_COLUMNS
+
+
+def get_consumption_tables(water_containers: list):
+    """
+    Containers with the same consumption profiles share one schedule, see WaterContainer.get_consumption_schedule, so
+    a sweep only needs one table per distinct schedule rather than one per configuration
+    :param water_containers: one per configuration
+    :return: (table x hour of year slot x (L, ºC) array, index of the table each configuration uses)
+    """
+    table_index_by_schedule_id = {}
+    tables = []
+    table_index_by_configuration = np.empty(len(water_containers), dtype=np.intp)
+    for configuration_index, water_container in enumerate(water_containers):
+        schedule = water_container._consumption_by_hour_of_year
+        if id(schedule) not in table_index_by_schedule_id:
+            table_index_by_schedule_id[id(schedule)] = len(tables)
+            tables.append(schedule)
+        table_index_by_configuration[configuration_index] = table_index_by_schedule_id[id(schedule)]
+    return np.stack(tables), table_index_by_configuration
+
+
+def run_parameter_sweep_kernel(solar_collectors: list, water_pumps: list, water_containers: list, dni_by_hour,
+                               consumption_slot_by_hour, results: np.ndarray = None, dtype=np.float64):
+    """
+    Advances N system configurations through the same hours together. Component state is held as one array per field
+    across the configuration axis (structure of arrays), so each hour is a few dozen NumPy operations no matter how
+    many configurations there are.
+
+    Gives the same numbers as running SimulationKernel.run_simulation_kernel once per configuration.
+    :param solar_collectors: one per configuration, used for their starting state
+    :param water_pumps: one per configuration
+    :param water_containers: one per configuration, consumption patterns can differ between configurations
+    :param dni_by_hour: DNI value in W/m^2 for each hour, shared by every configuration
+    :param consumption_slot_by_hour: hour of year slot for each hour, see WaterContainer._consumption_by_hour_of_year
+    :param results: optional preallocated N x hours x metrics array to write into, e.g. a np.memmap
+    :param dtype: dtype of the results array if one isn't given
+    :return: N x hours x metrics array, row i for a configuration is the state logged before hour i runs
+    """
+    num_configurations = len(solar_collectors)
+    dni_by_hour = np.asarray(dni_by_hour, dtype=np.float64)
+    consumption_slot_by_hour = np.asarray(consumption_slot_by_hour)
+    num_hours = len(dni_by_hour)
+    heat_capacity = SPECIFIC_HEAT_CAPACITY_OF_WATER
+
+    if results is None:
+        results = np.empty((num_configurations, num_hours, len(SWEEP_METRIC_COLUMNS)), dtype=dtype)
+
+    def field(components, attribute_name):
+        return np.array([getattr(component, attribute_name) for component in components], dtype=np.float64)
+
+    # Logged state, one row per metric so each hour is logged with a single copy
+    state = np.empty((len(SWEEP_METRIC_COLUMNS), num_configurations))
+    (dni, water_temp_into_solar, water_temp_out_of_solar, energy_captured_by_solar, solar_efficiency, flow_rate,
+     percent_of_maximum_flow_rate, average_water_temp, thermal_energy, temp_sent_out, energy_sent_out, volume_sent_out,
+     energy_consumed_by_heater, energy_absorbed_from_pipes) = state
+    dni[:] = 0
+    water_temp_into_solar[:] = field(solar_collectors, "_water_temp_in")
+    water_temp_out_of_solar[:] = field(solar_collectors, "_water_temp_out")
+    energy_captured_by_solar[:] = field(solar_collectors, "_energy_captured_by_solar")
+    solar_efficiency[:] = field(solar_collectors, "_solar_efficiency")
+    flow_rate[:] = field(water_pumps, "_current_flow_rate")
+    percent_of_maximum_flow_rate[:] = field(water_pumps, "_percent_of_maximum_flow_rate")
+    average_water_temp[:] = field(water_containers, "_current_average_water_temp")
+    thermal_energy[:] = field(water_containers, "_current_thermal_energy")
+    temp_sent_out[:] = field(water_containers, "_average_temp_of_water_sent_out_of_water_container")
+    energy_sent_out[:] = field(water_containers, "_energy_sent_out_of_water_container")
+    volume_sent_out[:] = field(water_containers, "_volume_of_water_sent_out_of_water_container")
+    energy_consumed_by_heater[:] = field(water_containers, "_energy_consumed_by_heater")
+    energy_absorbed_from_pipes[:] = field(water_containers, "_energy_absorbed_from_pipes")
+
+    # Configuration, fixed for the whole run
+    surface_area = field(solar_collectors, "_surface_area")
+    min_flow_rate = field(water_pumps, "_min_flow_rate")
+    max_flow_rate = field(water_pumps, "_max_flow_rate")
+    min_temp_difference = field(water_pumps, "_minimum_temp_difference_between_water_incoming_and_outgoing_solar")
+    max_temp_difference = field(water_pumps, "_maximum_temp_difference_between_water_incoming_and_outgoing_solar")
+    flow_rate_increase_factor = field(water_pumps, "_flow_rate_increase_factor")
+    flow_rate_decrease_factor = field(water_pumps, "_flow_rate_decrease_factor")
+    water_capacity = field(water_containers, "_water_capacity")
+    percent_absorbed_from_pipes = field(water_containers, "_percent_of_thermal_energy_absorbed_from_pipes")
+    percent_lost_per_hour = field(water_containers, "_percent_of_thermal_energy_lost_to_waste_per_hour")
+    external_water_temp = field(water_containers, "_temperature_of_external_water_source")
+    boiler_efficiency = field(water_containers, "_efficiency_of_traditional_boiler")
+    minimum_average_water_temp = field(water_containers, "_minimum_average_water_temp")
+    target_energy_level = minimum_average_water_temp * heat_capacity * water_capacity
+    outgoing_water_temp = field(water_containers, "outgoing_water_temperature")
+
+    # Consumption tables, distinct schedule x hour of year slot, gathered per configuration each hour
+    consumption_tables, consumption_table_by_configuration = get_consumption_tables(water_containers)
+
+    for hour in range(num_hours):
+        results[:, hour, :] = state.T
+
+        dni[:] = dni_by_hour[hour]
+        flow_rate_for_the_hour = flow_rate.copy()
+
+        # SolarCollector.add_one_hour_solar_energy
+        starting_temperature_into_solar = outgoing_water_temp
+        energy_captured_by_solar[:] = dni * surface_area * solar_efficiency * 60 * 60
+        water_temp_into_solar[:] = starting_temperature_into_solar
+        water_temp_out_of_solar[:] = starting_temperature_into_solar + (
+                energy_captured_by_solar / (flow_rate_for_the_hour * 60)) / heat_capacity
+
+        # WaterContainer.run_hour_of_usage
+        difference_in_temp = water_temp_out_of_solar - average_water_temp
+        if (difference_in_temp < 0).any():
+            raise EnvironmentError(
+                "Water coming back to water container colder than when it left... wrong since heat loss not yet factored in on pipes")
+        energy_absorbed_from_pipes[:] = \
+            difference_in_temp * heat_capacity * flow_rate_for_the_hour * 60 * percent_absorbed_from_pipes
+        average_water_temp += energy_absorbed_from_pipes / (heat_capacity * water_capacity)
+        thermal_energy[:] = water_capacity * average_water_temp * heat_capacity
+        average_water_temp[:] = ((thermal_energy * (1 - percent_lost_per_hour)) / water_capacity) / heat_capacity
+        thermal_energy[:] = water_capacity * average_water_temp * heat_capacity
+
+        # WaterContainer.process_hot_water_leaving_water_container
+        slot = consumption_slot_by_hour[hour]
+        volume_used = consumption_tables[consumption_table_by_configuration, slot, 0]
+        temp_used = consumption_tables[consumption_table_by_configuration, slot, 1]
+        not_hot_enough = temp_used <= external_water_temp
+        energy_sent_out[:] = np.where(not_hot_enough, 0, volume_used * temp_used * heat_capacity)
+        temp_sent_out[:] = np.where(not_hot_enough, 0, temp_used)
+        volume_sent_out[:] = np.where(not_hot_enough, 0, volume_used)
+        energy_surplus = ((thermal_energy + volume_used * external_water_temp * heat_capacity)
+                          - energy_sent_out) - target_energy_level
+        heater_kicked_in = ~not_hot_enough & (energy_surplus < 0)
+        # heater value is left alone when no hot water is used, same as the object based engine
+        energy_consumed_by_heater[:] = np.where(heater_kicked_in, energy_surplus / boiler_efficiency,
+                                                np.where(not_hot_enough, energy_consumed_by_heater, 0))
+        average_water_temp[:] = np.where(heater_kicked_in, minimum_average_water_temp, average_water_temp)
+        thermal_energy[:] = np.where(heater_kicked_in, water_capacity * average_water_temp * heat_capacity,
+                                     thermal_energy)
+        outgoing_water_temp = average_water_temp.copy()
+
+        # WaterPump.adjust_flow_to_current_state
+        temp_difference = water_temp_out_of_solar - starting_temperature_into_solar
+        temp_diff_too_low = temp_difference < min_temp_difference
+        temp_diff_too_high = ~temp_diff_too_low & (temp_difference > max_temp_difference)
+        flow_rate[:] = np.where(temp_diff_too_low,
+                                np.maximum(flow_rate * flow_rate_decrease_factor, min_flow_rate),
+                                np.where(temp_diff_too_high,
+                                         np.minimum(flow_rate * flow_rate_increase_factor, max_flow_rate),
+                                         flow_rate))
+        percent_of_maximum_flow_rate[:] = flow_rate / max_flow_rate
+
+    return results
+
+
+class ParameterSweep:
+    """
+    Runs many variants of one SimulationIncomingRequest that only differ in their solar, water_pump and
+    water_container values. Geocoding and weather are fetched once for all of them, then every variant is advanced
+    together with run_parameter_sweep_kernel.
+    """
+    _configurations: list = None
+    _address: str = None
+    _date_of_simulation_start: datetime = None
+    _num_hours_to_simulate: int = None
+    _weather_provider: WeatherProvider = None
+    _weather_lookback_years: int = None
+    _weather_timestamps: np.ndarray = None  # datetime64[m], see LocationAndWeather.fetch_weather
+    _dni_climatology_by_hour_of_year: np.ndarray = None  # shared by every variant, see HourOfYearClimatology
+    results: np.ndarray = None  # configuration x hour x metric
+    timestamps: list = None  # timestamp logged for each hour
+
+    def __init__(self, configurations: list):
+        if not configurations:
+            raise KeyError("Parameter sweep needs at least one configuration")
+
+        def get_shared_fields(configuration):
+            return (configuration.address, configuration.optional_date_of_simulation,
+                    configuration.num_hours_to_simulate, getattr(configuration, "weather_provider", None),
+                    getattr(configuration, "weather_lookback_years", None))
+
+        first_configuration = configurations[0]
+        for configuration in configurations[1:]:
+            if get_shared_fields(configuration) != get_shared_fields(first_configuration):
+                raise KeyError("Parameter sweep configurations must share address, date, number of hours, weather "
+                               "provider and weather lookback")
+        self._configurations = configurations
+        self._address = first_configuration.address
+        self._date_of_simulation_start = parse_date_of_simulation_start(
+            first_configuration.optional_date_of_simulation)
+        self._num_hours_to_simulate = first_configuration.num_hours_to_simulate
+        self._weather_provider = get_weather_provider(getattr(first_configuration, "weather_provider", None))
+        self._weather_lookback_years = getattr(first_configuration, "weather_lookback_years",
+                                               None) or WEATHER_LOOKBACK_YEARS
+        if self._weather_lookback_years < 1:
+            raise KeyError(f"Weather lookback must be at least 1 year, got {self._weather_lookback_years}")
+
+    def fetch_weather_data(self):
+        latitude, longitude = look_up_lat_long(self._address, get_shared_geocode_cache(),
+                                               get_shared_external_clients())
+        self._weather_timestamps, weather_dni = fetch_weather(
+            self._weather_provider, get_shared_weather_cache(), latitude, longitude, self._date_of_simulation_start,
+            self._weather_lookback_years)
+        self._dni_climatology_by_hour_of_year = build_dni_climatology(self._weather_timestamps, weather_dni)
+
+    def run_sweep(self, output_file_path: str = None, dtype=np.float64) -> np.ndarray:
+        """
+        :param output_file_path: if given, results are streamed into a .npy file through a memory map instead of
+                                 being held in memory, open it later with np.load(output_file_path, mmap_mode='r')
+        :param dtype: e.g. np.float32 to halve the size of the results
+        :return: configuration x hour x metric array, metrics in SWEEP_METRIC_COLUMNS order
+        """
+        start_time = time.time()
+        if self._dni_climatology_by_hour_of_year is None:
+            self.fetch_weather_data()
+
+        self.timestamps, hour_of_year_by_hour, dni_by_hour = get_hours_to_simulate(
+            self._weather_timestamps, self._dni_climatology_by_hour_of_year, self._num_hours_to_simulate)
+
+        results = None
+        if output_file_path:
+            results = np.lib.format.open_memmap(output_file_path, mode='w+', dtype=dtype, shape=(
+                len(self._configurations), len(self.timestamps), len(SWEEP_METRIC_COLUMNS)))
+
+        self.results = run_parameter_sweep_kernel(
+            [SolarCollector(configuration.solar) for configuration in self._configurations],
+            [WaterPump(configuration.water_pump) for configuration in self._configurations],
+            [WaterContainer(configuration.water_container, calendar_year=self._date_of_simulation_start.year)
+             for configuration in self._configurations],
+            dni_by_hour, hour_of_year_by_hour, results=results, dtype=dtype)
+        if output_file_path:
+            self.results.flush()
+
+        print(f"Parameter sweep of {len(self._configurations)} configurations took: "
+              f"{round(time.time() - start_time, 3)} seconds")
+        return self.results
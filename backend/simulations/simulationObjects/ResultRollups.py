@@ -0,0 +1,92 @@
+import csv
+
+import numpy as np
+
+from .CONSTANTS import BIGQUERY_ROLLUP_SCHEMA, ROLLUP_PERIOD_DAY, ROLLUP_PERIOD_MONTH
+
+# Hourly metrics summed into every rollup, the FLOAT columns of BIGQUERY_ROLLUP_SCHEMA
+ROLLUP_METRIC_NAMES = tuple(column["name"] for column in BIGQUERY_ROLLUP_SCHEMA if column["type"] == "FLOAT")
+HEATER_METRIC_NAME = "energy_consumed_by_heater"
+# Above 0 only in hours hot water was asked for, the only hours the heater energy is worked out in
+TEMP_SENT_OUT_METRIC_NAME = "average_temp_of_water_sent_out_of_water_container"
+
+
+def get_flows_by_hour(metrics: dict, metrics_after_last_hour: dict, metric_names=ROLLUP_METRIC_NAMES) -> np.ndarray:
+    """
+    What flowed during each hour. Row i of the logged metrics holds the state going into hour i (see
+    run_simulation_kernel), so hour i's flows are in row i + 1, and the last hour's in the state after it.
+
+    The heater energy is left over from the last hour hot water was asked for, since
+    process_hot_water_leaving_water_container returns before setting it otherwise, so it's only counted in hours hot
+    water was asked for. It's also logged as the energy the tank was short by, i.e. negative, so it's flipped to the
+    energy the heater used
+    :param metrics: metric name -> column of hourly values, e.g. MetricsBuffer.get_columns()
+    :param metrics_after_last_hour: metric name -> value once the last hour has run
+    :param metric_names: metrics to return
+    :return: metric x hour
+    """
+    def get_flow(metric_name):
+        return np.append(np.asarray(metrics[metric_name], dtype=float)[1:], metrics_after_last_hour[metric_name])
+
+    flows_by_hour = {metric_name: get_flow(metric_name) for metric_name in metric_names}
+    if HEATER_METRIC_NAME in flows_by_hour:
+        hot_water_asked_for = get_flow(TEMP_SENT_OUT_METRIC_NAME) > 0
+        flows_by_hour[HEATER_METRIC_NAME] = np.where(hot_water_asked_for, 0.0 - flows_by_hour[HEATER_METRIC_NAME], 0.0)
+    return np.stack([flows_by_hour[metric_name] for metric_name in metric_names])
+
+
+def sum_by_period(period_by_row: np.ndarray, values: np.ndarray):
+    """
+    Sums consecutive rows of the same period, rows have to be in time order
+    :param period_by_row: datetime64 period each row falls in, e.g. its day
+    :param values: metric x row
+    :return: (start of each period, rows in each period, metric x period sums)
+    """
+    first_row_of_period = np.flatnonzero(np.r_[True, period_by_row[1:] != period_by_row[:-1]])
+    num_rows = np.diff(np.r_[first_row_of_period, len(period_by_row)])
+    return period_by_row[first_row_of_period], num_rows, np.add.reduceat(values, first_row_of_period, axis=1)
+
+
+def compute_rollups(timestamps, metrics: dict, metrics_after_last_hour: dict,
+                    metric_names=ROLLUP_METRIC_NAMES) -> dict:
+    """
+    Daily and monthly totals of what flowed during each hour (see get_flows_by_hour) in one vectorized pass: hours are
+    summed into days, then the days into months. Each hour counts towards the day it started in
+    :param timestamps: one per hourly row, in time order, strings or datetime64
+    :param metrics: metric name -> column of hourly values, e.g. MetricsBuffer.get_columns()
+    :param metrics_after_last_hour: metric name -> value once the last hour has run
+    :param metric_names: metrics to sum
+    :return: "day"/"month" -> {"period_start": datetime64[D] array, "num_hours": int array, metric name -> sums}
+    """
+    if len(timestamps) == 0:
+        empty = {"period_start": np.array([], dtype='datetime64[D]'), "num_hours": np.array([], dtype=np.int64),
+                 **{metric_name: np.array([]) for metric_name in metric_names}}
+        return {ROLLUP_PERIOD_DAY: empty, ROLLUP_PERIOD_MONTH: dict(empty)}
+
+    days = np.asarray(timestamps, dtype='datetime64[m]').astype('datetime64[D]')
+    hourly_values = get_flows_by_hour(metrics, metrics_after_last_hour, metric_names)
+    day_starts, hours_by_day, daily_sums = sum_by_period(days, hourly_values)
+    month_starts, days_by_month, monthly_sums = sum_by_period(day_starts.astype('datetime64[M]'), daily_sums)
+    hours_by_month = np.add.reduceat(hours_by_day, np.r_[0, np.cumsum(days_by_month)[:-1]])
+
+    return {
+        ROLLUP_PERIOD_DAY: {"period_start": day_starts, "num_hours": hours_by_day,
+                            **dict(zip(metric_names, daily_sums))},
+        ROLLUP_PERIOD_MONTH: {"period_start": month_starts.astype('datetime64[D]'), "num_hours": hours_by_month,
+                              **dict(zip(metric_names, monthly_sums))}}
+
+
+def write_rollups_csv(output_csv_file_writer: csv.writer, simulation_uuid, rollups: dict):
+    """
+    Writes rollups as rows of BIGQUERY_ROLLUP_SCHEMA: uuid, period, period_start, num_hours, sums...
+    :param output_csv_file_writer:
+    :param simulation_uuid:
+    :param rollups: from compute_rollups
+    :return:
+    """
+    for period, period_rollups in rollups.items():
+        period_starts = np.datetime_as_string(period_rollups["period_start"], unit='D').tolist()
+        sums = np.stack([period_rollups[metric_name] for metric_name in ROLLUP_METRIC_NAMES]).T.tolist()
+        output_csv_file_writer.writerows([str(simulation_uuid), period, period_start, num_hours, *period_sums]
+                                         for period_start, num_hours, period_sums in
+                                         zip(period_starts, period_rollups["num_hours"].tolist(), sums))
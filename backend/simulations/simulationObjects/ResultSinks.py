@@ -0,0 +1,324 @@
+import os
+import csv
+import sqlite3
+import hashlib
+import threading
+import importlib.util
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, Future
+
+from .CONSTANTS import BIGQUERY_TABLE_ID, BIGQUERY_SCHEMA, BIGQUERY_ROLLUP_TABLE_ID, BIGQUERY_ROLLUP_SCHEMA, \
+    RESULT_SINK_BIGQUERY, RESULT_SINK_SQLITE, \
+    RESULT_SINK_NULL, RESULT_SINK_SQLITE_DATABASE_PATH, RESULT_UPLOAD_MAX_WORKERS, RESULT_FORMAT_PARQUET, \
+    RESULT_FORMAT_CSV
+from .ExternalClients import get_shared_external_clients
+
+
+class ResultSink(ABC):
+    """
+    Somewhere finished simulation results are stored for analysis. Results come in as the simulation output file,
+    rows laid out as BIGQUERY_SCHEMA: CSV, or Parquet (a .parquet file) for sinks whose result_formats include it.
+    Daily and monthly rollups come in as a CSV of BIGQUERY_ROLLUP_SCHEMA rows, see ResultRollups.
+    Writing results or rollups for a uuid replaces any rows already stored for it.
+    Sinks have to implement both writes, a sink missing one fails when it's built rather than on the upload thread.
+    """
+    result_formats: tuple = (RESULT_FORMAT_CSV,)
+
+    @abstractmethod
+    def write_results(self, simulation_uuid: str, output_file_path: str):
+        pass
+
+    @abstractmethod
+    def write_rollups(self, simulation_uuid: str, rollups_file_path: str):
+        pass
+
+
+class BigQueryResultSink(ResultSink):
+    """
+    Loads results into BIGQUERY_TABLE_ID, what the Looker Studio dashboard reads from, and rollups into
+    BIGQUERY_ROLLUP_TABLE_ID.
+
+    Each write is two jobs whatever was stored for the uuid before: a load of the output file into a staging table
+    for the uuid, then one MERGE that swaps the uuid's rows for the staged ones. The MERGE is atomic, so readers see
+    either the old rows or the new ones, and the uuid only goes in as a query parameter.
+
+    Parquet output loads as is, its columns are typed from BIGQUERY_SCHEMA when it's written.
+    """
+    result_formats: tuple = (RESULT_FORMAT_PARQUET, RESULT_FORMAT_CSV)
+    _bigquery_client = None
+    _table_id: str = None
+    _rollup_table_id: str = None
+
+    def __init__(self, bigquery_client=None, table_id: str = BIGQUERY_TABLE_ID,
+                 rollup_table_id: str = BIGQUERY_ROLLUP_TABLE_ID):
+        """
+        :param bigquery_client: the shared ExternalClients one if not given, looked up on first write
+        :param table_id:
+        :param rollup_table_id:
+        """
+        self._bigquery_client = bigquery_client
+        self._table_id = table_id
+        self._rollup_table_id = rollup_table_id
+
+    def get_bigquery_client(self):
+        if self._bigquery_client is None:
+            self._bigquery_client = get_shared_external_clients().get_bigquery_client()
+        return self._bigquery_client
+
+    def get_staging_table_id(self, simulation_uuid: str, table_id: str = None) -> str:
+        """
+        One staging table per uuid, so simulations uploading at the same time don't overwrite each other's rows
+        :param simulation_uuid:
+        :param table_id: table being staged for, the results table if not given
+        :return:
+        """
+        table_id = table_id or self._table_id
+        return f"{table_id}_staging_{hashlib.sha256(str(simulation_uuid).encode()).hexdigest()[:16]}"
+
+    def make_merge_statement(self, staging_table_id: str, table_id: str = None) -> str:
+        """
+        Deletes the target rows of the @simulation_uuid query parameter and inserts every staged row, in one statement
+        :param staging_table_id:
+        :param table_id: target table, the results table if not given
+        :return:
+        """
+        return f"""
+                    MERGE `{table_id or self._table_id}` t
+                    USING `{staging_table_id}` s
+                    ON FALSE
+                    WHEN NOT MATCHED BY SOURCE AND t.uuid = @simulation_uuid THEN DELETE
+                    WHEN NOT MATCHED THEN INSERT ROW
+                    """
+
+    def write_results(self, simulation_uuid: str, output_file_path: str):
+        self.replace_rows(self._table_id, BIGQUERY_SCHEMA, simulation_uuid, output_file_path)
+
+    def write_rollups(self, simulation_uuid: str, rollups_file_path: str):
+        self.replace_rows(self._rollup_table_id, BIGQUERY_ROLLUP_SCHEMA, simulation_uuid, rollups_file_path)
+
+    def replace_rows(self, table_id: str, schema: list, simulation_uuid: str, output_file_path: str):
+        """
+        Swaps the uuid's rows in table_id for the rows of output_file_path, see the class docstring
+        :param table_id:
+        :param schema: of the table, for CSV loads
+        :param simulation_uuid:
+        :param output_file_path: CSV, or Parquet if it ends in .parquet
+        :return:
+        """
+        from google.cloud import bigquery
+
+        bigquery_client = self.get_bigquery_client()
+        staging_table_id = self.get_staging_table_id(simulation_uuid, table_id)
+
+        if get_file_result_format(output_file_path) == RESULT_FORMAT_PARQUET:
+            load_job_config = bigquery.LoadJobConfig(source_format=bigquery.SourceFormat.PARQUET,
+                                                     write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE)
+        else:
+            load_job_config = bigquery.LoadJobConfig(schema=schema,
+                                                     write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE)
+        with open(output_file_path, "rb") as source_file:
+            load_job = bigquery_client.load_table_from_file(source_file, staging_table_id, job_config=load_job_config)
+        load_job.result()
+
+        try:
+            merge_job = bigquery_client.query(
+                query=self.make_merge_statement(staging_table_id, table_id),
+                job_config=bigquery.QueryJobConfig(query_parameters=[
+                    bigquery.ScalarQueryParameter("simulation_uuid", "STRING", str(simulation_uuid))]))
+            merge_job.result()  # Waits for job to complete.
+        finally:
+            bigquery_client.delete_table(staging_table_id, not_found_ok=True)
+
+        print(f"Replaced rows of simulation {simulation_uuid} in {table_id} with {load_job.output_rows} rows,"
+              f" {merge_job.num_dml_affected_rows} rows changed")
+
+
+class SQLiteResultSink(ResultSink):
+    """
+    Local stand in for BigQuery - same columns in a single SQLite file, indexed on uuid and Timestamp, plus a table
+    of rollups indexed on uuid and period. Lets the whole pipeline run offline, e.g. for development and benchmarks
+    """
+    _database_path: str = None
+    _table_name: str = "simulation_results"
+    _rollup_table_name: str = "simulation_rollups"
+
+    _SQLITE_TYPES = {"STRING": "TEXT", "TIMESTAMP": "TEXT", "DATE": "TEXT", "FLOAT": "REAL", "INTEGER": "INTEGER"}
+
+    def __init__(self, database_path: str = RESULT_SINK_SQLITE_DATABASE_PATH):
+        self._database_path = database_path
+        os.makedirs(os.path.dirname(database_path) or ".", exist_ok=True)
+        connection = self._connect()
+        with connection:
+            for table_name, schema, index_columns in ((self._table_name, BIGQUERY_SCHEMA, "uuid, Timestamp"),
+                                                      (self._rollup_table_name, BIGQUERY_ROLLUP_SCHEMA,
+                                                       "uuid, period, period_start")):
+                column_definitions = ", ".join(f'"{column["name"]}" {self._SQLITE_TYPES[column["type"]]}'
+                                               for column in schema)
+                connection.execute(f"CREATE TABLE IF NOT EXISTS {table_name} ({column_definitions})")
+                index_name = f"{table_name}_{index_columns.replace(', ', '_').lower()}"
+                connection.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} ({index_columns})")
+        connection.close()
+
+    def write_results(self, simulation_uuid: str, output_file_path: str):
+        self.replace_rows(self._table_name, BIGQUERY_SCHEMA, simulation_uuid, output_file_path)
+
+    def write_rollups(self, simulation_uuid: str, rollups_file_path: str):
+        self.replace_rows(self._rollup_table_name, BIGQUERY_ROLLUP_SCHEMA, simulation_uuid, rollups_file_path)
+
+    def replace_rows(self, table_name: str, schema: list, simulation_uuid: str, output_file_path: str):
+        """
+        :param table_name:
+        :param schema: of the table
+        :param simulation_uuid:
+        :param output_file_path: CSV of rows laid out as schema
+        :return:
+        """
+        placeholders = ", ".join("?" * len(schema))
+        connection = self._connect()
+        with connection, open(output_file_path, newline='') as output_file:
+            # one transaction so readers never see a half replaced simulation
+            deleted_rows = connection.execute(f"DELETE FROM {table_name} WHERE uuid = ?",
+                                              (str(simulation_uuid),)).rowcount
+            added_rows = connection.executemany(f"INSERT INTO {table_name} VALUES ({placeholders})",
+                                                csv.reader(output_file)).rowcount
+        connection.close()
+        print(f"Replaced {deleted_rows} rows with {added_rows} rows for simulation {simulation_uuid} in "
+              f"{self._database_path} {table_name}")
+
+    def query(self, sql_statement: str, parameters: tuple = ()) -> list:
+        connection = self._connect()
+        try:
+            return connection.execute(sql_statement, parameters).fetchall()
+        finally:
+            connection.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self._database_path, timeout=30)
+
+
+class NullResultSink(ResultSink):
+    """
+    Throws results away, for benchmarks that shouldn't measure storage. Takes CSV only, Parquet would pull in pyarrow
+    (and pandas with it) for output nobody reads
+    """
+
+    def write_results(self, simulation_uuid: str, output_file_path: str):
+        pass
+
+    def write_rollups(self, simulation_uuid: str, rollups_file_path: str):
+        pass
+
+
+_shared_result_sinks: dict = {}
+_shared_result_sinks_lock = threading.Lock()
+_result_upload_executor: ThreadPoolExecutor = None
+
+
+def _forget_result_sinks_in_forked_child():
+    # a forked process gets the executor but none of its threads, so uploads would queue forever, and the sinks'
+    # connections belong to the parent
+    global _shared_result_sinks, _shared_result_sinks_lock, _result_upload_executor
+    _shared_result_sinks = {}
+    _shared_result_sinks_lock = threading.Lock()
+    _result_upload_executor = None
+
+
+os.register_at_fork(after_in_child=_forget_result_sinks_in_forked_child)
+
+
+def get_result_sink(result_sink_name: str = None) -> ResultSink:
+    """
+    One sink of each kind per process so clients and connections setup is shared between simulations
+    :param result_sink_name: "bigquery", "sqlite" or "null", defaults to the SIMULATION_RESULT_SINK env variable and
+                             then BigQuery
+    :return:
+    :raises KeyError: unknown sink name
+    """
+    result_sink_name = result_sink_name or os.getenv('SIMULATION_RESULT_SINK', RESULT_SINK_BIGQUERY)
+    with _shared_result_sinks_lock:
+        if result_sink_name not in _shared_result_sinks:
+            if result_sink_name == RESULT_SINK_BIGQUERY:
+                _shared_result_sinks[result_sink_name] = BigQueryResultSink()
+            elif result_sink_name == RESULT_SINK_SQLITE:
+                _shared_result_sinks[result_sink_name] = SQLiteResultSink(
+                    os.getenv('RESULT_SINK_SQLITE_DATABASE_PATH', RESULT_SINK_SQLITE_DATABASE_PATH))
+            elif result_sink_name == RESULT_SINK_NULL:
+                _shared_result_sinks[result_sink_name] = NullResultSink()
+            else:
+                raise KeyError(f"Unknown result sink {result_sink_name}")
+        return _shared_result_sinks[result_sink_name]
+
+
+def is_pyarrow_installed() -> bool:
+    """
+    Checked without importing pyarrow, which is slow to import and only needed once results are written
+    :return:
+    """
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def get_result_format(result_sink: ResultSink, result_format_name: str = None) -> str:
+    """
+    Format the simulation output is handed to result_sink in
+    :param result_sink:
+    :param result_format_name: "parquet" or "csv", defaults to the SIMULATION_RESULT_FORMAT env variable and then
+                               Parquet if pyarrow is installed, CSV if not
+    :return: the format, CSV whatever was asked for if the sink only takes CSV
+    :raises KeyError: unknown format name
+    :raises ImportError: Parquet asked for without pyarrow installed
+    """
+    result_format_name = result_format_name or os.getenv('SIMULATION_RESULT_FORMAT')
+    if result_format_name is None:
+        result_format_name = RESULT_FORMAT_PARQUET if is_pyarrow_installed() else RESULT_FORMAT_CSV
+    elif result_format_name not in (RESULT_FORMAT_PARQUET, RESULT_FORMAT_CSV):
+        raise KeyError(f"Unknown result format {result_format_name}")
+    elif result_format_name == RESULT_FORMAT_PARQUET and not is_pyarrow_installed():
+        raise ImportError("Parquet results need pyarrow, pip install pyarrow")
+    return result_format_name if result_format_name in result_sink.result_formats else RESULT_FORMAT_CSV
+
+
+def get_file_result_format(output_file_path: str) -> str:
+    """
+    :param output_file_path:
+    :return: Parquet for .parquet files, otherwise CSV
+    """
+    return RESULT_FORMAT_PARQUET if output_file_path.endswith(".parquet") else RESULT_FORMAT_CSV
+
+
+def submit_result_upload(result_sink: ResultSink, simulation_uuid: str, output_file_path: str,
+                         remove_file_when_done: bool = False, on_uploaded=None, rollups_file_path: str = None) -> Future:
+    """
+    Writes results on a background thread so callers don't wait on the load job
+    :param result_sink:
+    :param simulation_uuid:
+    :param output_file_path: must not change until the upload is done, None to only write rollups
+    :param remove_file_when_done: delete the files once uploaded, e.g. for a private copy of the output
+    :param on_uploaded: called once the sink has the results, before the future is done
+    :param rollups_file_path: rollups to write after the results, see ResultRollups
+    :return: future for the upload, .result() raises whatever the sink raised
+    """
+    global _result_upload_executor
+    with _shared_result_sinks_lock:
+        if _result_upload_executor is None:
+            _result_upload_executor = ThreadPoolExecutor(
+                max_workers=int(os.getenv('RESULT_UPLOAD_MAX_WORKERS', RESULT_UPLOAD_MAX_WORKERS)),
+                thread_name_prefix="result-upload")
+
+    def upload():
+        try:
+            if output_file_path is not None:
+                result_sink.write_results(simulation_uuid, output_file_path)
+            if rollups_file_path is not None:
+                result_sink.write_rollups(simulation_uuid, rollups_file_path)
+            if on_uploaded is not None:
+                on_uploaded()
+        except Exception as e:
+            print(f"Uploading results for simulation {simulation_uuid} failed with exception {str(e)}")
+            raise
+        finally:
+            if remove_file_when_done:
+                for file_path in (output_file_path, rollups_file_path):
+                    if file_path is not None:
+                        os.remove(file_path)
+
+    return _result_upload_executor.submit(upload)
@@ -1,27 +1,40 @@
-import _io
 import csv
 import uuid
+from concurrent.futures import Future
 
-import googlemaps
 import os
 import json
-import requests
 from dotenv import load_dotenv
 from datetime import datetime
-from dateutil.relativedelta import relativedelta
-import pandas as pd
-from google.cloud import bigquery
+import numpy as np
 
 from .SolarCollector import SolarCollector
 from .WaterPump import WaterPump
 from .WaterContainer import WaterContainer
-from .CONSTANTS import BIGQUERY_TABLE_ID, OUTPUT_METRICS_FILE_PATH, BIGQUERY_SCHEMA
+from .CONSTANTS import SIMULATION_ENGINE_OBJECT, SIMULATION_ENGINE_KERNEL, \
+    SIMULATION_ENGINE_FAST_FORWARD, WEATHER_LOOKBACK_YEARS, SIMULATION_CHECKPOINT_INTERVAL_HOURS, \
+    SIMULATION_OUTPUT_BUFFER_MAX_MEMORY_BYTES, RESULT_FORMAT_PARQUET, BIGQUERY_SCHEMA, UPLOAD_MODE_HOURLY, \
+    UPLOAD_MODE_AGGREGATES, UPLOAD_MODE_BOTH
+from .WeatherCache import WeatherCache, get_shared_weather_cache
+from .WeatherProviders import WeatherProvider, get_weather_provider
+from .GeocodeCache import GeocodeCache, get_shared_geocode_cache
+from .HourOfYearClimatology import build_dni_climatology
+from .LocationAndWeather import look_up_lat_long, parse_date_of_simulation_start, get_weather_date_range, \
+    fetch_weather, get_hours_to_simulate
+from .SimulationKernel import run_simulation_kernel, run_simulation_with_fast_forward
+from .MetricsBuffer import MetricsBuffer
+from .SimulationOutputBuffer import SimulationOutputBuffer
+from .ResultRollups import compute_rollups, write_rollups_csv
+from .ExternalClients import ExternalClients, get_shared_external_clients
+from .ResultSinks import ResultSink, get_result_sink, get_result_format, submit_result_upload
+from .SimulationResultCache import SimulationResultCache, get_shared_simulation_result_cache, make_request_hash
+from .SimulationCheckpoints import SimulationCheckpointStore, get_shared_simulation_checkpoint_store
 import time
 from .ConfigurationInputs import SimulationIncomingRequest
 
 
 class SimulatedWorld:
-    gmaps: googlemaps.Client = None
+    _external_clients: ExternalClients = None
     _num_solar_panels: int = None
     _width_solar_panels: int = None
     _height_solar_panels: int = None
@@ -29,45 +42,80 @@ class SimulatedWorld:
     _latitude: float = None
     _longitude: float = None
     _address_of_system: str = None
-    _meteo_weather_data: dict = None
-    _pandas_data: pd.DataFrame = None
+    _geocode_cache: GeocodeCache = None
+    _weather_timestamps: np.ndarray = None  # datetime64[m], i.e. int64 minutes since epoch, one per fetched hour
+    _weather_dni: np.ndarray = None  # float32 DNI in W/m^2 for each of _weather_timestamps, NaN where missing
+    _weather_cache: WeatherCache = None
+    _weather_provider: WeatherProvider = None
+    _weather_lookback_years: int = WEATHER_LOOKBACK_YEARS  # years of history averaged into the DNI climatology
+    _dni_climatology_by_hour_of_year: np.ndarray = None  # mean DNI for every month-day-hour, see HourOfYearClimatology
     _date_of_simulation_start: datetime = None
     _current_time_in_simulation: str = None
+    _current_hour_of_year: int = None  # slot of the current hour, see HourOfYearClimatology
     _num_hours_to_simulate: int = 24 * 14  # 1 year default 24hrs * 14 days
+    _simulation_engine: str = SIMULATION_ENGINE_OBJECT
+    _compress_idle_hours: bool = False  # leave fast forwarded rows out of the output, see MetricsBuffer.write_csv
+    _progress_callback = None  # called with (hours done, hours to simulate), see set_progress_callback
     _solar_collector: SolarCollector = None
     _water_container: WaterContainer = None
     _water_pump: WaterPump = None
     _loggable_parts_of_system: list = None  # list of all the objects, will be solar, water pump and water container once created
-    _output_csv_file: _io.FileIO = None
+    _output_buffer: SimulationOutputBuffer = None  # output CSV of this simulation only
     _output_csv_file_writer: csv.writer = None
     _written_output_header: bool = False
-    _header_for_output_file: dict = None
+    _header_for_output_file: dict = None  # column name -> index, and component id -> metric name -> index
     _header_as_list_for_output_file: list = None
     _num_metrics_logged: int = None
+    _metrics_buffer: MetricsBuffer = None  # every logged hour, written to the output file once the simulation ends
     _simulation_uuid: uuid = None
-    _bigquery_client: bigquery = None
-
-    def __init__(self, configuration: SimulationIncomingRequest):
+    _result_sink: ResultSink = None
+    _result_format: str = None  # what the output is written as, "parquet" or "csv", see get_result_format
+    _upload_mode: str = UPLOAD_MODE_HOURLY  # hourly rows, daily and monthly rollups or both
+    _rollups: dict = None  # daily and monthly totals, see aggregate_results
+    _metrics_after_last_hour: dict = None  # metric name -> value once the last hour has run, see get_current_metrics
+    _results_upload: Future = None  # background upload started by upload_results
+    _simulation_result_cache: SimulationResultCache = None
+    _request_hash: str = None  # same for every request that would simulate the same thing, see make_request_hash
+    _bypass_result_cache: bool = False
+    _served_from_result_cache: bool = False
+    _checkpoint_store: SimulationCheckpointStore = None
+    _checkpoint_key: str = None
+    _checkpoint_interval_hours: int = SIMULATION_CHECKPOINT_INTERVAL_HOURS  # 0 for no checkpoints
+    _num_hours_simulated: int = 0
+    _num_hours_checkpointed: int = 0  # rows already in the checkpoint, later ones are saved with the next one
+    _resumed_from_checkpoint: bool = False
+
+    def __init__(self, configuration: SimulationIncomingRequest, external_clients: ExternalClients = None):
         """
         This initializes the world with params given and does some basic checks
         :param configuration:
+        :param external_clients: clients for Google Maps etc., defaults to the ones shared by the process
         :return:
         """
+        self._external_clients = external_clients or get_shared_external_clients()
         try:
             # Geo Data
             self._address_of_system = configuration.address
-            self.gmaps = googlemaps.Client(key=os.getenv('GOOGLE_MAPS_API_KEY'))
-            self._meteo_weather_data = {"DNI_data": None, "timestamps": None}
-
-            # BigQuery Connection
-            self._bigquery_client = bigquery.Client()
+            self._geocode_cache = get_shared_geocode_cache()
+            self._weather_cache = get_shared_weather_cache()
+            self._weather_provider = get_weather_provider(getattr(configuration, "weather_provider", None))
+            weather_lookback_years = getattr(configuration, "weather_lookback_years", None)
+            if weather_lookback_years is not None:
+                if weather_lookback_years < 1:
+                    raise KeyError(f"Weather lookback must be at least 1 year, got {weather_lookback_years}")
+                self._weather_lookback_years = weather_lookback_years
+
+            # Where results go once the simulation is done, BigQuery unless the request or env says otherwise
+            self._result_sink = get_result_sink(getattr(configuration, "result_sink", None))
+            self._result_format = get_result_format(self._result_sink, getattr(configuration, "result_format", None))
+            upload_mode = getattr(configuration, "upload_mode", None) or os.getenv('SIMULATION_UPLOAD_MODE',
+                                                                                   UPLOAD_MODE_HOURLY)
+            if upload_mode not in (UPLOAD_MODE_HOURLY, UPLOAD_MODE_AGGREGATES, UPLOAD_MODE_BOTH):
+                raise KeyError(f"Unknown upload mode {upload_mode}")
+            self._upload_mode = upload_mode
 
             # Decide Start Date
-            if configuration.optional_date_of_simulation:
-                self._date_of_simulation_start = datetime.strptime(configuration.optional_date_of_simulation,
-                                                                   "%d-%B-%Y")
-            else:
-                self._date_of_simulation_start = datetime.strptime(datetime.now().strftime("%d-%B-%Y"), "%d-%B-%Y")
+            self._date_of_simulation_start = parse_date_of_simulation_start(configuration.optional_date_of_simulation)
 
             # Decide uuid
             if configuration.simulation_uuid:
@@ -79,9 +127,41 @@ class SimulatedWorld:
             if configuration.num_hours_to_simulate:
                 self._num_hours_to_simulate = configuration.num_hours_to_simulate
 
-            # Setup logging metrics locally
-            self._output_csv_file = open(OUTPUT_METRICS_FILE_PATH, 'w')
-            self._output_csv_file_writer = csv.writer(self._output_csv_file)
+            # Decide engine, optional so older requests keep using the object based one
+            simulation_engine = getattr(configuration, "simulation_engine", None)
+            if simulation_engine:
+                if simulation_engine not in (SIMULATION_ENGINE_OBJECT, SIMULATION_ENGINE_KERNEL,
+                                             SIMULATION_ENGINE_FAST_FORWARD):
+                    raise KeyError(f"Unknown simulation engine {simulation_engine}")
+                self._simulation_engine = simulation_engine
+            self._compress_idle_hours = bool(getattr(configuration, "compress_idle_hours", False))
+
+            # Identical requests are answered from the result cache unless asked not to
+            self._simulation_result_cache = get_shared_simulation_result_cache()
+            self._bypass_result_cache = bool(getattr(configuration, "bypass_result_cache", False))
+            self._request_hash = make_request_hash(configuration, {
+                "optional_date_of_simulation": self._date_of_simulation_start.strftime("%Y-%m-%d"),
+                "num_hours_to_simulate": self._num_hours_to_simulate,
+                "weather_lookback_years": self._weather_lookback_years})
+
+            # Checkpoints, so a failed run resubmitted with the same uuid carries on from where it got to
+            self._checkpoint_store = get_shared_simulation_checkpoint_store()
+            self._checkpoint_key = self._checkpoint_store.make_key(self._simulation_uuid, self._request_hash)
+            checkpoint_interval_hours = getattr(configuration, "checkpoint_interval_hours", None)
+            if checkpoint_interval_hours is not None:
+                if checkpoint_interval_hours < 0:
+                    raise KeyError(f"Checkpoint interval can't be negative, got {checkpoint_interval_hours}")
+                self._checkpoint_interval_hours = checkpoint_interval_hours
+            if self._compress_idle_hours:
+                self._checkpoint_interval_hours = 0  # checkpoints don't keep which rows were left out
+            if not configuration.simulation_uuid:
+                self._checkpoint_interval_hours = 0  # a random uuid is never resubmitted, so nothing would resume
+
+            # Setup logging metrics locally, in a buffer of this simulation's own
+            self._output_buffer = SimulationOutputBuffer(
+                self._simulation_uuid, max_memory_bytes=int(os.getenv('SIMULATION_OUTPUT_BUFFER_MAX_MEMORY_BYTES',
+                                                                      SIMULATION_OUTPUT_BUFFER_MAX_MEMORY_BYTES)))
+            self._output_csv_file_writer = csv.writer(self._output_buffer)
 
             # Solar Setup
             self._solar_collector = SolarCollector(configuration.solar)
@@ -90,7 +170,8 @@ class SimulatedWorld:
             self._water_pump = WaterPump(configuration.water_pump)
 
             # Water Container Setup
-            self._water_container = WaterContainer(configuration.water_container)
+            self._water_container = WaterContainer(configuration.water_container,
+                                                   calendar_year=self._date_of_simulation_start.year)
 
             # Logging Setup
             self._loggable_parts_of_system = []
@@ -109,44 +190,208 @@ class SimulatedWorld:
             raise KeyError("Incorrect config passed in to SimulatedWorld", e)
 
     def run_entire_simulation(self):
-        # Prep - fetching external data
-        self.generate_lat_long()
-        self.get_weather_data()
+        # compressed output depends on which rows were fast forwarded, which the result cache doesn't keep
+        use_result_cache = not self._compress_idle_hours
+        if use_result_cache and not self._bypass_result_cache and self.load_results_from_result_cache():
+            print(f"Simulation results found in result cache for request {self._request_hash}")
+        else:
+            if not self.load_checkpoint():
+                # Prep - fetching external data
+                self.generate_lat_long()
+                self.get_weather_data()
+
+            # Computation
+            if self._simulation_engine in (SIMULATION_ENGINE_KERNEL, SIMULATION_ENGINE_FAST_FORWARD):
+                self.start_simulation_with_kernel()
+            else:
+                self.start_simulation()
+            if self._checkpoint_interval_hours:
+                self.save_checkpoint()  # a failed upload can be retried without simulating again
+            self._metrics_after_last_hour = self.get_current_metrics()
+            if use_result_cache:
+                self._simulation_result_cache.put(self._request_hash, self._metrics_buffer.get_timestamps(),
+                                                  self._metrics_buffer.get_columns(), self._metrics_after_last_hour)
+
+        # Aggregation, only when the rollups are uploaded
+        if self._upload_mode != UPLOAD_MODE_HOURLY:
+            self.aggregate_results()
+
+        # Output results for analysis, in the background so the caller isn't held up by the load job. Always
+        # uploaded, even when served from the result cache, since another request may have replaced this uuid's rows
+        # since then. Deleted before the upload's future is done, so whoever waits on it sees the checkpoint gone
+        self.upload_results(on_uploaded=lambda: self._checkpoint_store.delete(self._checkpoint_key))
+
+    def load_results_from_result_cache(self) -> bool:
+        """
+        Fills the output with the hourly metrics of an identical request simulated before, if there was one
+        :return: whether the results were found
+        """
+        cached_results = self._simulation_result_cache.get(self._request_hash)
+        if cached_results is None:
+            return False
+        timestamps, metrics, self._metrics_after_last_hour = cached_results
+        self.calculate_output_file_header()
+        self.write_out_kernel_results(timestamps, metrics)
+        if self._progress_callback:
+            self._progress_callback(self._num_hours_to_simulate, self._num_hours_to_simulate)
+        self._served_from_result_cache = True
+        return True
 
-        # Computation
-        self.start_simulation()
+    def get_state(self) -> dict:
+        """
+        Where the simulation has got to, JSON serializable. Together with the rows logged so far and the weather
+        this is all a world built from the same request needs to carry on, see set_state
+        :return:
+        """
+        return {"hours_simulated": self._num_hours_simulated,
+                "current_direct_normal_irradiance": self._current_direct_normal_irradiance,
+                "current_time_in_simulation": self._current_time_in_simulation,
+                "latitude": self._latitude,
+                "longitude": self._longitude,
+                "solar_collector": self._solar_collector.get_state(),
+                "water_pump": self._water_pump.get_state(),
+                "water_container": self._water_container.get_state()}
+
+    def set_state(self, state: dict):
+        """
+        :param state: saved with get_state
+        :return:
+        """
+        self._num_hours_simulated = state["hours_simulated"]
+        self._current_direct_normal_irradiance = state["current_direct_normal_irradiance"]
+        self._current_time_in_simulation = state["current_time_in_simulation"]
+        self._latitude = state["latitude"]
+        self._longitude = state["longitude"]
+        self._solar_collector.set_state(state["solar_collector"])
+        self._water_pump.set_state(state["water_pump"])
+        self._water_container.set_state(state["water_container"])
+
+    def save_checkpoint(self):
+        """
+        Saves the current state and the rows logged since the last checkpoint, the weather goes in with the first one
+        :return:
+        """
+        if self._num_hours_checkpointed == 0:
+            self._checkpoint_store.save_weather(self._checkpoint_key,
+                                                self._weather_timestamps[:self._num_hours_to_simulate],
+                                                self._dni_climatology_by_hour_of_year)
+        first_row = self._num_hours_checkpointed
+        self._checkpoint_store.save(self._checkpoint_key, self.get_state(), first_row,
+                                    self._metrics_buffer.get_timestamps()[first_row:],
+                                    {metric_name: column[first_row:] for metric_name, column in
+                                     self._metrics_buffer.get_columns().items()})
+        self._num_hours_checkpointed = self._num_hours_simulated
+
+    def load_checkpoint(self) -> bool:
+        """
+        Picks up from the last checkpoint of this request and uuid if there is one, instead of geocoding and
+        fetching weather again. Skipped when bypassing the result cache, since that asks for a fresh run
+        :return: whether a checkpoint was found
+        """
+        if not self._checkpoint_interval_hours or self._bypass_result_cache:
+            return False
+        checkpoint = self._checkpoint_store.load(self._checkpoint_key)
+        if checkpoint is None:
+            return False
+        self._weather_timestamps = checkpoint["weather"]["timestamps"]
+        self._dni_climatology_by_hour_of_year = checkpoint["weather"]["dni_climatology"]
+        self.set_state(checkpoint["state"])
+        self.calculate_output_file_header()
+        self._metrics_buffer.set_columns(checkpoint["timestamps"], checkpoint["metrics"])
+        self._num_hours_checkpointed = self._num_hours_simulated
+        self._resumed_from_checkpoint = True
+        print(f"Resuming simulation {self._simulation_uuid} from checkpoint at hour {self._num_hours_simulated}")
+        return True
 
-        # Output results for analysis
-        self.upload_results_to_bigquery()
+    def set_progress_callback(self, progress_callback):
+        """
+        :param progress_callback: callable taking (hours done, hours to simulate), called as the simulation runs
+        :return:
+        """
+        self._progress_callback = progress_callback
 
     def start_simulation(self):
 
         start_time = time.time()
 
         self.calculate_output_file_header()
+        timestamps, hour_of_year_by_hour, _ = self.get_hours_to_simulate()
 
-        for i in range(self._num_hours_to_simulate):
+        for i in range(self._num_hours_simulated, self._num_hours_to_simulate):
             current_time = time.time()
             print(
                 f"Simulation running for: {round(current_time - start_time, 3)} seconds on iteration {i}/{self._num_hours_to_simulate},"
                 f" avg speed per iteration: {round((current_time - start_time) / (i + 1), 7)}")
 
-            self._current_time_in_simulation = self._meteo_weather_data["timestamps"][i]
+            self._current_time_in_simulation = timestamps[i]
+            self._current_hour_of_year = int(hour_of_year_by_hour[i])
             self.write_out_simulation_results()
             self.run_one_hourly_iteration_of_simulation()
+            self._num_hours_simulated = i + 1
+            if self._checkpoint_interval_hours and self._num_hours_simulated % self._checkpoint_interval_hours == 0:
+                self.save_checkpoint()
+            if self._progress_callback:
+                self._progress_callback(i + 1, self._num_hours_to_simulate)
+
+        self.write_out_metrics_buffer()
 
         completion_time = time.time()
         minutes_elapsed = round((completion_time - start_time) / 60, 2)
         print(f"Simulation took: {minutes_elapsed} mins")
 
+    def start_simulation_with_kernel(self):
+        """
+        Same results as start_simulation, but runs every hour in one go through SimulationKernel and writes all rows
+        at the end. A year takes milliseconds instead of minutes. With the fast forward engine, runs of idle hours
+        are jumped over in closed form, see run_simulation_with_fast_forward
+        :return:
+        """
+        start_time = time.time()
+
+        self.calculate_output_file_header()
+
+        # carries on after the hours already simulated, if resumed from a checkpoint
+        first_hour = self._num_hours_simulated
+        timestamps, hour_of_year_by_hour, dni_by_hour = self.get_hours_to_simulate()
+        timestamps, hour_of_year_by_hour, dni_by_hour = \
+            timestamps[first_hour:], hour_of_year_by_hour[first_hour:], dni_by_hour[first_hour:]
+        consumption_volume_by_hour, consumption_temperature_by_hour = \
+            self._water_container._consumption_by_hour_of_year.T
+
+        if self._simulation_engine == SIMULATION_ENGINE_FAST_FORWARD:
+            metrics, interpolated_by_hour = run_simulation_with_fast_forward(
+                self._solar_collector, self._water_pump, self._water_container, dni_by_hour,
+                hour_of_year_by_hour, consumption_volume_by_hour, consumption_temperature_by_hour,
+                initial_dni=self._current_direct_normal_irradiance)
+            self._metrics_buffer.set_interpolated(interpolated_by_hour, first_row=first_hour)
+        else:
+            metrics = run_simulation_kernel(self._solar_collector, self._water_pump, self._water_container,
+                                            dni_by_hour, hour_of_year_by_hour, consumption_volume_by_hour,
+                                            consumption_temperature_by_hour,
+                                            initial_dni=self._current_direct_normal_irradiance)
+        if len(timestamps):
+            self._current_direct_normal_irradiance = float(dni_by_hour[-1])
+            self._current_time_in_simulation = timestamps[-1].replace("200", "202")
+        self._num_hours_simulated = self._num_hours_to_simulate
+
+        self.write_out_kernel_results(timestamps, metrics, first_row=first_hour)
+        if self._progress_callback:
+            self._progress_callback(self._num_hours_to_simulate, self._num_hours_to_simulate)
+
+        print(f"Simulation took: {round(time.time() - start_time, 3)} seconds with the {self._simulation_engine} engine")
+
+    def get_hours_to_simulate(self):
+        """
+        :return: (timestamps logged for each hour, hour of year slot for each hour, DNI value for each hour), see
+                 LocationAndWeather.get_hours_to_simulate
+        """
+        return get_hours_to_simulate(self._weather_timestamps, self._dni_climatology_by_hour_of_year,
+                                     self._num_hours_to_simulate)
+
     def run_one_hourly_iteration_of_simulation(self):
-        # Filter Historical Dataset to get an average to use today
-        current_hour_of_day = self._current_time_in_simulation[-5:]  # e.g. 01:00
-        month_day_hour_formatted = self._current_time_in_simulation[5:]  # e.g. 03-10T22:00
-        same_day_time_all_years_in_dataset_mask = self._pandas_data.index.str.contains(month_day_hour_formatted)
-        same_day_time_all_years_in_dataset = self._pandas_data[same_day_time_all_years_in_dataset_mask]
-        dni_value_for_hour_in_simulation = same_day_time_all_years_in_dataset.loc[:, 'DNI_value'].mean()
-        self._current_direct_normal_irradiance = dni_value_for_hour_in_simulation
+        # Historical average for the same month-day-hour across all years, precomputed in build_dni_climatology
+        self._current_direct_normal_irradiance = float(
+            self._dni_climatology_by_hour_of_year[self._current_hour_of_year])
 
         # Update timestamp to be today, hardcoded to take 2000's date and make it in the 2020's by adding 20 years
         self._current_time_in_simulation = self._current_time_in_simulation.replace("200", "202")
@@ -164,55 +409,46 @@ class SimulatedWorld:
 
         # Add solar energy to water container through pipes, remove energy from water usage
         self._water_container.run_hour_of_usage(temperature_of_water_in_pipes, flow_rate_for_the_hour,
-                                                current_hour_of_day=current_hour_of_day)
+                                                hour_of_year=self._current_hour_of_year)
 
         # Adjust water pump to have new updated speed
         self._water_pump.adjust_flow_to_current_state(starting_temperature_into_solar, temperature_of_water_in_pipes)
 
+    def get_weather_date_range(self):
+        """
+        :return: (start date, end date) of the weather history used, as YYYY-MM-DD
+        """
+        if self._date_of_simulation_start is None:
+            self._date_of_simulation_start = datetime.now()
+        return get_weather_date_range(self._date_of_simulation_start, self._weather_lookback_years)
+
     def get_weather_data(self):
         """
-        Gets weather data from Open Meteo API
-        Docs here: https://open-meteo.com/en/docs/historical-weather-api
+        Gets weather data from the weather provider (Open Meteo unless the request says otherwise), a year at a
+        time - years of history fetched recently for this location come from the weather cache
         :return:
         """
-        print("Fetching weather data")
         if self._date_of_simulation_start is None:
             self._date_of_simulation_start = datetime.now()
-        today_date_formatted = (self._date_of_simulation_start - relativedelta(days=7)).strftime(
-            '%Y-%d-%m')  # one week back to ensure they have the data
-        twenty_years_ago_formatted = (
-                self._date_of_simulation_start - relativedelta(years=20) - relativedelta(days=7)).strftime(
-            '%Y-%d-%m')  # 20 year lookback, TODO - can make lookback window param in future
-
-        meteo_api_url = f'https://archive-api.open-meteo.com/v1/archive?latitude={self._latitude}&longitude={self._longitude}&start_date={twenty_years_ago_formatted}&end_date={today_date_formatted}&hourly=direct_normal_irradiance&timezone=America%2FNew_York'
-        meteo_response = requests.get(meteo_api_url)
-        meteo_response = meteo_response.json()
-
+        self._weather_timestamps, self._weather_dni = fetch_weather(
+            self._weather_provider, self._weather_cache, self._latitude, self._longitude,
+            self._date_of_simulation_start, self._weather_lookback_years)
 
-        self._meteo_weather_data["DNI_data"] = meteo_response["hourly"]["direct_normal_irradiance"]
-        self._meteo_weather_data["timestamps"] = meteo_response["hourly"]["time"]
-
-        holding_dict = {
-            "DNI_value": pd.Series(self._meteo_weather_data["DNI_data"], index=self._meteo_weather_data["timestamps"])
-
-        }
-        self._pandas_data = pd.DataFrame(
-            holding_dict)
-
-        print("Fetched Weather Data")
+        self.build_dni_climatology()
 
         # raise NotImplementedError # Decide what to do with data, how to process
 
+    def build_dni_climatology(self):
+        """
+        Averages the fetched weather data once into a month-day-hour -> mean DNI table, so each hourly iteration
+        is a single array read instead of a scan over 20 years of timestamps
+        :return:
+        """
+        self._dni_climatology_by_hour_of_year = build_dni_climatology(self._weather_timestamps, self._weather_dni)
+
     def generate_lat_long(self):
-        try:
-            result = self.gmaps.geocode(self._address_of_system)[0]  # Returns multiple results, pick first by default
-            geo_data = result["geometry"]["location"]
-            # print(f"geo data - {geo_data}")
-            self._latitude = geo_data["lat"]
-            self._longitude = geo_data["lng"]
-            print("Fetched Coordinates from address input")
-        except:
-            raise LookupError("Geo lat_lon lookup failed")
+        self._latitude, self._longitude = look_up_lat_long(self._address_of_system, self._geocode_cache,
+                                                           self._external_clients)
 
     def calculate_output_file_header(self):
         """
@@ -224,86 +460,116 @@ class SimulatedWorld:
         if not self._written_output_header:
             self._num_metrics_logged = len(self._header_as_list_for_output_file)  # based on two existing headers
 
-            for loggableObject in self._loggable_parts_of_system:
+            # components are keyed by their position in _loggable_parts_of_system rather than by hashing them
+            for component_id, loggableObject in enumerate(self._loggable_parts_of_system):
                 loggableJSONResponse = loggableObject.get_loggable_metrics()
                 loggableJSONResponseKeys = loggableJSONResponse.keys()
                 for key in loggableJSONResponseKeys:
-                    if not self._header_for_output_file.get(loggableObject, False):
-                        self._header_for_output_file[loggableObject] = {}
+                    if not self._header_for_output_file.get(component_id, False):
+                        self._header_for_output_file[component_id] = {}
                         print(self._header_for_output_file)
-                    self._header_for_output_file[loggableObject][key] = self._num_metrics_logged
+                    self._header_for_output_file[component_id][key] = self._num_metrics_logged
                     self._header_as_list_for_output_file.append(key)
                     self._num_metrics_logged += 1
 
                     # Header
             # self._output_csv_file_writer.writerow(self._header_as_list_for_output_file)
             self._written_output_header = True
+
+            # rows are padded with 0 up to one column past the metrics, same as BIGQUERY_SCHEMA
+            self._metrics_buffer = MetricsBuffer(
+                self._simulation_uuid, self._header_as_list_for_output_file[2:], self._num_hours_to_simulate,
+                num_padding_columns=self._num_metrics_logged + 1 - len(self._header_as_list_for_output_file))
             if (len(self._header_as_list_for_output_file) > 16):
                 pass
 
-    def write_out_simulation_results(self):
-
-        # TODO - fix hardcoded
-        row_of_data = [self._simulation_uuid, self._current_time_in_simulation, self._current_direct_normal_irradiance]
-        for i in range(len(row_of_data), self._num_metrics_logged + 1):
-            row_of_data.append(0)
-
-        for loggableObject in self._loggable_parts_of_system:
-            loggableJSONResponse = loggableObject.get_loggable_metrics()
-            for key in loggableJSONResponse.keys():
-                value = loggableJSONResponse[key]
-                row_of_data[self._header_for_output_file[loggableObject][key]] = value
-
-        print(f"Simulation Results Intermediate - {self._header_for_output_file}")
-        print(row_of_data)
+    def get_current_metric_values(self) -> list:
+        """
+        :return: value of every metric for the current state, in header order
+        """
+        metric_values = [self._current_direct_normal_irradiance]
+        for loggable_part in self._loggable_parts_of_system:
+            metric_values += loggable_part.get_loggable_metric_values()
+        return metric_values
 
-        self._output_csv_file_writer.writerow(row_of_data)
+    def get_current_metrics(self) -> dict:
+        """
+        Same values as a logged row, e.g. once the simulation is done the state after its last hour, which no row holds
+        :return: metric name -> value
+        """
+        return dict(zip(self._header_as_list_for_output_file[2:], self.get_current_metric_values()))
 
-    def delete_existing_bigquery_results_with_same_uuid(self):
+    def write_out_simulation_results(self):
         """
-        This function deletes bigquery rows with same uuid - used to make demo live and update to new values instead of
-        averaging past values
+        Logs the current state as the next row of the metrics buffer, in header order
         :return:
         """
-        table_id = BIGQUERY_TABLE_ID
-
-        table_original = self._bigquery_client.get_table(table_id)  # Make an API request.
-
-        # TODO - Modify to sanitize input, protect from sql injection
-        sql_statement = f"""
-                    DELETE {table_id} t WHERE t.uuid IN
-                    (SELECT uuid FROM {table_id}
-                    WHERE uuid = '{self._simulation_uuid}');
-                    """
-        query_job = self._bigquery_client.query(query=sql_statement)
-        print("Bigquery cleanup started")
-        results = query_job.result()  # Waits for job to complete.
-        table_new = self._bigquery_client.get_table(table_id)  # Make an API request.
+        self._metrics_buffer.append_row(self._current_time_in_simulation, self.get_current_metric_values())
 
-        print(
-            f"Deleted {table_original.num_rows - table_new.num_rows} rows to clean bq table {table_id} for new simulation {self._simulation_uuid}")
-
-    def upload_results_to_bigquery(self):
-
-        table_id = BIGQUERY_TABLE_ID
-        self.delete_existing_bigquery_results_with_same_uuid()
-
-        table_original = self._bigquery_client.get_table(table_id)
-        # close existing temp file
-        self._output_csv_file.close()
-
-        job_config = bigquery.LoadJobConfig(
-            schema=BIGQUERY_SCHEMA
-        )
-
-        with open(OUTPUT_METRICS_FILE_PATH, "rb") as source_file:
-            job = self._bigquery_client.load_table_from_file(source_file, table_id, job_config=job_config)
+    def write_out_kernel_results(self, timestamps: list, metrics: dict, first_row: int = 0):
+        """
+        Writes every row from run_simulation_kernel in one go, same layout as write_out_simulation_results
+        :param timestamps: timestamp logged for each row
+        :param metrics: metric name -> column of values
+        :param first_row: rows before this one were already logged, e.g. before resuming from a checkpoint
+        :return:
+        """
+        self._metrics_buffer.set_columns(timestamps, metrics, first_row=first_row)
+        self.write_out_metrics_buffer()
 
-        job.result()
+    def write_out_metrics_buffer(self):
+        """
+        Bulk writes every logged row to the output buffer, or to a Parquet file the buffer hands out. Nothing is
+        written when only rollups are uploaded
+        :return:
+        """
+        if self._upload_mode == UPLOAD_MODE_AGGREGATES:
+            return
+        if self._result_format == RESULT_FORMAT_PARQUET:
+            self._metrics_buffer.write_parquet(self._output_buffer.make_file_path(".parquet"), BIGQUERY_SCHEMA,
+                                               compress_interpolated_rows=self._compress_idle_hours)
+            return
+        self._metrics_buffer.write_csv(self._output_csv_file_writer,
+                                       compress_interpolated_rows=self._compress_idle_hours)
+        self._output_buffer.flush()
+
+    def aggregate_results(self) -> dict:
+        """
+        Aggregation stage, once the simulation is done: daily and monthly totals of the logged hours, so dashboards
+        don't have to scan every hourly row for them
+        :return: "day"/"month" -> rollups, see compute_rollups
+        """
+        self._rollups = compute_rollups(self._metrics_buffer.get_timestamps(), self._metrics_buffer.get_columns(),
+                                        self._metrics_after_last_hour)
+        return self._rollups
 
-        table_new = self._bigquery_client.get_table(table_id)  # Make an API request.
-        print(
-            "Added {} rows for a total of {} rows and {} columns in {}".format(
-                table_new.num_rows - table_original.num_rows, table_new.num_rows, len(table_new.schema), table_id
-            )
-        )
+    def upload_results(self, on_uploaded=None) -> Future:
+        """
+        Hands the output, the rollups or both, depending on the upload mode, to the result sink as files on a
+        background thread. The files are deleted once the upload is done
+        :param on_uploaded: called on the upload thread once the sink has the results
+        :return: future for the upload, see also wait_for_results_upload
+        """
+        results_file_path = rollups_file_path = None
+        if self._upload_mode == UPLOAD_MODE_AGGREGATES:
+            self._output_buffer.close()
+        else:
+            results_file_path = self._output_buffer.detach_file_path()
+        if self._upload_mode != UPLOAD_MODE_HOURLY:
+            if self._rollups is None:
+                self.aggregate_results()
+            rollups_buffer = SimulationOutputBuffer(self._simulation_uuid)
+            write_rollups_csv(csv.writer(rollups_buffer), self._simulation_uuid, self._rollups)
+            rollups_file_path = rollups_buffer.detach_file_path()
+
+        self._results_upload = submit_result_upload(self._result_sink, self._simulation_uuid, results_file_path,
+                                                    remove_file_when_done=True, on_uploaded=on_uploaded,
+                                                    rollups_file_path=rollups_file_path)
+        return self._results_upload
+
+    def wait_for_results_upload(self):
+        """
+        :raises Exception: whatever the result sink raised
+        """
+        if self._results_upload is not None:
+            self._results_upload.result()
@@ -0,0 +1,167 @@
+import os
+import json
+import glob
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+
+import numpy as np
+
+from .CONSTANTS import SIMULATION_CHECKPOINT_DIRECTORY, SIMULATION_CHECKPOINT_TIME_TO_LIVE_SECONDS
+
+
+class SimulationCheckpointStore:
+    """
+    Saves how far a simulation got, so a run that fails part way (or whose process restarts) can carry on from its
+    last checkpoint instead of starting again from geocoding.
+
+    Each checkpoint is a directory holding
+        - state.json: the world and component state after the last checkpointed hour, see SimulatedWorld.get_state
+        - weather.npz: timestamps of the hours to simulate and the DNI climatology, so resuming needs no network
+        - rows-<first row>.npz: the rows logged since the previous checkpoint, so each checkpoint only writes what's new
+    state.json is replaced last, so rows written after it by a run that then died are ignored on load.
+    Checkpoints are keyed by uuid and request hash, see make_key. They're deleted once the results are uploaded, and
+    ones not written to for the time to live, e.g. of runs that failed for good, are swept when a new one is started.
+    """
+    _checkpoint_directory: str = None
+    _time_to_live_seconds: float = None
+    _lock: threading.Lock = None
+    expirations: int = 0
+
+    def __init__(self, checkpoint_directory: str = SIMULATION_CHECKPOINT_DIRECTORY,
+                 time_to_live_seconds: float = SIMULATION_CHECKPOINT_TIME_TO_LIVE_SECONDS):
+        self._checkpoint_directory = os.path.abspath(checkpoint_directory)
+        self._time_to_live_seconds = time_to_live_seconds
+        self._lock = threading.Lock()
+        os.makedirs(self._checkpoint_directory, exist_ok=True)
+
+    @staticmethod
+    def make_key(simulation_uuid, request_hash: str) -> str:
+        """
+        Only a resubmission of the same request under the same uuid resumes the checkpoint
+        :param simulation_uuid:
+        :param request_hash: see make_request_hash
+        :return: key that is also safe to use as a directory name
+        """
+        return hashlib.sha256(f"{simulation_uuid}:{request_hash}".encode()).hexdigest()[:32]
+
+    def save_weather(self, key: str, timestamps, dni_climatology):
+        """
+        Starts a checkpoint, so expired ones are swept first
+        :param key:
+        :param timestamps: timestamp of each hour to simulate, as datetime64 or str
+        :param dni_climatology: see HourOfYearClimatology
+        :return:
+        """
+        self.remove_expired()
+        self._save_arrays(key, "weather.npz", timestamps=np.asarray(timestamps, dtype='datetime64[m]'),
+                          dni_climatology=np.asarray(dni_climatology))
+
+    def save(self, key: str, state: dict, first_row: int, timestamps, metrics: dict):
+        """
+        :param key:
+        :param state: JSON serializable, must hold "hours_simulated"
+        :param first_row: row number of the first of the new rows
+        :param timestamps: timestamps of the rows logged since the previous checkpoint
+        :param metrics: metric name -> column of values for the same rows
+        :return:
+        """
+        if len(timestamps):
+            self._save_arrays(key, f"rows-{first_row:09d}.npz", timestamps=np.asarray(timestamps, dtype=str),
+                              metric_names=np.array(list(metrics), dtype=str),
+                              metric_values=np.array(list(metrics.values()), dtype=np.float64))
+        with self._lock:
+            self._replace_file(key, "state.json", lambda state_file: json.dump(state, state_file), mode='w')
+
+    def load(self, key: str):
+        """
+        :return: None if there's no checkpoint, otherwise dict with
+                 "state", "timestamps" and "metrics" of the rows logged so far, and "weather" (see save_weather)
+        """
+        checkpoint_path = os.path.join(self._checkpoint_directory, key)
+        try:
+            with open(os.path.join(checkpoint_path, "state.json")) as state_file:
+                state = json.load(state_file)
+            with np.load(os.path.join(checkpoint_path, "weather.npz")) as weather:
+                weather = {"timestamps": weather["timestamps"].astype('datetime64[m]'),
+                           "dni_climatology": weather["dni_climatology"]}
+        except (OSError, ValueError):
+            return None
+
+        hours_simulated = state["hours_simulated"]
+        timestamps, metrics = [], {}
+        for rows_file_path in sorted(glob.glob(os.path.join(checkpoint_path, "rows-*.npz"))):
+            # only rows carrying on from the ones before, anything else was left behind by a run that died
+            first_row = int(os.path.basename(rows_file_path)[5:-4])
+            if first_row != len(timestamps) or first_row >= hours_simulated:
+                continue
+            with np.load(rows_file_path) as rows:
+                timestamps += rows["timestamps"].tolist()
+                for metric_name, column in zip(rows["metric_names"].tolist(), rows["metric_values"]):
+                    metrics.setdefault(metric_name, []).append(column)
+        metrics = {metric_name: np.concatenate(columns)[:hours_simulated] for metric_name, columns in metrics.items()}
+        return {"state": state, "timestamps": timestamps[:hours_simulated], "metrics": metrics, "weather": weather}
+
+    def delete(self, key: str):
+        shutil.rmtree(os.path.join(self._checkpoint_directory, key), ignore_errors=True)
+
+    def remove_expired(self):
+        """
+        Deletes every checkpoint not written to for the time to live
+        :return:
+        """
+        now = time.time()
+        for checkpoint_path in glob.glob(os.path.join(self._checkpoint_directory, "*")):
+            try:
+                # each write renames a file into the checkpoint's directory, which updates its modification time
+                expired = now - os.path.getmtime(checkpoint_path) > self._time_to_live_seconds
+            except OSError:
+                continue
+            if expired:
+                shutil.rmtree(checkpoint_path, ignore_errors=True)
+                self.expirations += 1
+
+    def _save_arrays(self, key: str, file_name: str, **arrays):
+        with self._lock:
+            self._replace_file(key, file_name, lambda arrays_file: np.savez(arrays_file, **arrays), mode='wb')
+
+    def _replace_file(self, key: str, file_name: str, write_function, mode: str):
+        checkpoint_path = os.path.join(self._checkpoint_directory, key)
+        os.makedirs(checkpoint_path, exist_ok=True)
+        # write then rename so a crash mid write never leaves a half written file behind
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=checkpoint_path, suffix=".tmp")
+        with os.fdopen(file_descriptor, mode) as temporary_file:
+            write_function(temporary_file)
+        os.replace(temporary_path, os.path.join(checkpoint_path, file_name))
+
+
+_shared_simulation_checkpoint_store: SimulationCheckpointStore = None
+_shared_simulation_checkpoint_store_lock = threading.Lock()
+
+
+def _forget_simulation_checkpoint_store_in_forked_child():
+    # another thread may have held the store's lock when the process was forked, the child starts its own store
+    global _shared_simulation_checkpoint_store, _shared_simulation_checkpoint_store_lock
+    _shared_simulation_checkpoint_store = None
+    _shared_simulation_checkpoint_store_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_simulation_checkpoint_store_in_forked_child)
+
+
+def get_shared_simulation_checkpoint_store() -> SimulationCheckpointStore:
+    """
+    One store per process, settings can be overridden with the SIMULATION_CHECKPOINT_DIRECTORY and
+    SIMULATION_CHECKPOINT_TIME_TO_LIVE_SECONDS env variables
+    :return:
+    """
+    global _shared_simulation_checkpoint_store
+    with _shared_simulation_checkpoint_store_lock:
+        if _shared_simulation_checkpoint_store is None:
+            _shared_simulation_checkpoint_store = SimulationCheckpointStore(
+                checkpoint_directory=os.getenv('SIMULATION_CHECKPOINT_DIRECTORY', SIMULATION_CHECKPOINT_DIRECTORY),
+                time_to_live_seconds=float(os.getenv('SIMULATION_CHECKPOINT_TIME_TO_LIVE_SECONDS',
+                                                     SIMULATION_CHECKPOINT_TIME_TO_LIVE_SECONDS)))
+        return _shared_simulation_checkpoint_store
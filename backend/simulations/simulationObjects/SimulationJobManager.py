@@ -0,0 +1,159 @@
+import time
+import uuid
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from .CONSTANTS import SIMULATION_JOB_MAX_WORKERS, SIMULATION_JOB_HISTORY_SIZE
+from .ConfigurationInputs import SimulationIncomingRequest
+
+JOB_STATUS_QUEUED = "queued"
+JOB_STATUS_RUNNING = "running"
+JOB_STATUS_SUCCEEDED = "succeeded"
+JOB_STATUS_FAILED = "failed"
+
+
+def run_simulation_job(job_id: str, request: dict, progress_by_job_id) -> dict:
+    """
+    Runs in a worker process - builds the world from the plain request dict and runs the whole simulation,
+    reporting progress back to the API process through the shared progress dict
+    :param job_id:
+    :param request: SimulationIncomingRequest as a dict
+    :param progress_by_job_id: multiprocessing.Manager dict shared with the API process
+    :return: summary of the finished simulation
+    """
+    # imported here so the API process doesn't need the simulation dependencies just to queue jobs
+    from .SimulatedWorld import SimulatedWorld
+
+    start_time = time.time()
+    configuration = SimulationIncomingRequest(**request)
+    progress_by_job_id[job_id] = {"status": JOB_STATUS_RUNNING, "iteration": 0,
+                                  "total": configuration.num_hours_to_simulate}
+    last_reported_percent = -1
+
+    def report_progress(iteration, total):
+        # every update is a round trip to the manager process, so only send whole percent changes
+        nonlocal last_reported_percent
+        percent_complete = int(100 * iteration / total) if total else 100
+        if percent_complete != last_reported_percent:
+            last_reported_percent = percent_complete
+            progress_by_job_id[job_id] = {"status": JOB_STATUS_RUNNING, "iteration": iteration, "total": total}
+
+    world = SimulatedWorld(configuration)
+    world.set_progress_callback(report_progress)
+    world.run_entire_simulation()
+    world.wait_for_results_upload()  # a succeeded job means the results can be queried
+
+    return {"simulation_uuid": str(world._simulation_uuid),
+            "num_hours_simulated": world._num_hours_to_simulate,
+            "simulation_engine": world._simulation_engine,
+            "served_from_result_cache": world._served_from_result_cache,
+            "resumed_from_checkpoint": world._resumed_from_checkpoint,
+            "seconds_elapsed": round(time.time() - start_time, 3)}
+
+
+class SimulationJobManager:
+    """
+    Runs simulations as background jobs on a bounded process pool, so a long simulation never blocks the event loop
+    or other requests. Jobs are tracked in memory by job id, the oldest finished jobs are forgotten once there are
+    more than job_history_size of them.
+    """
+    _max_workers: int = None
+    _job_history_size: int = None
+    _job_function = None
+    _executor: ProcessPoolExecutor = None
+    _process_manager = None  # multiprocessing.Manager, holds progress shared with the worker processes
+    _progress_by_job_id = None
+    _jobs: OrderedDict = None  # job id -> {"future": ..., "submitted_at": ...}
+    _lock: threading.Lock = None
+
+    def __init__(self, max_workers: int = SIMULATION_JOB_MAX_WORKERS,
+                 job_history_size: int = SIMULATION_JOB_HISTORY_SIZE, job_function=run_simulation_job):
+        """
+        :param max_workers: max simulations running at the same time, the rest wait in the queue
+        :param job_history_size: number of finished jobs kept around for status/result lookups
+        :param job_function: module level function taking (job_id, request dict, progress dict), swappable for tests
+        """
+        self._max_workers = max_workers
+        self._job_history_size = job_history_size
+        self._job_function = job_function
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, configuration: SimulationIncomingRequest) -> str:
+        """
+        Queues the simulation and returns straight away
+        :param configuration:
+        :return: job id to poll with get_status, get_progress and get_result
+        """
+        job_id = str(uuid.uuid4())
+        with self._lock:
+            self._start_pool_if_needed()
+            self._progress_by_job_id[job_id] = {"status": JOB_STATUS_QUEUED, "iteration": 0,
+                                                "total": configuration.num_hours_to_simulate}
+            future = self._executor.submit(self._job_function, job_id, configuration.dict(), self._progress_by_job_id)
+            self._jobs[job_id] = {"future": future, "submitted_at": time.time()}
+            self._forget_old_jobs()
+        return job_id
+
+    def get_status(self, job_id: str) -> dict:
+        """
+        :raises KeyError: unknown or forgotten job id
+        """
+        job = self._get_job(job_id)
+        future = job["future"]
+        status_response = {"job_id": job_id, "status": self._get_status_name(job_id, future),
+                           "seconds_since_submitted": round(time.time() - job["submitted_at"], 3)}
+        if future.done() and future.exception() is not None:
+            status_response["exception"] = str(future.exception())
+        return status_response
+
+    def get_progress(self, job_id: str) -> dict:
+        job = self._get_job(job_id)
+        progress = dict(self._progress_by_job_id.get(job_id, {}))
+        total = progress.get("total") or 0
+        iteration = total if job["future"].done() else progress.get("iteration", 0)
+        return {"job_id": job_id, "status": self._get_status_name(job_id, job["future"]), "iteration": iteration,
+                "total": total, "percent_complete": round(100 * iteration / total, 2) if total else 0}
+
+    def get_result(self, job_id: str):
+        """
+        :return: the job's result, or None if it hasn't finished yet
+        :raises Exception: whatever the simulation raised if the job failed
+        """
+        future = self._get_job(job_id)["future"]
+        if not future.done():
+            return None
+        return future.result()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._process_manager.shutdown()
+                self._executor = None
+
+    def _start_pool_if_needed(self):
+        if self._executor is None:
+            self._process_manager = multiprocessing.Manager()
+            self._progress_by_job_id = self._process_manager.dict()
+            self._executor = ProcessPoolExecutor(max_workers=self._max_workers)
+
+    def _get_job(self, job_id: str) -> dict:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            raise KeyError(f"No simulation job with id {job_id}")
+        return job
+
+    def _get_status_name(self, job_id: str, future) -> str:
+        if future.done():
+            return JOB_STATUS_FAILED if future.exception() is not None else JOB_STATUS_SUCCEEDED
+        return self._progress_by_job_id.get(job_id, {}).get("status", JOB_STATUS_QUEUED)
+
+    def _forget_old_jobs(self):
+        finished_job_ids = [job_id for job_id, job in self._jobs.items() if job["future"].done()]
+        for job_id in finished_job_ids[:max(0, len(self._jobs) - self._job_history_size)]:
+            del self._jobs[job_id]
+            self._progress_by_job_id.pop(job_id, None)
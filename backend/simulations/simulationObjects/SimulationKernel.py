@@ -0,0 +1,378 @@
+import numpy as np
+
+from .CONSTANTS import SPECIFIC_HEAT_CAPACITY_OF_WATER, FAST_FORWARD_MIN_IDLE_HOURS
+from .SolarCollector import SolarCollector
+from .WaterPump import WaterPump
+from .WaterContainer import WaterContainer
+
+# Same names and order as the output file header after uuid and Timestamp
+KERNEL_METRIC_COLUMNS = (
+    "DNI_Value",
+    "water_temp_into_solar",
+    "water_temp_out_of_solar",
+    "energy_captured_by_solar",
+    "solar_efficiency",
+    "water_flow_rate",
+    "percent_water_pump_flow_rate_used",
+    "current_average_water_temp_in_water_container",
+    "current_thermal_energy_in_water_container",
+    "average_temp_of_water_sent_out_of_water_container",
+    "energy_sent_out_of_water_container",
+    "volume_of_water_sent_out_of_water_container",
+    "energy_consumed_by_heater",
+    "energy_absorbed_from_pipes",
+)
+
+
+def run_simulation_kernel(solar_collector: SolarCollector, water_pump: WaterPump, water_container: WaterContainer,
+                          dni_by_hour, consumption_slot_by_hour, consumption_volume_by_slot,
+                          consumption_temperature_by_slot, initial_dni: float = 0):
+    """
+    Runs the same hourly recurrence as SimulatedWorld.run_one_hourly_iteration_of_simulation for the whole run in one
+    tight loop over plain floats, writing every metric into a preallocated array instead of going through the
+    component objects and their get_loggable_metrics dicts every hour.
+
+    The components are only used for their starting state and get the end state written back, so the object based
+    engine can carry on from where this left off.
+
+    Like the object based engine, row i holds the state logged *before* hour i runs, i.e. row 0 is the starting state
+    and the DNI in row i is the one used for hour i - 1.
+    :param dni_by_hour: DNI value in W/m^2 for each hour to simulate
+    :param consumption_slot_by_hour: index into the consumption tables for each hour, e.g. the hour of day
+    :param consumption_volume_by_slot: L of water used, see compile_consumption_pattern
+    :param consumption_temperature_by_slot: ºC of the water used
+    :param initial_dni: DNI logged in the first row
+    :return: dict of metric name -> float array with one value per hour, keys are KERNEL_METRIC_COLUMNS
+    """
+    metrics, _ = _run_kernel(solar_collector, water_pump, water_container, dni_by_hour, consumption_slot_by_hour,
+                             consumption_volume_by_slot, consumption_temperature_by_slot, initial_dni, idle_runs=())
+    return metrics
+
+
+def find_idle_runs(dni_by_hour, consumption_slot_by_hour, consumption_volume_by_slot,
+                   min_run_length: int = FAST_FORWARD_MIN_IDLE_HOURS) -> list:
+    """
+    Idle hours have no sun and no water used, so nothing but the tank's heat loss and the pump slowing down happens
+    :param dni_by_hour:
+    :param consumption_slot_by_hour:
+    :param consumption_volume_by_slot:
+    :param min_run_length: shorter runs of idle hours aren't worth jumping over
+    :return: list of (first hour, hour after the last) of each run of idle hours
+    """
+    idle_by_hour = (np.asarray(dni_by_hour) == 0) & (
+            np.asarray(consumption_volume_by_slot)[np.asarray(consumption_slot_by_hour, dtype=np.int64)] == 0)
+    run_edges = np.flatnonzero(np.diff(np.concatenate([[0], idle_by_hour.astype(np.int8), [0]])))
+    return [(int(start), int(end)) for start, end in zip(run_edges[::2], run_edges[1::2])
+            if end - start >= min_run_length]
+
+
+def run_simulation_with_fast_forward(solar_collector: SolarCollector, water_pump: WaterPump,
+                                     water_container: WaterContainer, dni_by_hour, consumption_slot_by_hour,
+                                     consumption_volume_by_slot, consumption_temperature_by_slot,
+                                     initial_dni: float = 0, min_idle_run_length: int = FAST_FORWARD_MIN_IDLE_HOURS):
+    """
+    Same as run_simulation_kernel, same rows and end state to within floating point rounding, but runs of idle hours
+    (see find_idle_runs) are jumped over in closed form instead of stepped through:
+        - the tank loses the same fraction of its heat every hour, so its temperature decays geometrically. Hours
+          where the water used is warmer than the mains (even though none is used) top it back up to the minimum
+          with the boiler once it's fallen below, from then on it decays from the minimum
+        - water comes back from the collector as warm as it left, so the pump slows down by the same factor every
+          hour until it reaches its minimum (or speeds up / holds, depending on its temperature difference settings)
+    The loop only works out the state at the end of each run, the rows inside the runs are filled in afterwards for
+    all runs at once.
+    :param min_idle_run_length: shorter runs of idle hours are stepped through
+    :return: (dict of metric name -> float array with one value per hour,
+              bool array that is True for rows inside an idle run, i.e. rows compressed output can leave out)
+    """
+    idle_runs = find_idle_runs(dni_by_hour, consumption_slot_by_hour, consumption_volume_by_slot,
+                               min_idle_run_length)
+    return _run_kernel(solar_collector, water_pump, water_container, dni_by_hour, consumption_slot_by_hour,
+                       consumption_volume_by_slot, consumption_temperature_by_slot, initial_dni, idle_runs)
+
+
+def _run_kernel(solar_collector: SolarCollector, water_pump: WaterPump, water_container: WaterContainer,
+                dni_by_hour, consumption_slot_by_hour, consumption_volume_by_slot, consumption_temperature_by_slot,
+                initial_dni: float, idle_runs):
+    # plain python floats/lists are much faster than numpy scalars for this sequential, branchy loop
+    dni_by_hour = np.asarray(dni_by_hour, dtype=np.float64).tolist()
+    consumption_slot_by_hour = np.asarray(consumption_slot_by_hour).tolist()
+    consumption_volume_by_slot = np.asarray(consumption_volume_by_slot, dtype=np.float64).tolist()
+    consumption_temperature_by_slot = np.asarray(consumption_temperature_by_slot, dtype=np.float64).tolist()
+    num_hours = len(dni_by_hour)
+
+    heat_capacity = SPECIFIC_HEAT_CAPACITY_OF_WATER
+
+    surface_area = solar_collector._surface_area
+    solar_efficiency = solar_collector._solar_efficiency
+    water_temp_into_solar = solar_collector._water_temp_in
+    water_temp_out_of_solar = solar_collector._water_temp_out
+    energy_captured_by_solar = solar_collector._energy_captured_by_solar
+
+    min_flow_rate = water_pump._min_flow_rate
+    max_flow_rate = water_pump._max_flow_rate
+    flow_rate = water_pump._current_flow_rate
+    percent_of_maximum_flow_rate = water_pump._percent_of_maximum_flow_rate
+    min_temp_difference = water_pump._minimum_temp_difference_between_water_incoming_and_outgoing_solar
+    max_temp_difference = water_pump._maximum_temp_difference_between_water_incoming_and_outgoing_solar
+    flow_rate_increase_factor = water_pump._flow_rate_increase_factor
+    flow_rate_decrease_factor = water_pump._flow_rate_decrease_factor
+
+    water_capacity = water_container._water_capacity
+    average_water_temp = water_container._current_average_water_temp
+    thermal_energy = water_container._current_thermal_energy
+    percent_absorbed_from_pipes = water_container._percent_of_thermal_energy_absorbed_from_pipes
+    percent_lost_per_hour = water_container._percent_of_thermal_energy_lost_to_waste_per_hour
+    external_water_temp = water_container._temperature_of_external_water_source
+    boiler_efficiency = water_container._efficiency_of_traditional_boiler
+    minimum_average_water_temp = water_container._minimum_average_water_temp
+    outgoing_water_temp = water_container.outgoing_water_temperature
+    volume_sent_out = water_container._volume_of_water_sent_out_of_water_container
+    temp_sent_out = water_container._average_temp_of_water_sent_out_of_water_container
+    energy_sent_out = water_container._energy_sent_out_of_water_container
+    energy_consumed_by_heater = water_container._energy_consumed_by_heater
+    energy_absorbed_from_pipes = water_container._energy_absorbed_from_pipes
+
+    target_energy_level = minimum_average_water_temp * heat_capacity * water_capacity
+    dni = initial_dni
+
+    metrics = np.empty((len(KERNEL_METRIC_COLUMNS), num_hours))
+    (dni_column, temp_into_solar_column, temp_out_of_solar_column, energy_captured_column, solar_efficiency_column,
+     flow_rate_column, percent_flow_rate_column, average_temp_column, thermal_energy_column, temp_sent_out_column,
+     energy_sent_out_column, volume_sent_out_column, heater_column, absorbed_from_pipes_column) = metrics
+    solar_efficiency_column[:] = solar_efficiency
+
+    # Idle hours: no heat from the collector, so the pump sees no temperature difference and the tank only loses heat
+    fraction_kept_per_hour = 1 - percent_lost_per_hour
+    if 0.0 < min_temp_difference:
+        idle_flow_rate_factor, clip_idle_flow_rate = flow_rate_decrease_factor, lambda rate: max(rate, min_flow_rate)
+    elif 0.0 > max_temp_difference:
+        idle_flow_rate_factor, clip_idle_flow_rate = flow_rate_increase_factor, lambda rate: min(rate, max_flow_rate)
+    else:
+        idle_flow_rate_factor, clip_idle_flow_rate = 1.0, float
+    warmer_than_mains_by_slot = [temp_used > external_water_temp for temp_used in consumption_temperature_by_slot]
+    if idle_runs and idle_runs[0][0] == 0 and outgoing_water_temp != average_water_temp:
+        # only the case before the first hour, if the tank was set up with water leaving at another temperature
+        idle_runs = idle_runs[1:]
+    jumped_idle_runs = []  # (first hour, hour after the last, tank temp, flow rate, heater energy going in)
+    top_up_hours, top_up_heater_energies = [], []
+
+    # each segment steps through the hours up to the next idle run, then jumps to its end
+    segments = []
+    first_hour = 0
+    for idle_run_start, idle_run_end in idle_runs:
+        segments.append((first_hour, idle_run_start, idle_run_end))
+        first_hour = idle_run_end
+    segments.append((first_hour, num_hours, num_hours))
+
+    for first_hour, idle_run_start, idle_run_end in segments:
+        for hour in range(first_hour, idle_run_start):
+            # Log the state going into the hour
+            dni_column[hour] = dni
+            temp_into_solar_column[hour] = water_temp_into_solar
+            temp_out_of_solar_column[hour] = water_temp_out_of_solar
+            energy_captured_column[hour] = energy_captured_by_solar
+            flow_rate_column[hour] = flow_rate
+            percent_flow_rate_column[hour] = percent_of_maximum_flow_rate
+            average_temp_column[hour] = average_water_temp
+            thermal_energy_column[hour] = thermal_energy
+            temp_sent_out_column[hour] = temp_sent_out
+            energy_sent_out_column[hour] = energy_sent_out
+            volume_sent_out_column[hour] = volume_sent_out
+            heater_column[hour] = energy_consumed_by_heater
+            absorbed_from_pipes_column[hour] = energy_absorbed_from_pipes
+
+            dni = dni_by_hour[hour]
+
+            # SolarCollector.add_one_hour_solar_energy
+            starting_temperature_into_solar = outgoing_water_temp
+            energy_from_one_hour = dni * surface_area * solar_efficiency * 60 * 60
+            temp_raised = (energy_from_one_hour / (flow_rate * 60)) / heat_capacity
+            water_temp_into_solar = starting_temperature_into_solar
+            water_temp_out_of_solar = starting_temperature_into_solar + temp_raised
+            energy_captured_by_solar = energy_from_one_hour
+
+            # WaterContainer.run_hour_of_usage
+            difference_in_temp = water_temp_out_of_solar - average_water_temp
+            if difference_in_temp < 0:
+                raise EnvironmentError(
+                    "Water coming back to water container colder than when it left... wrong since heat loss not yet factored in on pipes")
+            energy_absorbed_from_pipes = (difference_in_temp * heat_capacity * flow_rate * 60
+                                          * percent_absorbed_from_pipes)
+            average_water_temp += energy_absorbed_from_pipes / (heat_capacity * water_capacity)
+            thermal_energy = water_capacity * average_water_temp * heat_capacity
+            average_water_temp = ((thermal_energy * (1 - percent_lost_per_hour)) / water_capacity) / heat_capacity
+            thermal_energy = water_capacity * average_water_temp * heat_capacity
+
+            # WaterContainer.process_hot_water_leaving_water_container
+            slot = consumption_slot_by_hour[hour]
+            volume_used = consumption_volume_by_slot[slot]
+            temp_used = consumption_temperature_by_slot[slot]
+            if temp_used <= external_water_temp:
+                temp_sent_out = 0
+                volume_sent_out = 0
+                energy_sent_out = 0
+            else:
+                energy_sent_out = volume_used * temp_used * heat_capacity
+                temp_sent_out = temp_used
+                volume_sent_out = volume_used
+                energy_surplus = ((thermal_energy + volume_used * external_water_temp * heat_capacity)
+                                  - energy_sent_out) - target_energy_level
+                if energy_surplus < 0:
+                    energy_consumed_by_heater = energy_surplus / boiler_efficiency
+                    average_water_temp = minimum_average_water_temp
+                    thermal_energy = water_capacity * average_water_temp * heat_capacity
+                else:
+                    energy_consumed_by_heater = 0
+            outgoing_water_temp = average_water_temp
+
+            # WaterPump.adjust_flow_to_current_state
+            temp_difference = water_temp_out_of_solar - starting_temperature_into_solar
+            if temp_difference < min_temp_difference:
+                flow_rate = max(flow_rate * flow_rate_decrease_factor, min_flow_rate)
+            elif temp_difference > max_temp_difference:
+                flow_rate = min(flow_rate * flow_rate_increase_factor, max_flow_rate)
+            percent_of_maximum_flow_rate = flow_rate / max_flow_rate
+
+        if idle_run_end == idle_run_start:
+            continue
+
+        # Log the state going into the idle run, the rows inside it are filled in after the loop
+        hour = idle_run_start
+        dni_column[hour] = dni
+        temp_into_solar_column[hour] = water_temp_into_solar
+        temp_out_of_solar_column[hour] = water_temp_out_of_solar
+        energy_captured_column[hour] = energy_captured_by_solar
+        flow_rate_column[hour] = flow_rate
+        percent_flow_rate_column[hour] = percent_of_maximum_flow_rate
+        average_temp_column[hour] = average_water_temp
+        thermal_energy_column[hour] = thermal_energy
+        temp_sent_out_column[hour] = temp_sent_out
+        energy_sent_out_column[hour] = energy_sent_out
+        volume_sent_out_column[hour] = volume_sent_out
+        heater_column[hour] = energy_consumed_by_heater
+        absorbed_from_pipes_column[hour] = energy_absorbed_from_pipes
+        jumped_idle_runs.append((idle_run_start, idle_run_end, average_water_temp, flow_rate,
+                                 energy_consumed_by_heater))
+
+        # the boiler only comes on in hours where water warmer than the mains is asked for, so only those are visited
+        starting_temp = average_water_temp
+        last_top_up = previous_top_up = -1
+        last_slot = consumption_slot_by_hour[idle_run_end - 1]
+        for hour in range(idle_run_start, idle_run_end):
+            if not warmer_than_mains_by_slot[consumption_slot_by_hour[hour]]:
+                continue
+            if last_top_up < 0:
+                temp_after_loss = starting_temp * fraction_kept_per_hour ** (hour - idle_run_start + 1)
+            else:
+                temp_after_loss = minimum_average_water_temp * fraction_kept_per_hour ** (hour - last_top_up)
+            if temp_after_loss < minimum_average_water_temp:
+                energy_consumed_by_heater = (water_capacity * temp_after_loss * heat_capacity
+                                             - target_energy_level) / boiler_efficiency
+                previous_top_up, last_top_up = last_top_up, hour
+                top_up_hours.append(hour)
+                top_up_heater_energies.append(energy_consumed_by_heater)
+            else:
+                energy_consumed_by_heater = 0
+
+        def temp_after_idle_hour(idle_hour, last_top_up_hour):
+            if last_top_up_hour < 0:
+                return starting_temp * fraction_kept_per_hour ** (idle_hour - idle_run_start + 1)
+            return minimum_average_water_temp * fraction_kept_per_hour ** (idle_hour - last_top_up_hour)
+
+        # state after the last idle hour, as if it had been stepped through
+        if idle_run_end - 1 == idle_run_start:
+            water_temp_into_solar = starting_temp
+        else:
+            water_temp_into_solar = temp_after_idle_hour(
+                idle_run_end - 2, previous_top_up if last_top_up == idle_run_end - 1 else last_top_up)
+        water_temp_out_of_solar = water_temp_into_solar
+        energy_captured_by_solar = 0.0
+        average_water_temp = outgoing_water_temp = temp_after_idle_hour(idle_run_end - 1, last_top_up)
+        thermal_energy = water_capacity * average_water_temp * heat_capacity
+        energy_absorbed_from_pipes = 0.0
+        if warmer_than_mains_by_slot[last_slot]:
+            temp_sent_out = consumption_temperature_by_slot[last_slot]
+            volume_sent_out = 0.0
+            energy_sent_out = 0.0
+        else:
+            temp_sent_out = volume_sent_out = energy_sent_out = 0
+        flow_rate = clip_idle_flow_rate(flow_rate * idle_flow_rate_factor ** (idle_run_end - idle_run_start))
+        percent_of_maximum_flow_rate = flow_rate / max_flow_rate
+        dni = 0.0
+
+    interpolated_by_hour = np.zeros(num_hours, dtype=bool)
+    if jumped_idle_runs:
+        # rows inside the idle runs, all runs at once. Row i holds the state after idle hour i - 1
+        run_starts, run_ends, starting_temps, starting_flow_rates, starting_heater_energies = (
+            np.array(values) for values in zip(*jumped_idle_runs))
+        num_rows_inside = run_ends - run_starts - 1
+        rows = np.arange(num_rows_inside.sum()) + np.repeat(run_starts + 1 - np.cumsum(num_rows_inside)
+                                                             + num_rows_inside, num_rows_inside)
+        idle_hours = rows - 1
+        run_start_by_row = np.repeat(run_starts, num_rows_inside)
+        starting_temp_by_row = np.repeat(starting_temps, num_rows_inside)
+
+        all_hours = np.arange(num_hours)
+        topped_up = np.zeros(num_hours, dtype=bool)
+        topped_up[top_up_hours] = True
+        last_top_up_by_hour = np.maximum.accumulate(np.where(topped_up, all_hours, -1))
+        heater_by_hour = np.zeros(num_hours)
+        heater_by_hour[top_up_hours] = top_up_heater_energies
+        temp_used_by_hour = np.asarray(consumption_temperature_by_slot)[consumption_slot_by_hour]
+        warmer_than_mains_by_hour = temp_used_by_hour > external_water_temp
+        last_warmer_hour_by_hour = np.maximum.accumulate(np.where(warmer_than_mains_by_hour, all_hours, -1))
+
+        def temp_after_idle_hours(hours):
+            last_top_up_in_run = last_top_up_by_hour[hours]
+            topped_up_in_run = last_top_up_in_run >= run_start_by_row
+            # decays from the minimum since the last top up, or from the starting temperature if there wasn't one
+            hours_of_decay = hours - np.where(topped_up_in_run, last_top_up_in_run, run_start_by_row - 1)
+            return np.where(topped_up_in_run, minimum_average_water_temp,
+                            starting_temp_by_row) * fraction_kept_per_hour ** hours_of_decay
+
+        average_temp = temp_after_idle_hours(idle_hours)
+        temp_going_into_hour = np.where(idle_hours == run_start_by_row, starting_temp_by_row,
+                                        temp_after_idle_hours(np.maximum(idle_hours - 1, run_start_by_row)))
+        idle_flow_rates = np.repeat(starting_flow_rates, num_rows_inside) * idle_flow_rate_factor ** (
+                idle_hours - run_start_by_row + 1)
+        if 0.0 < min_temp_difference:
+            idle_flow_rates = np.maximum(idle_flow_rates, min_flow_rate)
+        elif 0.0 > max_temp_difference:
+            idle_flow_rates = np.minimum(idle_flow_rates, max_flow_rate)
+        last_warmer_hour = last_warmer_hour_by_hour[idle_hours]
+
+        dni_column[rows] = 0.0
+        temp_into_solar_column[rows] = temp_going_into_hour
+        temp_out_of_solar_column[rows] = temp_going_into_hour
+        energy_captured_column[rows] = 0.0
+        flow_rate_column[rows] = idle_flow_rates
+        percent_flow_rate_column[rows] = idle_flow_rates / max_flow_rate
+        average_temp_column[rows] = average_temp
+        thermal_energy_column[rows] = water_capacity * average_temp * heat_capacity
+        temp_sent_out_column[rows] = np.where(warmer_than_mains_by_hour[idle_hours], temp_used_by_hour[idle_hours],
+                                              0.0)
+        energy_sent_out_column[rows] = 0.0
+        volume_sent_out_column[rows] = 0.0
+        heater_column[rows] = np.where(last_warmer_hour >= run_start_by_row, heater_by_hour[last_warmer_hour],
+                                       np.repeat(starting_heater_energies, num_rows_inside))
+        absorbed_from_pipes_column[rows] = 0.0
+        interpolated_by_hour[rows] = True
+
+    solar_collector._water_temp_in = water_temp_into_solar
+    solar_collector._water_temp_out = water_temp_out_of_solar
+    solar_collector._energy_captured_by_solar = energy_captured_by_solar
+    solar_collector._water_flow_rate = float(flow_rate_column[-1]) if num_hours else solar_collector._water_flow_rate
+
+    water_pump._current_flow_rate = flow_rate
+    water_pump._percent_of_maximum_flow_rate = percent_of_maximum_flow_rate
+
+    water_container._current_average_water_temp = average_water_temp
+    water_container._current_thermal_energy = thermal_energy
+    water_container.outgoing_water_temperature = outgoing_water_temp
+    water_container._volume_of_water_sent_out_of_water_container = volume_sent_out
+    water_container._average_temp_of_water_sent_out_of_water_container = temp_sent_out
+    water_container._energy_sent_out_of_water_container = energy_sent_out
+    water_container._energy_consumed_by_heater = energy_consumed_by_heater
+    water_container._energy_absorbed_from_pipes = energy_absorbed_from_pipes
+
+    return dict(zip(KERNEL_METRIC_COLUMNS, metrics)), interpolated_by_hour
@@ -0,0 +1,127 @@
+import io
+import os
+import re
+import tempfile
+
+from .CONSTANTS import SIMULATION_OUTPUT_BUFFER_MAX_MEMORY_BYTES
+
+
+class SimulationOutputBuffer:
+    """
+    Output CSV of one simulation. Rows are kept in memory until there are more than max_memory_bytes of them, then
+    spill over to a temp file named after the simulation that only this buffer writes to, so simulations running at
+    the same time - in threads or processes - never write to the same file.
+
+    Takes the place of a file for csv.writer, or with make_file_path hands out a file of its own for output written
+    some other way, e.g. Parquet. Once the simulation is done, detach_file_path hands the output over as a file for
+    the result sink, whoever uploads it deletes it afterwards. close() instead throws the output away.
+    """
+    _simulation_uuid: str = None
+    _max_memory_bytes: int = None
+    _directory: str = None
+    _file = None  # io.StringIO until spilled, then the temp file
+    _file_path: str = None  # temp file, None while the rows are in memory
+    _closed: bool = False
+
+    def __init__(self, simulation_uuid, max_memory_bytes: int = SIMULATION_OUTPUT_BUFFER_MAX_MEMORY_BYTES,
+                 directory: str = None):
+        """
+        :param simulation_uuid: goes into the name of the temp file
+        :param max_memory_bytes: 0 to go straight to a temp file
+        :param directory: where temp files go, the system's temp directory if not given
+        """
+        self._simulation_uuid = str(simulation_uuid)
+        self._max_memory_bytes = max_memory_bytes
+        self._directory = directory
+        self._file = io.StringIO()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    @property
+    def file_path(self) -> str:
+        """
+        :return: temp file the rows spilled over to, None while they're in memory
+        """
+        return self._file_path
+
+    def write(self, text: str) -> int:
+        written = self._file.write(text)
+        if self._file_path is None and self._file.tell() > self._max_memory_bytes:
+            self.spill()
+        return written
+
+    def flush(self):
+        self._file.flush()
+
+    def getvalue(self) -> str:
+        """
+        :return: every row written so far
+        """
+        if self._file_path is None:
+            return self._file.getvalue()
+        self._file.flush()
+        with open(self._file_path, newline='') as spilled_file:
+            return spilled_file.read()
+
+    def spill(self):
+        """
+        Moves the rows in memory to a temp file of their own, later rows are written straight to it
+        :return:
+        """
+        if self._file_path is not None:
+            return
+        file_descriptor, file_path = self._make_temp_file(".csv")
+        spilled_file = os.fdopen(file_descriptor, 'w', newline='')
+        spilled_file.write(self._file.getvalue())
+        self._file = spilled_file
+        self._file_path = file_path
+
+    def make_file_path(self, suffix: str) -> str:
+        """
+        Swaps whatever was written so far for an empty temp file of its own, for output that doesn't go through
+        write, e.g. Parquet from MetricsBuffer.write_parquet. detach_file_path and close then apply to that file
+        :param suffix: e.g. ".parquet"
+        :return: path to write the output to
+        """
+        self.close()
+        file_descriptor, self._file_path = self._make_temp_file(suffix)
+        os.close(file_descriptor)
+        self._file = io.StringIO()  # only there to be closed, nothing is written through the buffer any more
+        self._closed = False
+        return self._file_path
+
+    def _make_temp_file(self, suffix: str):
+        """
+        :param suffix:
+        :return: (open file descriptor, path) of a new, empty temp file named after the simulation
+        """
+        # uuids come from requests, only keep characters that are safe in a file name
+        safe_uuid = re.sub(r"[^A-Za-z0-9_-]", "_", self._simulation_uuid)[:64]
+        return tempfile.mkstemp(prefix=f"simulationOutput-{safe_uuid}-", suffix=suffix, dir=self._directory)
+
+    def detach_file_path(self) -> str:
+        """
+        Closes the buffer and hands its rows over as a file, e.g. to upload
+        :return: path of the temp file, the caller deletes it when done with it
+        """
+        self.spill()
+        file_path = self._file_path
+        self._file.close()
+        self._file_path = None
+        self._closed = True
+        return file_path
+
+    def close(self):
+        """
+        Throws the rows away, deleting the temp file if they had spilled over to one
+        :return:
+        """
+        if self._closed:
+            return
+        self._file.close()
+        if self._file_path is not None:
+            os.remove(self._file_path)
+            self._file_path = None
+        self._closed = True
@@ -0,0 +1,110 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from .CONSTANTS import RESULT_CACHE_MAX_ENTRIES
+
+# Request fields that don't change the simulated numbers, left out of the request hash
+FIELDS_NOT_AFFECTING_RESULTS = ("simulation_uuid", "simulation_engine", "result_sink", "result_format", "upload_mode",
+                               "bypass_result_cache", "checkpoint_interval_hours")
+
+
+def make_request_hash(configuration, resolved_fields: dict = None) -> str:
+    """
+    Hashes the canonical form of a request, so requests that would simulate the same thing get the same hash
+    whatever their uuid, key order or number formatting (e.g. 10 and 10.0 once validated)
+    :param configuration: SimulationIncomingRequest, or a SimpleNamespace shaped like one
+    :param resolved_fields: values decided when the request came in, e.g. today's date when no date was given
+    :return: sha256 hex digest
+    """
+    request = configuration.dict() if hasattr(configuration, "dict") else json.loads(
+        json.dumps(configuration, default=vars))
+    for field_name in FIELDS_NOT_AFFECTING_RESULTS:
+        request.pop(field_name, None)
+    request.update(resolved_fields or {})
+    canonical_request = json.dumps(request, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical_request.encode()).hexdigest()
+
+
+class SimulationResultCache:
+    """
+    In memory LRU of finished simulations' hourly metrics, keyed by request hash (see make_request_hash), so a
+    resubmitted request is answered without geocoding, fetching weather or simulating again.
+    """
+    _max_entries: int = None
+    _entries: OrderedDict = None  # request hash -> {"timestamps", "metrics", "metrics_after_last_hour"}
+    _lock: threading.Lock = None
+    hits: int = 0
+    misses: int = 0
+
+    def __init__(self, max_entries: int = RESULT_CACHE_MAX_ENTRIES):
+        self._max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, request_hash: str):
+        """
+        :return: (timestamps as a list of str, metric name -> column of values, metric name -> value once the last
+                 hour has run) or None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(request_hash)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(request_hash)
+            self.hits += 1
+            timestamps = np.datetime_as_string(entry["timestamps"], unit='m').tolist()
+            return timestamps, entry["metrics"], entry["metrics_after_last_hour"]
+
+    def put(self, request_hash: str, timestamps, metrics: dict, metrics_after_last_hour: dict):
+        """
+        :param request_hash:
+        :param timestamps: timestamp logged for each hour
+        :param metrics: metric name -> column of values, copied so the caller's arrays can be reused
+        :param metrics_after_last_hour: metric name -> value, see SimulatedWorld.get_current_metrics
+        """
+        entry = {"timestamps": np.array(timestamps, dtype='datetime64[m]'),
+                 "metrics": {metric_name: np.array(column, dtype=np.float64) for metric_name, column in
+                             metrics.items()},
+                 "metrics_after_last_hour": dict(metrics_after_last_hour)}
+        with self._lock:
+            self._entries[request_hash] = entry
+            self._entries.move_to_end(request_hash)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
+_shared_simulation_result_cache: SimulationResultCache = None
+_shared_simulation_result_cache_lock = threading.Lock()
+
+
+def _forget_simulation_result_cache_in_forked_child():
+    # another thread may have held the cache's lock when the process was forked, the child starts its own cache
+    global _shared_simulation_result_cache, _shared_simulation_result_cache_lock
+    _shared_simulation_result_cache = None
+    _shared_simulation_result_cache_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_simulation_result_cache_in_forked_child)
+
+
+def get_shared_simulation_result_cache() -> SimulationResultCache:
+    """
+    One cache per process, capacity can be overridden with the RESULT_CACHE_MAX_ENTRIES env variable
+    :return:
+    """
+    global _shared_simulation_result_cache
+    with _shared_simulation_result_cache_lock:
+        if _shared_simulation_result_cache is None:
+            _shared_simulation_result_cache = SimulationResultCache(
+                max_entries=int(os.getenv('RESULT_CACHE_MAX_ENTRIES', RESULT_CACHE_MAX_ENTRIES)))
+        return _shared_simulation_result_cache
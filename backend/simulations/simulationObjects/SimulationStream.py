@@ -0,0 +1,194 @@
+import os
+import json
+import time
+import queue
+import threading
+
+from .CONSTANTS import SIMULATION_STREAM_ROWS_PER_BATCH, SIMULATION_STREAM_MAX_QUEUED_EVENTS, \
+    SIMULATION_STREAM_MAX_CONCURRENT
+
+STREAM_EVENT_START = "start"
+STREAM_EVENT_ROWS = "rows"
+STREAM_EVENT_PROGRESS = "progress"
+STREAM_EVENT_DONE = "done"
+STREAM_EVENT_ERROR = "error"
+FINAL_STREAM_EVENTS = (STREAM_EVENT_DONE, STREAM_EVENT_ERROR)
+
+
+class SimulationStreamClosed(Exception):
+    """Raised inside the simulation once nobody is reading the stream any more, to stop it"""
+
+
+class TooManySimulationStreams(Exception):
+    """Raised by SimulationStream.start when as many streams as allowed are already running"""
+
+
+def format_server_sent_event(event_name: str, data: dict) -> str:
+    return f"event: {event_name}\ndata: {json.dumps(data)}\n\n"
+
+
+class SimulationStream:
+    """
+    Runs a simulation on a thread of its own and turns it into a sequence of events for a client to read as it goes:
+        - start: uuid, hours to simulate and the column names of the rows
+        - rows: the next batch of finished hourly rows, [Timestamp, metrics...] each
+        - progress: iteration, iterations per second and seconds left, after each batch of rows
+        - done or error: always the last event
+
+    Events wait in a bounded queue. Once it's full the simulation blocks until the client catches up, so a slow
+    client slows the simulation down rather than filling up memory, and a client that goes away stops it.
+
+    The threads run in the API process alongside the event loop, so only so many streams run at once, see
+    get_shared_simulation_stream_slots.
+    """
+    _world = None  # SimulatedWorld, not imported to keep this module free of the simulation dependencies
+    _events: queue.Queue = None
+    _rows_per_batch: int = None
+    _num_rows_sent: int = 0
+    _sent_start_event: bool = False
+    _start_time: float = None
+    _closed: threading.Event = None
+    _thread: threading.Thread = None
+    _stream_slots: threading.BoundedSemaphore = None  # one taken by each running stream
+
+    def __init__(self, world, rows_per_batch: int = SIMULATION_STREAM_ROWS_PER_BATCH,
+                 max_queued_events: int = SIMULATION_STREAM_MAX_QUEUED_EVENTS,
+                 stream_slots: threading.BoundedSemaphore = None):
+        """
+        :param world: SimulatedWorld that hasn't run yet
+        :param rows_per_batch: hourly rows per rows event
+        :param max_queued_events: events waiting for the client before the simulation blocks
+        :param stream_slots: limits how many streams run at once, defaults to the ones shared by the process
+        """
+        self._world = world
+        self._events = queue.Queue(maxsize=max_queued_events)
+        self._rows_per_batch = rows_per_batch
+        self._closed = threading.Event()
+        self._stream_slots = stream_slots or get_shared_simulation_stream_slots()
+        self._world.set_progress_callback(self.report_progress)
+
+    def start(self):
+        """
+        :raises TooManySimulationStreams: no slot free, the world won't run so its output buffer is closed
+        """
+        if not self._stream_slots.acquire(blocking=False):
+            self._world._output_buffer.close()
+            raise TooManySimulationStreams("Too many simulations are being streamed, try again later or submit a "
+                                           "simulation job instead")
+        self._thread = threading.Thread(target=self.run_in_slot, daemon=True)
+        self._thread.start()
+
+    def run_in_slot(self):
+        try:
+            self.run()
+        finally:
+            self._stream_slots.release()
+
+    def run(self):
+        """
+        Runs the whole simulation including the results upload, publishing as it goes. The world's output buffer is
+        closed however the run ends, if it wasn't already handed over to the upload
+        :return:
+        """
+        self._start_time = time.time()
+        try:
+            self._world.run_entire_simulation()
+            self._world.wait_for_results_upload()
+            self._publish(STREAM_EVENT_DONE, {
+                "simulation_uuid": str(self._world._simulation_uuid),
+                "num_hours_simulated": self._world._num_hours_to_simulate,
+                "served_from_result_cache": self._world._served_from_result_cache,
+                "resumed_from_checkpoint": self._world._resumed_from_checkpoint,
+                "seconds_elapsed": round(time.time() - self._start_time, 3)})
+        except SimulationStreamClosed:
+            print(f"Stream of simulation {self._world._simulation_uuid} closed, stopped simulating")
+        except Exception as e:
+            print(f'Streamed simulation failed with exception {str(e)}')
+            try:
+                self._publish(STREAM_EVENT_ERROR, {
+                    "exception": str(e),
+                    "message": "Simulation encoutered the following critical exception that stopped successful "
+                               "simulation run"})
+            except SimulationStreamClosed:
+                pass
+        finally:
+            self._world._output_buffer.close()
+
+    def report_progress(self, iteration: int, total: int):
+        """
+        Progress callback for the world, publishes every full batch of rows logged so far and all of them at the end
+        :param iteration: hours simulated
+        :param total: hours to simulate
+        :return:
+        """
+        metrics_buffer = self._world._metrics_buffer
+        if not self._sent_start_event:
+            self._publish(STREAM_EVENT_START, {"simulation_uuid": str(self._world._simulation_uuid),
+                                               "num_hours_to_simulate": total,
+                                               "columns": self._world._header_as_list_for_output_file[1:]})
+            self._sent_start_event = True
+
+        num_rows_logged = min(iteration, metrics_buffer.num_rows)
+        is_finished = iteration >= total
+        if num_rows_logged - self._num_rows_sent < self._rows_per_batch and not is_finished:
+            return
+
+        while self._num_rows_sent < num_rows_logged:
+            end_row = min(self._num_rows_sent + self._rows_per_batch, num_rows_logged)
+            self._publish(STREAM_EVENT_ROWS, {"first_row": self._num_rows_sent,
+                                              "rows": metrics_buffer.get_rows(self._num_rows_sent, end_row)})
+            self._num_rows_sent = end_row
+            if not is_finished:
+                break
+
+        seconds_elapsed = max(time.time() - self._start_time, 1e-9)
+        iterations_per_second = iteration / seconds_elapsed
+        self._publish(STREAM_EVENT_PROGRESS, {
+            "iteration": iteration, "total": total,
+            "percent_complete": round(100 * iteration / total, 2) if total else 100,
+            "iterations_per_second": round(iterations_per_second, 2),
+            "eta_seconds": round((total - iteration) / iterations_per_second, 3) if iterations_per_second else None})
+
+    def get_event(self, timeout: float = None):
+        """
+        :param timeout: seconds to wait for the next event
+        :return: (event name, data) or None if nothing came within the timeout
+        """
+        try:
+            return self._events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        """
+        Stops the simulation the next time it publishes, for when the client has gone away
+        :return:
+        """
+        self._closed.set()
+
+    def _publish(self, event_name: str, data: dict):
+        # waits for room in the queue, checking every so often whether the client is still there
+        while not self._closed.is_set():
+            try:
+                self._events.put((event_name, data), timeout=0.1)
+                return
+            except queue.Full:
+                continue
+        raise SimulationStreamClosed()
+
+
+_shared_simulation_stream_slots: threading.BoundedSemaphore = None
+_shared_simulation_stream_slots_lock = threading.Lock()
+
+
+def get_shared_simulation_stream_slots() -> threading.BoundedSemaphore:
+    """
+    One set of slots per process, how many can be overridden with the SIMULATION_STREAM_MAX_CONCURRENT env variable
+    :return:
+    """
+    global _shared_simulation_stream_slots
+    with _shared_simulation_stream_slots_lock:
+        if _shared_simulation_stream_slots is None:
+            _shared_simulation_stream_slots = threading.BoundedSemaphore(
+                int(os.getenv('SIMULATION_STREAM_MAX_CONCURRENT', SIMULATION_STREAM_MAX_CONCURRENT)))
+        return _shared_simulation_stream_slots
@@ -2,14 +2,21 @@ from .CONSTANTS import SPECIFIC_HEAT_CAPACITY_OF_WATER
 from .ConfigurationInputs import SolarInput
 
 class SolarCollector:
-    _surface_area: float = None  # m^2
-    _water_temp_in: float = 0  # ºC
-    _water_temp_out: float = 0  # ºC
-    _water_flow_rate: float = 0  # L/min rate
-    _energy_captured_by_solar: float = 0  # Watts
-    _solar_efficiency: float = None  # give as a decimal, e.g. 0.05 for 5%
+    # slots instead of a __dict__ per instance, a parameter sweep holds one collector per configuration
+    __slots__ = ("_surface_area", "_water_temp_in", "_water_temp_out", "_water_flow_rate", "_energy_captured_by_solar",
+                 "_solar_efficiency")
+    _surface_area: float  # m^2
+    _water_temp_in: float  # ºC
+    _water_temp_out: float  # ºC
+    _water_flow_rate: float  # L/min rate
+    _energy_captured_by_solar: float  # Watts
+    _solar_efficiency: float  # give as a decimal, e.g. 0.05 for 5%
 
     def __init__(self, config: SolarInput):
+        self._water_temp_in = 0
+        self._water_temp_out = 0
+        self._water_flow_rate = 0
+        self._energy_captured_by_solar = 0
         try:
             self._surface_area = config.length * config.width
             self._solar_efficiency = config.solar_efficiency
@@ -71,6 +78,32 @@ class SolarCollector:
                 "solar_efficiency": self._solar_efficiency
                 }
 
+    def get_loggable_metric_values(self):
+        """
+        Same values as get_loggable_metrics in the same order, without building a dict every hour
+        :return: tuple of metric values
+        """
+        return self._water_temp_in, self._water_temp_out, self._energy_captured_by_solar, self._solar_efficiency
+
+    def get_state(self) -> dict:
+        """
+        Everything that changes as the simulation runs, JSON serializable, see set_state
+        :return:
+        """
+        return {"water_temp_in": self._water_temp_in, "water_temp_out": self._water_temp_out,
+                "water_flow_rate": self._water_flow_rate, "energy_captured_by_solar": self._energy_captured_by_solar}
+
+    def set_state(self, state: dict):
+        """
+        Carries on from a state saved with get_state, by a collector built from the same config
+        :param state:
+        :return:
+        """
+        self._water_temp_in = state["water_temp_in"]
+        self._water_temp_out = state["water_temp_out"]
+        self._water_flow_rate = state["water_flow_rate"]
+        self._energy_captured_by_solar = state["energy_captured_by_solar"]
+
     def __hash__(self):
         """
         Just so I can use this obj as a key in dict
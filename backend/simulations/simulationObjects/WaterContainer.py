@@ -1,28 +1,172 @@
-from .CONSTANTS import SPECIFIC_HEAT_CAPACITY_OF_WATER
-from .ConfigurationInputs import WaterContainerInput
+import json
+import calendar
+import functools
 from types import SimpleNamespace
+from datetime import date, datetime
+
+import numpy as np
+from pydantic import BaseModel
+
+from .CONSTANTS import SPECIFIC_HEAT_CAPACITY_OF_WATER, HOURS_IN_LEAP_YEAR, CONSUMPTION_SCHEDULE_CACHE_SIZE
+from .ConfigurationInputs import WaterContainerInput
+
+# fields of WaterContainerInput that compile_consumption_schedule reads
+CONSUMPTION_PROFILE_FIELDS = ("consumption_pattern", "weekend_consumption_pattern", "monthly_consumption_patterns",
+                              "holiday_consumption_pattern", "holidays")
+
+
+def compile_consumption_pattern(consumption_pattern):
+    """
+    Turns a consumption pattern keyed by "HH:00" into two 24 slot tables indexed by hour of day
+    :param consumption_pattern: dict or SimpleNamespace of ConsumptionPatternOneHour, see WaterContainerInput
+    :return: (volume of water used per hour in L, average temperature of water used per hour in ºC)
+    """
+    if not isinstance(consumption_pattern, dict):
+        consumption_pattern = vars(consumption_pattern)
+    missing_hours = [f"{hour:02d}:00" for hour in range(24) if f"{hour:02d}:00" not in consumption_pattern]
+    if missing_hours:
+        raise KeyError(f"Consumption pattern has no entry for {', '.join(missing_hours)}")
+    volume_by_hour = np.empty(24)
+    temperature_by_hour = np.empty(24)
+    for hour in range(24):
+        hour_usage_info = consumption_pattern[f"{hour:02d}:00"]
+        volume_by_hour[hour] = hour_usage_info.water_used
+        temperature_by_hour[hour] = hour_usage_info.average_temperature_of_water_used
+    return volume_by_hour, temperature_by_hour
+
+
+def compile_consumption_schedule(config: WaterContainerInput, calendar_year: int) -> np.ndarray:
+    """
+    Expands the consumption patterns of a water container config into one (L of water used, ºC of water used) pair
+    for every hour of year slot, see HourOfYearClimatology. Each day uses the most specific pattern it has: holiday,
+    weekend, month, then the default consumption_pattern.
+    :param config: WaterContainerInput or the SimpleNamespace equivalent
+    :param calendar_year: year whose weekdays the weekends are worked out from, 29-Feb follows 28-Feb
+    :return: float32 array of shape (HOURS_IN_LEAP_YEAR, 2)
+    """
+    def as_dict(value):
+        return value if value is None or isinstance(value, dict) else vars(value)
+
+    month_names = list(calendar.month_name)[1:]
+    monthly_patterns = as_dict(getattr(config, "monthly_consumption_patterns", None)) or {}
+    unknown_months = [month_name for month_name in monthly_patterns if month_name not in month_names]
+    if unknown_months:
+        raise KeyError(f"Monthly consumption patterns are keyed by month name, e.g. July, got {unknown_months}")
+
+    holiday_pattern = getattr(config, "holiday_consumption_pattern", None)
+    holidays = set(getattr(config, "holidays", None) or [])
+    if holidays and holiday_pattern is None:
+        raise KeyError("Holidays given without a holiday_consumption_pattern")
+    for holiday in holidays:
+        try:
+            datetime.strptime(f"2000-{holiday}", "%Y-%m-%d")
+        except ValueError:
+            raise KeyError(f"Holidays are MM-DD dates, e.g. 12-25, got {holiday}")
+
+    # one 24 x 2 table per pattern, then which table each of the 366 days uses
+    tables = [np.stack(compile_consumption_pattern(config.consumption_pattern), axis=1)]
+
+    def add_table(consumption_pattern):
+        if consumption_pattern is None:
+            return None
+        tables.append(np.stack(compile_consumption_pattern(consumption_pattern), axis=1))
+        return len(tables) - 1
+
+    table_by_month = {month_names.index(month_name) + 1: add_table(consumption_pattern)
+                      for month_name, consumption_pattern in monthly_patterns.items()}
+    weekend_table = add_table(getattr(config, "weekend_consumption_pattern", None))
+    holiday_table = add_table(holiday_pattern)
+
+    table_by_day = []
+    for month in range(1, 13):
+        for day in range(1, calendar.monthrange(2000, month)[1] + 1):
+            if calendar.isleap(calendar_year) or (month, day) != (2, 29):
+                weekday = date(calendar_year, month, day).weekday()
+            else:
+                weekday = (date(calendar_year, 2, 28).weekday() + 1) % 7
+            if f"{month:02d}-{day:02d}" in holidays:
+                table_by_day.append(holiday_table)
+            elif weekday >= 5 and weekend_table is not None:
+                table_by_day.append(weekend_table)
+            else:
+                table_by_day.append(table_by_month.get(month, 0))
+
+    schedule = np.stack(tables)[table_by_day].reshape(HOURS_IN_LEAP_YEAR, 2)
+    return schedule.astype(np.float32)
+
+
+def get_consumption_schedule(config: WaterContainerInput, calendar_year: int) -> np.ndarray:
+    """
+    compile_consumption_schedule, but containers with the same consumption profiles (e.g. the members of a parameter
+    sweep) share one read only array instead of each holding their own
+    :param config: WaterContainerInput or the SimpleNamespace equivalent
+    :param calendar_year:
+    :return: read only float32 array of shape (HOURS_IN_LEAP_YEAR, 2)
+    """
+    if isinstance(config, BaseModel):
+        profiles = config.model_dump(include=set(CONSUMPTION_PROFILE_FIELDS))
+    else:
+        profiles = {field: getattr(config, field, None) for field in CONSUMPTION_PROFILE_FIELDS}
+    profiles_key = json.dumps(profiles, sort_keys=True, default=vars)
+    return _get_consumption_schedule_for_key(profiles_key, calendar_year)
+
+
+@functools.lru_cache(maxsize=CONSUMPTION_SCHEDULE_CACHE_SIZE)
+def _get_consumption_schedule_for_key(profiles_key: str, calendar_year: int) -> np.ndarray:
+    profiles = json.loads(profiles_key, object_hook=lambda value: SimpleNamespace(**value))
+    schedule = compile_consumption_schedule(profiles, calendar_year)
+    schedule.setflags(write=False)
+    return schedule
+
 
 class WaterContainer:
-    _water_capacity: float = None  # capacity in L
-    _current_average_water_temp: float = 50  # 50ºC is # considered safe temp to prevent bacteria growth - start value
-    _current_thermal_energy: float = None
-    _percent_of_thermal_energy_absorbed_from_pipes: float = None  # % expressed as float, e.g. 5% is 0.05
-    _percent_of_thermal_energy_lost_to_waste_per_hour: float = None  # % expressed as float, e.g. 5% is 0.05
-    _temperature_of_external_water_source: float = None  # ºC
-    outgoing_water_temperature = _current_average_water_temp
-    _volume_of_water_sent_out_of_water_container: float = 0  # L
-    _average_temp_of_water_sent_out_of_water_container: float = 0  # ºC
-    _energy_sent_out_of_water_container: float = 0  # ºC
-    _efficiency_of_traditional_boiler: float = None  # % expressed as float, e.g. 5% is 0.05
-    _energy_consumed_by_heater: float = 0  # J used over last hour
-    _minimum_average_water_temp: float = 50  # ºC floor temp of water to prevent bacteria growth
-    _energy_absorbed_from_pipes: float = 0  # J energy over last hour
-
-    _consumption_pattern: dict = None  # dict of time of day as key, value is another dict with water temp (ºC) and water volume (L)
+    # slots instead of a __dict__ per instance, a parameter sweep holds one container per configuration
+    __slots__ = ("_water_capacity", "_current_average_water_temp", "_current_thermal_energy",
+                 "_percent_of_thermal_energy_absorbed_from_pipes", "_percent_of_thermal_energy_lost_to_waste_per_hour",
+                 "_temperature_of_external_water_source", "outgoing_water_temperature",
+                 "_volume_of_water_sent_out_of_water_container", "_average_temp_of_water_sent_out_of_water_container",
+                 "_energy_sent_out_of_water_container", "_efficiency_of_traditional_boiler",
+                 "_energy_consumed_by_heater", "_minimum_average_water_temp", "_energy_absorbed_from_pipes",
+                 "_consumption_pattern", "_consumption_by_hour_of_year", "_consumption_volume_by_hour_of_year",
+                 "_consumption_temperature_by_hour_of_year")
+    _water_capacity: float  # capacity in L
+    _current_average_water_temp: float  # 50ºC is # considered safe temp to prevent bacteria growth - start value
+    _current_thermal_energy: float
+    _percent_of_thermal_energy_absorbed_from_pipes: float  # % expressed as float, e.g. 5% is 0.05
+    _percent_of_thermal_energy_lost_to_waste_per_hour: float  # % expressed as float, e.g. 5% is 0.05
+    _temperature_of_external_water_source: float  # ºC
+    outgoing_water_temperature: float
+    _volume_of_water_sent_out_of_water_container: float  # L
+    _average_temp_of_water_sent_out_of_water_container: float  # ºC
+    _energy_sent_out_of_water_container: float  # ºC
+    _efficiency_of_traditional_boiler: float  # % expressed as float, e.g. 5% is 0.05
+    _energy_consumed_by_heater: float  # J used over last hour
+    _minimum_average_water_temp: float  # ºC floor temp of water to prevent bacteria growth
+    _energy_absorbed_from_pipes: float  # J energy over last hour
+
+    _consumption_pattern: dict  # dict of time of day as key, value is another dict with water temp (ºC) and water volume (L)
 
     #                                    e.g. {"01:00":{"water_used":10, "average_temperature_of_water_used":50}}
-
-    def __init__(self, config: WaterContainerInput):
+    # consumption patterns compiled at construction into (L, ºC) for each hour of year, shared read only with other
+    # containers using the same patterns, see get_consumption_schedule. The memoryviews read single values out of it
+    # as plain floats
+    _consumption_by_hour_of_year: np.ndarray
+    _consumption_volume_by_hour_of_year: memoryview  # L
+    _consumption_temperature_by_hour_of_year: memoryview  # ºC
+
+    def __init__(self, config: WaterContainerInput, calendar_year: int = None):
+        """
+        :param config:
+        :param calendar_year: year the simulation runs in, for weekends. Defaults to this year
+        """
+        self._current_average_water_temp = 50
+        self.outgoing_water_temperature = self._current_average_water_temp
+        self._volume_of_water_sent_out_of_water_container = 0
+        self._average_temp_of_water_sent_out_of_water_container = 0
+        self._energy_sent_out_of_water_container = 0
+        self._energy_consumed_by_heater = 0
+        self._minimum_average_water_temp = 50
+        self._energy_absorbed_from_pipes = 0
         try:
             self._water_capacity = config.water_capacity
             self._percent_of_thermal_energy_lost_to_waste_per_hour = config.percent_of_thermal_energy_lost_to_waste_per_hour
@@ -32,6 +176,10 @@ class WaterContainer:
             self._efficiency_of_traditional_boiler = config.efficiency_of_traditional_boiler
             self._minimum_average_water_temp = config.minimum_average_water_temperature
             self._consumption_pattern = config.consumption_pattern
+            self._consumption_by_hour_of_year = get_consumption_schedule(
+                config, calendar_year if calendar_year is not None else datetime.now().year)
+            self._consumption_volume_by_hour_of_year = memoryview(self._consumption_by_hour_of_year[:, 0])
+            self._consumption_temperature_by_hour_of_year = memoryview(self._consumption_by_hour_of_year[:, 1])
         except KeyError as e:
             raise KeyError("Incorrect config passed to WaterContainer", e)
 
@@ -49,28 +197,21 @@ class WaterContainer:
             "energy_absorbed_from_pipes":self._energy_absorbed_from_pipes
         }
 
-    def process_energy_outflow_for_hour_of_day(self, current_hour_of_day):
-        try:
-            # print(f"current hour usage info {self._consumption_pattern.current_hour_of_day}")
-
-            # typecheck below to get around differences between test and real request
-            current_hour_usage_info = None
-            if isinstance(self._consumption_pattern, SimpleNamespace):
-                current_hour_usage_info = vars(self._consumption_pattern)[current_hour_of_day]
-            else:
-                current_hour_usage_info = self._consumption_pattern[current_hour_of_day]
-
-            print(current_hour_usage_info)
-
+    def get_loggable_metric_values(self):
+        return (self._current_average_water_temp, self._current_thermal_energy,
+                self._average_temp_of_water_sent_out_of_water_container, self._energy_sent_out_of_water_container,
+                self._volume_of_water_sent_out_of_water_container, self._energy_consumed_by_heater,
+                self._energy_absorbed_from_pipes)
 
-            if current_hour_usage_info is None:
-                    raise KeyError()
-            self._volume_of_water_sent_out_of_water_container = current_hour_usage_info.water_used
-            self._average_temp_of_water_sent_out_of_water_container = current_hour_usage_info.average_temperature_of_water_used
-        except AttributeError as e:
-            AttributeError(f"Consumption pattern of WaterContainer not defined for {current_hour_of_day}", e)
-        print(current_hour_of_day)
-        litres_of_hot_water_lost = self.process_hot_water_leaving_water_container(
+    def process_energy_outflow_for_hour_of_year(self, hour_of_year: int):
+        """
+        :param hour_of_year: see HourOfYearClimatology.hour_of_year_index
+        :return:
+        """
+        self._volume_of_water_sent_out_of_water_container = self._consumption_volume_by_hour_of_year[hour_of_year]
+        self._average_temp_of_water_sent_out_of_water_container = \
+            self._consumption_temperature_by_hour_of_year[hour_of_year]
+        self.process_hot_water_leaving_water_container(
             self._volume_of_water_sent_out_of_water_container, self._average_temp_of_water_sent_out_of_water_container)
 
     def process_hot_water_leaving_water_container(self, outgoing_water_amount, outgoing_water_temp):
@@ -106,7 +247,7 @@ class WaterContainer:
             else:  # no heater needed and still above optimal temp
                 self._energy_consumed_by_heater = 0
 
-    def run_hour_of_usage(self, temp_in_pipes, flow_rate_in_pipes, current_hour_of_day):
+    def run_hour_of_usage(self, temp_in_pipes, flow_rate_in_pipes, hour_of_year: int):
 
         difference_in_temp = temp_in_pipes - self._current_average_water_temp
 
@@ -133,11 +274,40 @@ class WaterContainer:
         self.set_current_thermal_energy()
 
         # Apply usage pattern and rules (e.g. minimum temperature of the tank
-        self.process_energy_outflow_for_hour_of_day(current_hour_of_day=current_hour_of_day)
+        self.process_energy_outflow_for_hour_of_year(hour_of_year)
 
         # At the end of the hour, outgoing and current average sync up
         self.outgoing_water_temperature = self._current_average_water_temp
 
+    def get_state(self) -> dict:
+        """
+        Everything that changes as the simulation runs, JSON serializable, see set_state
+        :return:
+        """
+        return {"current_average_water_temp": self._current_average_water_temp,
+                "current_thermal_energy": self._current_thermal_energy,
+                "outgoing_water_temperature": self.outgoing_water_temperature,
+                "volume_of_water_sent_out": self._volume_of_water_sent_out_of_water_container,
+                "average_temp_of_water_sent_out": self._average_temp_of_water_sent_out_of_water_container,
+                "energy_sent_out": self._energy_sent_out_of_water_container,
+                "energy_consumed_by_heater": self._energy_consumed_by_heater,
+                "energy_absorbed_from_pipes": self._energy_absorbed_from_pipes}
+
+    def set_state(self, state: dict):
+        """
+        Carries on from a state saved with get_state, by a container built from the same config
+        :param state:
+        :return:
+        """
+        self._current_average_water_temp = state["current_average_water_temp"]
+        self._current_thermal_energy = state["current_thermal_energy"]
+        self.outgoing_water_temperature = state["outgoing_water_temperature"]
+        self._volume_of_water_sent_out_of_water_container = state["volume_of_water_sent_out"]
+        self._average_temp_of_water_sent_out_of_water_container = state["average_temp_of_water_sent_out"]
+        self._energy_sent_out_of_water_container = state["energy_sent_out"]
+        self._energy_consumed_by_heater = state["energy_consumed_by_heater"]
+        self._energy_absorbed_from_pipes = state["energy_absorbed_from_pipes"]
+
 
     def __hash__(self):
         """
@@ -2,16 +2,24 @@ from .ConfigurationInputs import WaterPumpInput
 
 
 class WaterPump:
-    _min_flow_rate: float = 0
-    _max_flow_rate: float = None
-    _current_flow_rate: float = None
-    _percent_of_maximum_flow_rate: float = 0
-    _minimum_temp_difference_between_water_incoming_and_outgoing_solar = 2
-    _maximum_temp_difference_between_water_incoming_and_outgoing_solar = 15  # ºC, a proxy for how fast the pump should work
-    _flow_rate_increase_factor: float = 1.20  # how much to increase flow rate over 1 hour, e.g. 15% faster is 1.15
-    _flow_rate_decrease_factor: float = 0.7  # how much to decrease flow rate over 1 hour, e.g. 30% slower is 0.7
+    # slots instead of a __dict__ per instance, a parameter sweep holds one pump per configuration
+    __slots__ = ("_min_flow_rate", "_max_flow_rate", "_current_flow_rate", "_percent_of_maximum_flow_rate",
+                 "_minimum_temp_difference_between_water_incoming_and_outgoing_solar",
+                 "_maximum_temp_difference_between_water_incoming_and_outgoing_solar", "_flow_rate_increase_factor",
+                 "_flow_rate_decrease_factor")
+    _min_flow_rate: float
+    _max_flow_rate: float
+    _current_flow_rate: float
+    _percent_of_maximum_flow_rate: float
+    _minimum_temp_difference_between_water_incoming_and_outgoing_solar: float
+    _maximum_temp_difference_between_water_incoming_and_outgoing_solar: float  # ºC, a proxy for how fast the pump should work
+    _flow_rate_increase_factor: float  # how much to increase flow rate over 1 hour, e.g. 15% faster is 1.15
+    _flow_rate_decrease_factor: float  # how much to decrease flow rate over 1 hour, e.g. 30% slower is 0.7
 
     def __init__(self, config: WaterPumpInput):
+        self._percent_of_maximum_flow_rate = 0
+        self._flow_rate_increase_factor = 1.20
+        self._flow_rate_decrease_factor = 0.7
         try:
             self._min_flow_rate = 0.5  # 0.5 L/min hardcoded because I have no idea if this is a real thing
             self._max_flow_rate = config.max_flow_rate
@@ -58,6 +66,30 @@ class WaterPump:
             "percent_water_pump_flow_rate_used": self._percent_of_maximum_flow_rate
         }
 
+    def get_loggable_metric_values(self):
+        """
+        Same values as get_loggable_metrics in the same order, without building a dict every hour
+        :return: tuple of metric values
+        """
+        return self._current_flow_rate, self._percent_of_maximum_flow_rate
+
+    def get_state(self) -> dict:
+        """
+        Everything that changes as the simulation runs, JSON serializable, see set_state
+        :return:
+        """
+        return {"current_flow_rate": self._current_flow_rate,
+                "percent_of_maximum_flow_rate": self._percent_of_maximum_flow_rate}
+
+    def set_state(self, state: dict):
+        """
+        Carries on from a state saved with get_state, by a pump built from the same config
+        :param state:
+        :return:
+        """
+        self._current_flow_rate = state["current_flow_rate"]
+        self._percent_of_maximum_flow_rate = state["percent_of_maximum_flow_rate"]
+
     def __hash__(self):
         """
         Just so I can use this obj as a key in dict
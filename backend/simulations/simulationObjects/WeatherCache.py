@@ -0,0 +1,228 @@
+import os
+import time
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from .CONSTANTS import WEATHER_CACHE_DIRECTORY, WEATHER_CACHE_GRID_SIZE_DEGREES, WEATHER_CACHE_TIME_TO_LIVE_SECONDS, \
+    WEATHER_CACHE_MAX_DISK_BYTES, WEATHER_CACHE_MAX_MEMORY_BYTES
+
+
+class WeatherCache:
+    """
+    Read-through cache for hourly DNI history, sits in front of the Open Meteo call in SimulatedWorld.
+
+    Two tiers:
+        - memory: LRU of recently used entries, bounded by bytes held
+        - disk: one pair of .npy files per entry (int64 minutes since epoch + float32 DNI) that get memory-mapped
+                on read, bounded by total bytes on disk and evicted least recently used first
+
+    Entries are keyed on lat/long snapped to a grid plus the date range, so nearby addresses share the same history.
+    Both tiers expire entries older than the time to live.
+    """
+    _cache_directory: str = None
+    _grid_size_degrees: float = None
+    _time_to_live_seconds: float = None
+    _max_disk_bytes: int = None
+    _max_memory_bytes: int = None
+    _memory_tier: OrderedDict = None  # key -> (time stored, timestamps, DNI values)
+    _memory_tier_bytes: int = 0
+    _lock: threading.Lock = None
+    memory_hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    expirations: int = 0
+    evictions: int = 0
+
+    def __init__(self, cache_directory: str = WEATHER_CACHE_DIRECTORY,
+                 grid_size_degrees: float = WEATHER_CACHE_GRID_SIZE_DEGREES,
+                 time_to_live_seconds: float = WEATHER_CACHE_TIME_TO_LIVE_SECONDS,
+                 max_disk_bytes: int = WEATHER_CACHE_MAX_DISK_BYTES,
+                 max_memory_bytes: int = WEATHER_CACHE_MAX_MEMORY_BYTES):
+        if grid_size_degrees <= 0:
+            raise ValueError("Weather cache grid size must be a positive number of degrees")
+        self._cache_directory = cache_directory
+        self._grid_size_degrees = grid_size_degrees
+        self._time_to_live_seconds = time_to_live_seconds
+        self._max_disk_bytes = max_disk_bytes
+        self._max_memory_bytes = max_memory_bytes
+        self._memory_tier = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(self._cache_directory, exist_ok=True)
+
+    def make_key(self, latitude: float, longitude: float, start_date: str, end_date: str) -> str:
+        """
+        Snaps coordinates to the grid so any address within the same cell maps to the same entry
+        :return: key that is also safe to use as a file name
+        """
+        grid_decimals = max(0, -int(np.floor(np.log10(self._grid_size_degrees))) + 1)
+        snapped_latitude = round(latitude / self._grid_size_degrees) * self._grid_size_degrees + 0.0  # no -0.0
+        snapped_longitude = round(longitude / self._grid_size_degrees) * self._grid_size_degrees + 0.0
+        return f"lat{snapped_latitude:.{grid_decimals}f}_lon{snapped_longitude:.{grid_decimals}f}_{start_date}_{end_date}"
+
+    def get(self, latitude: float, longitude: float, start_date: str, end_date: str):
+        """
+        :return: (datetime64[m] timestamps, float32 DNI values) or None on a miss
+        """
+        key = self.make_key(latitude, longitude, start_date, end_date)
+        now = time.time()
+
+        with self._lock:
+            expired_in_memory = False
+            entry = self._memory_tier.get(key)
+            if entry is not None:
+                stored_at, timestamps, dni_values = entry
+                if now - stored_at <= self._time_to_live_seconds:
+                    self._memory_tier.move_to_end(key)
+                    self._mark_disk_entry_used(key, now, stored_at)
+                    self.memory_hits += 1
+                    return timestamps, dni_values
+                self._remove_from_memory_tier(key)
+                self.expirations += 1
+                expired_in_memory = True
+
+            timestamps_path, dni_path = self._paths_for_key(key)
+            try:
+                stored_at = os.path.getmtime(dni_path)
+                if now - stored_at > self._time_to_live_seconds:
+                    self._remove_from_disk_tier(key)
+                    if not expired_in_memory:  # one expiration per lookup, however many tiers held the entry
+                        self.expirations += 1
+                    self.misses += 1
+                    return None
+                timestamps = np.load(timestamps_path, mmap_mode='r').view('datetime64[m]')
+                dni_values = np.load(dni_path, mmap_mode='r')
+            except (OSError, ValueError):
+                self.misses += 1
+                return None
+
+            self._mark_disk_entry_used(key, now, stored_at)
+            self.disk_hits += 1
+            self._add_to_memory_tier(key, stored_at, timestamps, dni_values)
+            return timestamps, dni_values
+
+    def put(self, latitude: float, longitude: float, start_date: str, end_date: str, timestamps, dni_values):
+        key = self.make_key(latitude, longitude, start_date, end_date)
+        timestamps = np.asarray(timestamps, dtype='datetime64[m]')
+        dni_values = np.asarray(dni_values, dtype=np.float32)
+        now = time.time()
+
+        with self._lock:
+            for path, values in zip(self._paths_for_key(key), (timestamps.view(np.int64), dni_values)):
+                # write then rename so a concurrent reader never maps a half written file
+                file_descriptor, temporary_path = tempfile.mkstemp(dir=self._cache_directory, suffix=".tmp")
+                with os.fdopen(file_descriptor, 'wb') as temporary_file:
+                    np.save(temporary_file, values)
+                os.replace(temporary_path, path)
+            self._add_to_memory_tier(key, now, timestamps, dni_values)
+            self._evict_disk_tier_to_size()
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            return {"memory_hits": self.memory_hits,
+                    "disk_hits": self.disk_hits,
+                    "misses": self.misses,
+                    "expirations": self.expirations,
+                    "evictions": self.evictions,
+                    "memory_entries": len(self._memory_tier),
+                    "memory_bytes": self._memory_tier_bytes}
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._memory_tier.keys()):
+                self._remove_from_memory_tier(key)
+            for key in self._disk_keys():
+                self._remove_from_disk_tier(key)
+
+    def _paths_for_key(self, key: str):
+        return (os.path.join(self._cache_directory, f"{key}.timestamps.npy"),
+                os.path.join(self._cache_directory, f"{key}.dni.npy"))
+
+    def _disk_keys(self):
+        return [file_name[:-len(".dni.npy")] for file_name in os.listdir(self._cache_directory)
+                if file_name.endswith(".dni.npy")]
+
+    def _add_to_memory_tier(self, key, stored_at, timestamps, dni_values):
+        if key in self._memory_tier:
+            self._remove_from_memory_tier(key)
+        self._memory_tier[key] = (stored_at, timestamps, dni_values)
+        self._memory_tier_bytes += timestamps.nbytes + dni_values.nbytes
+        while self._memory_tier_bytes > self._max_memory_bytes and len(self._memory_tier) > 1:
+            self._remove_from_memory_tier(next(iter(self._memory_tier)))
+            self.evictions += 1
+
+    def _remove_from_memory_tier(self, key):
+        _, timestamps, dni_values = self._memory_tier.pop(key)
+        self._memory_tier_bytes -= timestamps.nbytes + dni_values.nbytes
+
+    def _mark_disk_entry_used(self, key, now, stored_at):
+        # access time tracks recency for eviction, modification time stays as the time stored for expiry
+        for path in self._paths_for_key(key):
+            try:
+                os.utime(path, (now, stored_at))
+            except FileNotFoundError:
+                pass
+
+    def _remove_from_disk_tier(self, key):
+        for path in self._paths_for_key(key):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _evict_disk_tier_to_size(self):
+        entries = []
+        total_bytes = 0
+        for key in self._disk_keys():
+            try:
+                sizes_and_access_times = [(os.path.getsize(path), os.path.getatime(path))
+                                          for path in self._paths_for_key(key)]
+            except OSError:
+                continue
+            entry_bytes = sum(size for size, _ in sizes_and_access_times)
+            entries.append((max(access_time for _, access_time in sizes_and_access_times), entry_bytes, key))
+            total_bytes += entry_bytes
+
+        for _, entry_bytes, key in sorted(entries):  # least recently used first
+            if total_bytes <= self._max_disk_bytes:
+                break
+            self._remove_from_disk_tier(key)
+            if key in self._memory_tier:
+                self._remove_from_memory_tier(key)
+            total_bytes -= entry_bytes
+            self.evictions += 1
+
+
+_shared_weather_cache: WeatherCache = None
+_shared_weather_cache_lock = threading.Lock()
+
+
+def _forget_weather_cache_in_forked_child():
+    # another thread may have held the cache's lock when the process was forked, the child starts its own cache
+    global _shared_weather_cache, _shared_weather_cache_lock
+    _shared_weather_cache = None
+    _shared_weather_cache_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_weather_cache_in_forked_child)
+
+
+def get_shared_weather_cache() -> WeatherCache:
+    """
+    One cache per process so every simulation benefits from the others, settings can be overridden by env variables
+    :return:
+    """
+    global _shared_weather_cache
+    with _shared_weather_cache_lock:
+        if _shared_weather_cache is None:
+            _shared_weather_cache = WeatherCache(
+                cache_directory=os.getenv('WEATHER_CACHE_DIRECTORY', WEATHER_CACHE_DIRECTORY),
+                grid_size_degrees=float(os.getenv('WEATHER_CACHE_GRID_SIZE_DEGREES', WEATHER_CACHE_GRID_SIZE_DEGREES)),
+                time_to_live_seconds=float(
+                    os.getenv('WEATHER_CACHE_TIME_TO_LIVE_SECONDS', WEATHER_CACHE_TIME_TO_LIVE_SECONDS)),
+                max_disk_bytes=int(os.getenv('WEATHER_CACHE_MAX_DISK_BYTES', WEATHER_CACHE_MAX_DISK_BYTES)),
+                max_memory_bytes=int(os.getenv('WEATHER_CACHE_MAX_MEMORY_BYTES', WEATHER_CACHE_MAX_MEMORY_BYTES))
+            )
+        return _shared_weather_cache
@@ -0,0 +1,200 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .CONSTANTS import WEATHER_PROVIDER_OPEN_METEO, WEATHER_PROVIDER_SYNTHETIC, OPEN_METEO_ARCHIVE_API_URL, \
+    OPEN_METEO_TIMEZONE, OPEN_METEO_TIMEOUT_SECONDS, OPEN_METEO_MAX_CONCURRENT_REQUESTS
+from .WeatherCache import WeatherCache
+from .ExternalClients import get_shared_external_clients
+
+SOLAR_CONSTANT = 1353  # W/m^2 reaching the top of the atmosphere
+
+
+class WeatherProvider:
+    """
+    Source of hourly DNI history for a location. Dates are "YYYY-MM-DD" and both ends are included.
+    """
+    is_cacheable: bool = True  # whether results are worth keeping in the WeatherCache
+
+    def get_hourly_dni(self, latitude: float, longitude: float, start_date: str, end_date: str):
+        """
+        :return: (timestamps as datetime64[m], DNI values in W/m^2 as float32, NaN where missing)
+        """
+        raise NotImplementedError
+
+
+class OpenMeteoWeatherProvider(WeatherProvider):
+    """
+    Historical weather from Open Meteo, over the pooled session of the process's ExternalClients that retries failed
+    requests with backoff. The session is only looked up on the first fetch, so weather cache hits never build it.
+    Docs here: https://open-meteo.com/en/docs/historical-weather-api
+    """
+    _api_url: str = None
+    _timezone: str = None
+    _timeout_seconds: tuple = None
+    _session = None  # requests.Session, see get_session
+
+    def __init__(self, api_url: str = OPEN_METEO_ARCHIVE_API_URL, timezone: str = OPEN_METEO_TIMEZONE,
+                 timeout_seconds: tuple = OPEN_METEO_TIMEOUT_SECONDS, session=None):
+        """
+        :param api_url:
+        :param timezone: timestamps come back in this timezone, "auto" uses the location's own
+        :param timeout_seconds: (connect, read) timeout for each request
+        :param session: requests.Session to fetch with, the shared ExternalClients one if not given
+        """
+        self._api_url = api_url
+        self._timezone = timezone
+        self._timeout_seconds = timeout_seconds
+        self._session = session
+
+    def get_session(self):
+        if self._session is None:
+            self._session = get_shared_external_clients().get_open_meteo_session()
+        return self._session
+
+    def get_hourly_dni(self, latitude: float, longitude: float, start_date: str, end_date: str):
+        meteo_response = self.get_session().get(self._api_url, timeout=self._timeout_seconds, params={
+            "latitude": latitude, "longitude": longitude, "start_date": start_date, "end_date": end_date,
+            "hourly": "direct_normal_irradiance", "timezone": self._timezone})
+        meteo_response.raise_for_status()
+        meteo_response = meteo_response.json()
+
+        # None DNI values become NaN, which the climatology skips over
+        timestamps = np.array(meteo_response["hourly"]["time"], dtype='datetime64[m]')
+        dni_values = np.array(meteo_response["hourly"]["direct_normal_irradiance"], dtype=np.float32)
+        return timestamps, dni_values
+
+
+def clear_sky_dni(timestamps, latitude: float) -> np.ndarray:
+    """
+    DNI under a cloudless sky, from the sun's elevation and the Meinel air mass model. Timestamps are taken as local
+    solar time, i.e. the sun is highest at 12:00
+    :param timestamps: datetime64 array
+    :param latitude: in degrees
+    :return: DNI in W/m^2 for each timestamp, 0 while the sun is down
+    """
+    timestamps = np.asarray(timestamps, dtype='datetime64[m]')
+    day_of_year = (timestamps.astype('datetime64[D]') - timestamps.astype('datetime64[Y]')).astype(np.int64) + 1
+    hours_since_midnight = (timestamps - timestamps.astype('datetime64[D]')).astype(np.int64) / 60
+
+    declination = np.radians(23.44) * np.sin(2 * np.pi * (284 + day_of_year) / 365)
+    hour_angle = np.radians(15 * (hours_since_midnight - 12))
+    latitude = np.radians(latitude)
+    sine_of_elevation = (np.sin(latitude) * np.sin(declination)
+                         + np.cos(latitude) * np.cos(declination) * np.cos(hour_angle))
+
+    sun_is_up = sine_of_elevation > 0.01  # below ~0.5º the air mass blows up
+    air_mass = 1 / np.where(sun_is_up, sine_of_elevation, 1)
+    return np.where(sun_is_up, SOLAR_CONSTANT * 0.7 ** (air_mass ** 0.678), 0)
+
+
+class SyntheticClearSkyWeatherProvider(WeatherProvider):
+    """
+    Generated weather, no network needed - 20 years takes milliseconds. Same location and dates always give the same
+    values, so it suits load tests, benchmarks and CI
+    """
+    is_cacheable = False  # quicker to regenerate than to read back
+    _cloudiness_seed: int = None
+
+    def __init__(self, cloudiness_seed: int = None):
+        """
+        :param cloudiness_seed: if given, every hour is also dimmed by a random 20-100% cloud cover from this seed,
+                                otherwise every day is cloudless
+        """
+        self._cloudiness_seed = cloudiness_seed
+
+    def get_hourly_dni(self, latitude: float, longitude: float, start_date: str, end_date: str):
+        timestamps = np.arange(np.datetime64(start_date, 'h'), np.datetime64(end_date, 'D') + np.timedelta64(1, 'D'),
+                               dtype='datetime64[h]').astype('datetime64[m]')
+        dni_values = clear_sky_dni(timestamps, latitude)
+        if self._cloudiness_seed is not None:
+            dni_values = dni_values * np.random.default_rng(self._cloudiness_seed).uniform(0.2, 1, len(timestamps))
+        return timestamps, dni_values.astype(np.float32)
+
+
+def split_into_yearly_chunks(start_date: str, end_date: str) -> list:
+    """
+    Whole calendar years covering the date range, except the last which stops at end_date. Whole years are the same
+    whatever day a simulation starts on, so they can be cached and shared
+    :param start_date: YYYY-MM-DD
+    :param end_date: YYYY-MM-DD, included
+    :return: list of (chunk start date, chunk end date)
+    """
+    return [(f"{year}-01-01", min(f"{year}-12-31", end_date))
+            for year in range(int(start_date[:4]), int(end_date[:4]) + 1)]
+
+
+def fetch_weather_history(weather_provider: WeatherProvider, weather_cache: WeatherCache, latitude: float,
+                          longitude: float, start_date: str, end_date: str,
+                          max_concurrent_requests: int = OPEN_METEO_MAX_CONCURRENT_REQUESTS):
+    """
+    Gets the weather history one calendar year at a time. Years already in the cache are read from it, the rest
+    are fetched concurrently and cached, so only the years a location is missing go over the network
+    :param weather_provider:
+    :param weather_cache: not used if the provider isn't cacheable
+    :param latitude:
+    :param longitude:
+    :param start_date: YYYY-MM-DD
+    :param end_date: YYYY-MM-DD, included
+    :param max_concurrent_requests:
+    :return: (timestamps as datetime64[m], DNI values in W/m^2 as float32) for the date range
+    """
+    if not weather_provider.is_cacheable:
+        return weather_provider.get_hourly_dni(latitude, longitude, start_date, end_date)
+
+    chunks = split_into_yearly_chunks(start_date, end_date)
+    weather_by_chunk = {chunk: weather_cache.get(latitude, longitude, *chunk) for chunk in chunks}
+    missing_chunks = [chunk for chunk, weather in weather_by_chunk.items() if weather is None]
+
+    if missing_chunks:
+        print(f"Fetching {len(missing_chunks)} of {len(chunks)} years of weather history")
+        with ThreadPoolExecutor(max_workers=min(max_concurrent_requests, len(missing_chunks))) as executor:
+            fetched_weather = executor.map(
+                lambda chunk: weather_provider.get_hourly_dni(latitude, longitude, *chunk), missing_chunks)
+            for chunk, (timestamps, dni_values) in zip(missing_chunks, fetched_weather):
+                weather_cache.put(latitude, longitude, *chunk, timestamps, dni_values)
+                weather_by_chunk[chunk] = timestamps, dni_values
+
+    timestamps = np.concatenate([weather_by_chunk[chunk][0] for chunk in chunks])
+    dni_values = np.concatenate([weather_by_chunk[chunk][1] for chunk in chunks])
+    first_hour, after_last_hour = np.searchsorted(timestamps, [
+        np.datetime64(start_date, 'm'), np.datetime64(end_date, 'D') + np.timedelta64(1, 'D')])
+    return timestamps[first_hour:after_last_hour], dni_values[first_hour:after_last_hour]
+
+
+_shared_weather_providers: dict = {}
+_shared_weather_providers_lock = threading.Lock()
+
+
+def _forget_weather_providers_in_forked_child():
+    # the Open Meteo provider holds on to the parent's session, see _forget_external_clients_in_forked_child
+    global _shared_weather_providers, _shared_weather_providers_lock
+    _shared_weather_providers = {}
+    _shared_weather_providers_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_weather_providers_in_forked_child)
+
+
+def get_weather_provider(weather_provider_name: str = None) -> WeatherProvider:
+    """
+    One provider of each kind per process
+    :param weather_provider_name: "open_meteo" or "synthetic", defaults to the SIMULATION_WEATHER_PROVIDER env
+                                  variable and then Open Meteo
+    :return:
+    :raises KeyError: unknown provider name
+    """
+    weather_provider_name = weather_provider_name or os.getenv('SIMULATION_WEATHER_PROVIDER',
+                                                               WEATHER_PROVIDER_OPEN_METEO)
+    with _shared_weather_providers_lock:
+        if weather_provider_name not in _shared_weather_providers:
+            if weather_provider_name == WEATHER_PROVIDER_OPEN_METEO:
+                _shared_weather_providers[weather_provider_name] = OpenMeteoWeatherProvider(
+                    timezone=os.getenv('OPEN_METEO_TIMEZONE', OPEN_METEO_TIMEZONE))
+            elif weather_provider_name == WEATHER_PROVIDER_SYNTHETIC:
+                _shared_weather_providers[weather_provider_name] = SyntheticClearSkyWeatherProvider()
+            else:
+                raise KeyError(f"Unknown weather provider {weather_provider_name}")
+        return _shared_weather_providers[weather_provider_name]
@@ -39,4 +39,112 @@
 #     try:
 #         yield recorded
 #     finally:
-#         template_rendered.disconnect(record, app)
\ No newline at end of file
+#         template_rendered.disconnect(record, app)
+
+import csv
+import json
+import threading
+
+import pytest
+
+# noinspection PyUnresolvedReferences
+from simulationObjects import SimulatedWorld as simulated_world_module
+# noinspection PyUnresolvedReferences
+from simulationObjects.SimulatedWorld import SimulatedWorld
+# noinspection PyUnresolvedReferences
+from simulationObjects.ConfigurationInputs import SimulationIncomingRequest
+# noinspection PyUnresolvedReferences
+from simulationObjects.ResultSinks import ResultSink
+# noinspection PyUnresolvedReferences
+from simulationObjects.SimulationCheckpoints import SimulationCheckpointStore
+# noinspection PyUnresolvedReferences
+from simulationObjects.SimulationResultCache import SimulationResultCache
+
+
+class RecordingResultSink(ResultSink):
+    """
+    Keeps the rows of every upload in memory, each simulation writes to an output buffer of its own so this is where
+    tests read its output from
+    """
+
+    def __init__(self):
+        self.rows_by_uuid = {}
+        self.rollups_by_uuid = {}
+        self.last_rows = None
+        self._lock = threading.Lock()
+
+    def write_results(self, simulation_uuid: str, output_file_path: str):
+        with open(output_file_path, newline='') as output_file:
+            rows = list(csv.reader(output_file))
+        with self._lock:
+            self.rows_by_uuid[str(simulation_uuid)] = rows
+            self.last_rows = rows
+
+    def write_rollups(self, simulation_uuid: str, rollups_file_path: str):
+        with open(rollups_file_path, newline='') as rollups_file:
+            rows = list(csv.reader(rollups_file))
+        with self._lock:
+            self.rollups_by_uuid[str(simulation_uuid)] = rows
+
+
+@pytest.fixture
+def recording_result_sink(monkeypatch):
+    """
+    Every world built while the fixture is active uploads to the same RecordingResultSink
+    """
+    result_sink = RecordingResultSink()
+    monkeypatch.setattr(simulated_world_module, "get_result_sink", lambda result_sink_name=None: result_sink)
+    return result_sink
+
+
+@pytest.fixture
+def offline_request_defaults():
+    """
+    Fields offline_world sets on the sample request before the overrides of each world, override this fixture in a
+    test module to change them for the whole module
+    """
+    return {"num_hours_to_simulate": 100, "optional_date_of_simulation": "1-January-2020",
+            "weather_provider": "synthetic", "result_sink": "null"}
+
+
+@pytest.fixture
+def offline_result_cache():
+    """
+    Result cache of the worlds offline_world builds. Keeps nothing, so every run simulates, override this fixture in a
+    test module to keep results
+    """
+    return SimulationResultCache(max_entries=0)
+
+
+@pytest.fixture
+def offline_world(tmp_path, monkeypatch, recording_result_sink, offline_request_defaults, offline_result_cache):
+    """
+    Builds worlds from the sample request that upload to a recording result sink, checkpoint to a scratch store and
+    count how often they geocode instead of calling Google Maps
+    """
+    geocode_calls = []
+    checkpoint_store = SimulationCheckpointStore(checkpoint_directory=str(tmp_path / "checkpoints"))
+
+    def generate_lat_long(world):
+        geocode_calls.append(world._address_of_system)
+        world._latitude, world._longitude = 40.67, -111.82
+
+    monkeypatch.setattr(simulated_world_module, "get_shared_simulation_checkpoint_store", lambda: checkpoint_store)
+    monkeypatch.setattr(simulated_world_module, "get_shared_simulation_result_cache", lambda: offline_result_cache)
+    monkeypatch.setattr(SimulatedWorld, "generate_lat_long", generate_lat_long)
+
+    def make_request(**overrides) -> dict:
+        with open('sampleData/sampleCorrectClientRequest.json') as sample_request_file:
+            request = json.load(sample_request_file)
+        request.update(offline_request_defaults)
+        request.update(overrides)
+        return request
+
+    def make_world(**overrides) -> SimulatedWorld:
+        return SimulatedWorld(SimulationIncomingRequest(**make_request(**overrides)))
+
+    make_world.make_request = make_request
+    make_world.geocode_calls = geocode_calls
+    make_world.checkpoint_store = checkpoint_store
+    make_world.read_output = lambda: recording_result_sink.last_rows
+    return make_world
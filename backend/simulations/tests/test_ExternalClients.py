@@ -0,0 +1,124 @@
+import os
+import json
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+# noinspection PyUnresolvedReferences
+import main
+# noinspection PyUnresolvedReferences
+from simulationObjects.ExternalClients import ExternalClients, make_pooled_session, \
+    get_external_clients_started_with_app, get_shared_external_clients
+# noinspection PyUnresolvedReferences
+from simulationObjects.WeatherProviders import get_weather_provider
+# noinspection PyUnresolvedReferences
+from simulationObjects.GeocodeCache import GeocodeCache
+# noinspection PyUnresolvedReferences
+from simulationObjects.SimulatedWorld import SimulatedWorld
+# noinspection PyUnresolvedReferences
+from simulationObjects.ConfigurationInputs import SimulationIncomingRequest
+
+
+def make_fake_session(status_code=200):
+    session = mock.Mock()
+    session.head.return_value = mock.Mock(status_code=status_code)
+    return session
+
+
+def make_fake_clients(gmaps_status_code=200, open_meteo_status_code=200, bigquery_error=None):
+    gmaps_client = mock.Mock(session=make_fake_session(gmaps_status_code))
+    bigquery_client = mock.Mock()
+    bigquery_client.get_table.side_effect = bigquery_error
+    return ExternalClients(gmaps_client=gmaps_client, open_meteo_session=make_fake_session(open_meteo_status_code),
+                           bigquery_client=bigquery_client)
+
+
+class TestExternalClients:
+    def test_clients_are_built_once(self):
+        external_clients = ExternalClients(max_connections=3)
+        session = external_clients.get_open_meteo_session()
+        assert external_clients.get_open_meteo_session() is session
+
+        adapter = session.get_adapter("https://archive-api.open-meteo.com")
+        assert adapter._pool_maxsize == 3
+        assert adapter._pool_block  # never more than max_connections open
+        external_clients.close()
+        assert external_clients.get_open_meteo_session() is not session
+
+    def test_forked_process_builds_its_own_clients(self):
+        external_clients = get_shared_external_clients()
+        open_meteo_session = get_weather_provider("open_meteo").get_session()
+        read_end, write_end = os.pipe()
+        child_pid = os.fork()
+        if child_pid == 0:  # job workers are forked like this
+            is_own = get_shared_external_clients() is not external_clients and \
+                     get_weather_provider("open_meteo").get_session() is not open_meteo_session
+            os.write(write_end, b"1" if is_own else b"0")
+            os._exit(0)
+        os.close(write_end)
+        os.waitpid(child_pid, 0)
+        assert os.read(read_end, 1) == b"1"
+        os.close(read_end)
+        assert get_shared_external_clients() is external_clients
+
+    def test_pooled_session_retries(self):
+        adapter = make_pooled_session(2, max_retries=4).get_adapter("https://maps.googleapis.com")
+        assert adapter.max_retries.total == 4
+        assert 503 in adapter.max_retries.status_forcelist
+
+    def test_gmaps_client_uses_pooled_session(self):
+        external_clients = ExternalClients(google_maps_api_key="AIza-not-a-real-key", max_connections=2)
+        gmaps_client = external_clients.get_gmaps_client()
+        assert external_clients.get_gmaps_client() is gmaps_client
+        assert gmaps_client.session.get_adapter("https://maps.googleapis.com")._pool_maxsize == 2
+
+    def test_start_leaves_failed_clients_for_first_use(self):
+        external_clients = ExternalClients(google_maps_api_key=None, open_meteo_session=make_fake_session())
+        errors = external_clients.start(["google_maps", "open_meteo"])
+        assert errors["open_meteo"] is None
+        assert errors["google_maps"]  # no API key
+        assert external_clients._gmaps_client is None
+
+    def test_check_health(self):
+        assert all(client_health["healthy"] for client_health in make_fake_clients().check_health().values())
+
+        health = make_fake_clients(open_meteo_status_code=502, bigquery_error=PermissionError("denied")).check_health()
+        assert health["google_maps"]["healthy"]
+        assert not health["open_meteo"]["healthy"]
+        assert not health["bigquery"]["healthy"]
+        assert "denied" in health["bigquery"]["detail"]
+
+    def test_clients_started_with_app(self, monkeypatch):
+        monkeypatch.setenv("EXTERNAL_CLIENTS_STARTED_WITH_APP", " open_meteo, ")
+        assert get_external_clients_started_with_app() == ["open_meteo"]
+        monkeypatch.setenv("EXTERNAL_CLIENTS_STARTED_WITH_APP", "")
+        assert get_external_clients_started_with_app() == []
+
+    def test_world_geocodes_with_injected_clients(self, tmp_path):
+        with open('sampleData/sampleCorrectClientRequest.json') as sample_request_file:
+            request = json.load(sample_request_file)
+        external_clients = make_fake_clients()
+        external_clients._gmaps_client.geocode.return_value = [{"geometry": {"location": {"lat": 1.5, "lng": 2.5}}}]
+
+        world = SimulatedWorld(SimulationIncomingRequest(**request), external_clients=external_clients)
+        world._geocode_cache = GeocodeCache(cache_file_path=str(tmp_path / "geocodeCache.json"))
+        world.generate_lat_long()
+        world._output_buffer.close()
+
+        assert (world._latitude, world._longitude) == (1.5, 2.5)
+        external_clients._gmaps_client.geocode.assert_called_once_with(request["address"])
+
+    def test_lifespan_starts_and_closes_clients(self, monkeypatch):
+        external_clients = make_fake_clients(bigquery_error=PermissionError("denied"))
+        monkeypatch.setattr(main, "get_shared_external_clients", lambda: external_clients)
+        monkeypatch.setenv("EXTERNAL_CLIENTS_STARTED_WITH_APP", "open_meteo")
+
+        with TestClient(main.app) as client:
+            response = client.get("/health")
+            assert response.status_code == 503
+            assert response.json()["open_meteo"]["healthy"]
+            assert not response.json()["bigquery"]["healthy"]
+            open_meteo_session = external_clients._open_meteo_session
+
+        open_meteo_session.close.assert_called_once()
+        assert external_clients._open_meteo_session is None
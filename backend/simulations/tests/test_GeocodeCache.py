@@ -0,0 +1,86 @@
+import json
+
+# noinspection PyUnresolvedReferences
+from simulationObjects import GeocodeCache as geocode_cache_module
+# noinspection PyUnresolvedReferences
+from simulationObjects.GeocodeCache import GeocodeCache, normalize_address
+
+
+class TestGeocodeCache:
+    def test_normalize_address(self):
+        assert normalize_address(" 6405 S 3000 East, Suite 300 Holladay, UT") == "6405 s 3000 e ste 300 holladay ut"
+        assert normalize_address("6405 s 3000 e   suite 300  holladay ut") == "6405 s 3000 e ste 300 holladay ut"
+        assert normalize_address("7 Station Street, Toronto") == normalize_address("7 station st. toronto")
+
+    def test_hit_on_normalized_address(self, tmp_path):
+        cache = GeocodeCache(cache_file_path=str(tmp_path / "geocode.json"))
+        assert cache.get("7 Station St, Toronto, Ontario") is None
+
+        cache.put("7 Station St, Toronto, Ontario", 43.6443398, -79.3836206)
+        assert cache.get("7 station street toronto ontario") == (43.6443398, -79.3836206)
+        assert cache.get_stats() == {"hits": 1, "misses": 1, "entries": 1}
+
+    def test_persists_between_instances(self, tmp_path):
+        cache_file_path = str(tmp_path / "geocode.json")
+        GeocodeCache(cache_file_path=cache_file_path).put("7 Station St, Toronto, Ontario", 43.6443398, -79.3836206)
+        assert GeocodeCache(cache_file_path=cache_file_path).get("7 Station St, Toronto, Ontario") == (43.6443398,
+                                                                                                        -79.3836206)
+
+    def test_entries_expire(self, tmp_path, monkeypatch):
+        cache = GeocodeCache(cache_file_path=str(tmp_path / "geocode.json"), time_to_live_seconds=60)
+        cache.put("7 Station St, Toronto, Ontario", 43.6443398, -79.3836206)
+
+        real_time = geocode_cache_module.time.time
+        monkeypatch.setattr(geocode_cache_module.time, "time", lambda: real_time() + 120)
+        assert cache.get("7 Station St, Toronto, Ontario") is None
+        assert GeocodeCache(cache_file_path=str(tmp_path / "geocode.json"), time_to_live_seconds=60).get_stats()[
+                   "entries"] == 0
+
+    def test_bounded_size_evicts_least_recently_used(self, tmp_path):
+        cache = GeocodeCache(cache_file_path=str(tmp_path / "geocode.json"), max_entries=2)
+        cache.put("1 First St", 1, 1)
+        cache.put("2 Second St", 2, 2)
+        cache.get("1 First St")
+        cache.put("3 Third St", 3, 3)
+
+        assert cache.get("2 Second St") is None
+        assert cache.get("1 First St") == (1, 1)
+        assert cache.get("3 Third St") == (3, 3)
+
+    def test_warm_up_from_file(self, tmp_path):
+        known_addresses_path = tmp_path / "known_addresses.json"
+        known_addresses_path.write_text(json.dumps([
+            {"address": "7 Station St, Toronto, Ontario", "lat": 43.6443398, "lng": -79.3836206},
+            "One City Plaza, Yuma, AZ 85364"]))
+        geocoded_addresses = []
+
+        def fake_geocode(address):
+            geocoded_addresses.append(address)
+            return 32.7, -114.6
+
+        cache = GeocodeCache(cache_file_path=str(tmp_path / "geocode.json"))
+        assert cache.warm_up_from_file(str(known_addresses_path), geocode_function=fake_geocode) == 2
+        assert geocoded_addresses == ["One City Plaza, Yuma, AZ 85364"]
+        assert cache.get("one city plaza yuma az 85364") == (32.7, -114.6)
+        assert cache.get("7 Station St, Toronto, Ontario") == (43.6443398, -79.3836206)
+
+    def test_warm_up_skips_addresses_that_fail_to_geocode(self, tmp_path):
+        known_addresses_path = tmp_path / "known_addresses.txt"
+        known_addresses_path.write_text("7 Station St, Toronto, Ontario\nNowhere at all\n"
+                                        "One City Plaza, Yuma, AZ 85364\n")
+
+        def fake_geocode(address):
+            if address == "Nowhere at all":
+                raise IndexError("list index out of range")  # Google Maps found no result
+            return 32.7, -114.6
+
+        cache = GeocodeCache(cache_file_path=str(tmp_path / "geocode.json"))
+        assert cache.warm_up_from_file(str(known_addresses_path), geocode_function=fake_geocode) == 2
+        assert cache.get("Nowhere at all") is None
+        assert cache.get("One City Plaza, Yuma, AZ 85364") == (32.7, -114.6)
+
+    def test_warm_up_from_text_file_without_geocoder_skips_unknown(self, tmp_path):
+        known_addresses_path = tmp_path / "known_addresses.txt"
+        known_addresses_path.write_text("7 Station St, Toronto, Ontario\n\nOne City Plaza, Yuma, AZ 85364\n")
+        cache = GeocodeCache(cache_file_path=str(tmp_path / "geocode.json"))
+        assert cache.warm_up_from_file(str(known_addresses_path)) == 0
@@ -0,0 +1,53 @@
+import pytest
+import numpy as np
+import pandas as pd
+
+# noinspection PyUnresolvedReferences
+from simulationObjects.HourOfYearClimatology import build_dni_climatology, hour_of_year_index, \
+    hour_of_year_index_from_timestamp, hour_of_year_indices
+# noinspection PyUnresolvedReferences
+from simulationObjects.CONSTANTS import HOURS_IN_LEAP_YEAR
+
+
+def make_sample_weather_data(start="2003-01-01T00:00", end="2006-12-31T23:00"):
+    """
+    Hourly timestamps in Open Meteo's format with random DNI values and a few missing values, spans a leap year
+    """
+    timestamps = np.arange(np.datetime64(start), np.datetime64(end) + 1, np.timedelta64(1, 'h'))
+    timestamps = [str(timestamp) for timestamp in timestamps.astype('datetime64[m]')]
+    dni_values = np.random.default_rng(7).uniform(0, 900, len(timestamps)).tolist()
+    for i in range(0, len(dni_values), 97):
+        dni_values[i] = None
+    return timestamps, dni_values
+
+
+class TestHourOfYearClimatology:
+    def test_hour_of_year_index(self):
+        assert hour_of_year_index(1, 1, 0) == 0
+        assert hour_of_year_index(2, 29, 0) == 59 * 24
+        assert hour_of_year_index(3, 1, 0) == 60 * 24
+        assert hour_of_year_index(12, 31, 23) == HOURS_IN_LEAP_YEAR - 1
+        assert hour_of_year_index_from_timestamp("2003-03-10T22:00") == hour_of_year_index(3, 10, 22)
+
+    def test_vectorized_indices_match_scalar(self):
+        timestamps, _ = make_sample_weather_data()
+        indices = hour_of_year_indices(timestamps)
+        assert indices.tolist() == [hour_of_year_index_from_timestamp(timestamp) for timestamp in timestamps]
+
+    def test_matches_masked_mean(self):
+        timestamps, dni_values = make_sample_weather_data()
+        pandas_data = pd.DataFrame({"DNI_value": pd.Series(dni_values, index=timestamps)})
+        climatology = build_dni_climatology(timestamps, dni_values)
+
+        for timestamp in ["2003-01-01T00:00", "2003-03-10T22:00", "2004-02-29T05:00", "2005-03-01T00:00",
+                          "2006-07-04T13:00", "2006-12-31T23:00"]:
+            month_day_hour_formatted = timestamp[5:]
+            mask = pandas_data.index.str.contains(month_day_hour_formatted)
+            masked_mean = pandas_data[mask].loc[:, 'DNI_value'].mean()
+            assert climatology[hour_of_year_index_from_timestamp(timestamp)] == pytest.approx(masked_mean, rel=1e-12)
+
+    def test_slot_without_data_is_nan(self):
+        timestamps, dni_values = make_sample_weather_data(start="2003-01-01T00:00", end="2003-12-31T23:00")
+        climatology = build_dni_climatology(timestamps, dni_values)
+        assert np.isnan(climatology[hour_of_year_index(2, 29, 12)])
+        assert climatology.shape == (HOURS_IN_LEAP_YEAR,)
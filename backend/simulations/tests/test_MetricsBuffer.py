@@ -0,0 +1,93 @@
+import csv
+import io
+
+import pytest
+import numpy as np
+
+# noinspection PyUnresolvedReferences
+from simulationObjects.MetricsBuffer import MetricsBuffer
+# noinspection PyUnresolvedReferences
+from simulationObjects.SimulationKernel import KERNEL_METRIC_COLUMNS
+
+METRIC_NAMES = ["DNI_Value", "water_temp_into_solar", "water_flow_rate"]
+
+
+def write_to_csv_text(metrics_buffer, compress_interpolated_rows=False):
+    output_csv_file = io.StringIO()
+    metrics_buffer.write_csv(csv.writer(output_csv_file), compress_interpolated_rows=compress_interpolated_rows)
+    return output_csv_file.getvalue().splitlines()
+
+
+class TestMetricsBuffer:
+    def test_append_row_and_write_csv(self):
+        metrics_buffer = MetricsBuffer("test-uuid", METRIC_NAMES, num_hours=3, num_padding_columns=1)
+        metrics_buffer.append_row("2023-03-03T00:00", [0, 50, 0.5])
+        metrics_buffer.append_row("2023-03-03T01:00", (120.5, 50.25, 0.35))
+
+        assert metrics_buffer.num_rows == 2
+        assert write_to_csv_text(metrics_buffer) == ["test-uuid,2023-03-03T00:00,0.0,50.0,0.5,0",
+                                                     "test-uuid,2023-03-03T01:00,120.5,50.25,0.35,0"]
+        assert np.array_equal(metrics_buffer.get_column("water_flow_rate"), [0.5, 0.35])
+
+    def test_buffer_is_preallocated(self):
+        metrics_buffer = MetricsBuffer("test-uuid", METRIC_NAMES, num_hours=1)
+        metrics_buffer.append_row("2023-03-03T00:00", [0, 50, 0.5])
+        with pytest.raises(IndexError):
+            metrics_buffer.append_row("2023-03-03T01:00", [0, 50, 0.5])
+
+    def test_set_columns(self):
+        metrics_buffer = MetricsBuffer("test-uuid", KERNEL_METRIC_COLUMNS, num_hours=4)
+        metrics = {metric_name: np.arange(4) * index for index, metric_name in enumerate(KERNEL_METRIC_COLUMNS)}
+        metrics_buffer.set_columns(["a", "b", "c", "d"], metrics)
+
+        assert metrics_buffer.num_rows == 4
+        assert list(metrics_buffer.get_timestamps()) == ["a", "b", "c", "d"]
+        assert np.array_equal(metrics_buffer.get_column("energy_absorbed_from_pipes"),
+                              np.arange(4) * (len(KERNEL_METRIC_COLUMNS) - 1))
+        assert len(write_to_csv_text(metrics_buffer)) == 4
+
+    def test_compressed_csv_leaves_out_interpolated_rows(self):
+        metrics_buffer = MetricsBuffer("test-uuid", METRIC_NAMES, num_hours=6, num_padding_columns=1)
+        metrics_buffer.set_columns([f"2023-03-03T0{hour}:00" for hour in range(6)],
+                                   {"DNI_Value": np.arange(6.0)})
+        metrics_buffer.set_interpolated([True, True, False, True], first_row=1)
+
+        assert len(write_to_csv_text(metrics_buffer)) == 6
+        assert write_to_csv_text(metrics_buffer, compress_interpolated_rows=True) == [
+            "test-uuid,2023-03-03T00:00,0.0,0.0,0.0,0",
+            "test-uuid,2023-03-03T03:00,3.0,0.0,0.0,2",  # 01:00 and 02:00 left out
+            "test-uuid,2023-03-03T05:00,5.0,0.0,0.0,1"]
+        assert metrics_buffer.get_rows(1, 3) == [["2023-03-03T01:00", 1.0, 0.0, 0.0],
+                                                 ["2023-03-03T02:00", 2.0, 0.0, 0.0]]
+
+    def test_write_parquet(self, tmp_path):
+        pyarrow_parquet = pytest.importorskip("pyarrow.parquet")
+        metrics_buffer = MetricsBuffer("test-uuid", METRIC_NAMES, num_hours=3)
+        metrics_buffer.append_row("2023-03-03T00:00", [0, 50, 0.5])
+        metrics_buffer.write_parquet(str(tmp_path / "output.parquet"))
+
+        table = pyarrow_parquet.read_table(str(tmp_path / "output.parquet"))
+        assert table.column_names == ["uuid", "Timestamp", *METRIC_NAMES]
+        assert table.num_rows == 1
+
+    def test_write_parquet_with_schema(self, tmp_path):
+        pyarrow_parquet = pytest.importorskip("pyarrow.parquet")
+        bigquery_schema = [{"name": "uuid", "type": "STRING"}, {"name": "Timestamp", "type": "TIMESTAMP"},
+                           *[{"name": metric_name, "type": "FLOAT"} for metric_name in METRIC_NAMES],
+                           {"name": "int64_field_5", "type": "INTEGER"}]
+        metrics_buffer = MetricsBuffer("test-uuid", METRIC_NAMES, num_hours=6, num_padding_columns=1)
+        metrics_buffer.set_columns([f"2023-03-03T{hour:02d}:00" for hour in range(6)],
+                                   {"DNI_Value": np.arange(6.0)})
+        metrics_buffer.set_interpolated([False, True, True, False, True, False])
+        metrics_buffer.write_parquet(str(tmp_path / "output.parquet"), bigquery_schema,
+                                     compress_interpolated_rows=True)
+
+        table = pyarrow_parquet.read_table(str(tmp_path / "output.parquet"))
+        assert [str(field.type) for field in table.schema] == ["string", "timestamp[us, tz=UTC]", "double",
+                                                               "double", "double", "int64"]
+        assert table.column("DNI_Value").to_pylist() == [0.0, 3.0, 5.0]
+        assert table.column("int64_field_5").to_pylist() == [0, 2, 1]  # same counts as compressed CSV
+        assert [timestamp.strftime("%Y-%m-%dT%H:%M") for timestamp in table.column("Timestamp").to_pylist()] == \
+               ["2023-03-03T00:00", "2023-03-03T03:00", "2023-03-03T05:00"]
+        with pytest.raises(ValueError):
+            metrics_buffer.write_parquet(str(tmp_path / "output.parquet"), bigquery_schema[:-1])
@@ -0,0 +1,122 @@
+import copy
+import json
+
+import pytest
+import numpy as np
+
+# noinspection PyUnresolvedReferences
+from simulationObjects import ParameterSweep as parameter_sweep_module
+# noinspection PyUnresolvedReferences
+from simulationObjects.ParameterSweep import ParameterSweep, run_parameter_sweep_kernel, get_consumption_tables, \
+    SWEEP_METRIC_COLUMNS
+# noinspection PyUnresolvedReferences
+from simulationObjects.SimulationKernel import run_simulation_kernel
+# noinspection PyUnresolvedReferences
+from simulationObjects.ConfigurationInputs import SimulationIncomingRequest
+# noinspection PyUnresolvedReferences
+from simulationObjects.SolarCollector import SolarCollector
+# noinspection PyUnresolvedReferences
+from simulationObjects.WaterPump import WaterPump
+# noinspection PyUnresolvedReferences
+from simulationObjects.WaterContainer import WaterContainer, compile_consumption_pattern
+from tests.test_SimulationKernel import SOLAR_CONFIG, WATER_PUMP_CONFIG, WATER_CONTAINER_CONFIG, to_namespace, \
+    make_dni_by_hour
+
+
+def make_variant_configs():
+    variants = []
+    for length, max_flow_rate, water_capacity, shower_temperature in [(4.5, 20, 200, 45), (10, 45, 200, 65),
+                                                                       (2, 10, 1200, 85), (4.5, 20, 50, 5)]:
+        solar_config = dict(SOLAR_CONFIG, length=length)
+        water_pump_config = dict(WATER_PUMP_CONFIG, max_flow_rate=max_flow_rate)
+        water_container_config = copy.deepcopy(WATER_CONTAINER_CONFIG)
+        water_container_config["water_capacity"] = water_capacity
+        water_container_config["consumption_pattern"]["19:00"]["average_temperature_of_water_used"] = shower_temperature
+        variants.append((solar_config, water_pump_config, water_container_config))
+    return variants
+
+
+class TestParameterSweep:
+    def test_matches_kernel_for_each_configuration(self):
+        dni_by_hour, hour_of_day = make_dni_by_hour(24 * 14)
+        variants = make_variant_configs()
+
+        results = run_parameter_sweep_kernel(
+            [SolarCollector(to_namespace(solar_config)) for solar_config, _, _ in variants],
+            [WaterPump(to_namespace(water_pump_config)) for _, water_pump_config, _ in variants],
+            [WaterContainer(to_namespace(water_container_config)) for _, _, water_container_config in variants],
+            dni_by_hour, hour_of_day)
+        assert results.shape == (len(variants), len(dni_by_hour), len(SWEEP_METRIC_COLUMNS))
+
+        for configuration_index, (solar_config, water_pump_config, water_container_config) in enumerate(variants):
+            water_container = WaterContainer(to_namespace(water_container_config))
+            metrics = run_simulation_kernel(SolarCollector(to_namespace(solar_config)),
+                                            WaterPump(to_namespace(water_pump_config)), water_container,
+                                            dni_by_hour, hour_of_day,
+                                            *compile_consumption_pattern(water_container._consumption_pattern))
+            for metric_index, metric_name in enumerate(SWEEP_METRIC_COLUMNS):
+                assert results[configuration_index, :, metric_index] == pytest.approx(metrics[metric_name], rel=1e-9,
+                                                                                      abs=1e-6), metric_name
+
+    def test_configurations_with_the_same_consumption_share_a_table(self):
+        water_container_configs = [water_container_config for _, _, water_container_config in make_variant_configs()]
+        # same consumption as the first variant with a different capacity, then the first variant again
+        water_container_configs += [dict(water_container_configs[0], water_capacity=900), water_container_configs[0]]
+        water_containers = [WaterContainer(to_namespace(water_container_config))
+                            for water_container_config in water_container_configs]
+
+        consumption_tables, table_by_configuration = get_consumption_tables(water_containers)
+        assert consumption_tables.shape[0] == 4
+        assert table_by_configuration.tolist() == [0, 1, 2, 3, 0, 0]
+        for water_container, table_index in zip(water_containers, table_by_configuration):
+            assert np.array_equal(consumption_tables[table_index], water_container._consumption_by_hour_of_year)
+
+    def test_streams_results_to_disk(self, tmp_path):
+        dni_by_hour, hour_of_day = make_dni_by_hour(48)
+        variants = make_variant_configs()
+        output_file_path = str(tmp_path / "sweep.npy")
+        streamed = np.lib.format.open_memmap(output_file_path, mode='w+', dtype=np.float32,
+                                             shape=(len(variants), 48, len(SWEEP_METRIC_COLUMNS)))
+
+        run_parameter_sweep_kernel(
+            [SolarCollector(to_namespace(solar_config)) for solar_config, _, _ in variants],
+            [WaterPump(to_namespace(water_pump_config)) for _, water_pump_config, _ in variants],
+            [WaterContainer(to_namespace(water_container_config)) for _, _, water_container_config in variants],
+            dni_by_hour, hour_of_day, results=streamed)
+        streamed.flush()
+
+        in_memory = run_parameter_sweep_kernel(
+            [SolarCollector(to_namespace(solar_config)) for solar_config, _, _ in variants],
+            [WaterPump(to_namespace(water_pump_config)) for _, water_pump_config, _ in variants],
+            [WaterContainer(to_namespace(water_container_config)) for _, _, water_container_config in variants],
+            dni_by_hour, hour_of_day)
+        assert np.load(output_file_path, mmap_mode='r') == pytest.approx(in_memory.astype(np.float32))
+
+    def test_configurations_must_share_location_and_hours(self):
+        base_request = json.load(open('sampleData/sampleCorrectClientRequest.json'))
+        other_request = dict(base_request, address="One City Plaza, Yuma, AZ 85364")
+        with pytest.raises(KeyError):
+            ParameterSweep([SimulationIncomingRequest(**base_request), SimulationIncomingRequest(**other_request)])
+        with pytest.raises(KeyError):
+            ParameterSweep([])
+        for weather_field in ({"weather_provider": "synthetic"}, {"weather_lookback_years": 5}):
+            with pytest.raises(KeyError):
+                ParameterSweep([SimulationIncomingRequest(**base_request),
+                                SimulationIncomingRequest(**dict(base_request, **weather_field))])
+
+    def test_sweep_matches_simulated_worlds(self, monkeypatch, offline_world):
+        monkeypatch.setattr(parameter_sweep_module, "look_up_lat_long", lambda *args: (40.67, -111.82))
+        sample_solar = offline_world.make_request()["solar"]
+        requests = [offline_world.make_request(num_hours_to_simulate=48, simulation_engine="kernel", solar=solar)
+                    for solar in (sample_solar, dict(sample_solar, length=9))]
+
+        sweep = ParameterSweep([SimulationIncomingRequest(**request) for request in requests])
+        results = sweep.run_sweep()
+
+        for request, sweep_results in zip(requests, results):
+            world = offline_world(**request)
+            world.run_entire_simulation()
+            world.wait_for_results_upload()
+            assert sweep.timestamps == world._metrics_buffer.get_timestamps().tolist()
+            np.testing.assert_allclose(sweep_results, np.stack(
+                [world._metrics_buffer.get_column(metric_name) for metric_name in SWEEP_METRIC_COLUMNS], axis=1))
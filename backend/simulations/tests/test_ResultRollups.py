@@ -0,0 +1,175 @@
+import csv
+import collections
+
+import numpy as np
+import pytest
+
+# noinspection PyUnresolvedReferences
+from simulationObjects.ResultRollups import compute_rollups, write_rollups_csv, ROLLUP_METRIC_NAMES, \
+    TEMP_SENT_OUT_METRIC_NAME
+# noinspection PyUnresolvedReferences
+from simulationObjects.ResultSinks import SQLiteResultSink, BigQueryResultSink
+# noinspection PyUnresolvedReferences
+from simulationObjects import SimulatedWorld as simulated_world_module
+from tests.test_ResultSinks import LocalBigQueryClient
+
+
+def make_hourly_metrics(start: str, num_hours: int):
+    timestamps = np.datetime64(start, 'm') + np.arange(num_hours) * np.timedelta64(60, 'm')
+    random_state = np.random.RandomState(0)
+    metrics = {metric_name: random_state.rand(num_hours + 1) for metric_name in ROLLUP_METRIC_NAMES}
+    metrics["energy_consumed_by_heater"] *= -1
+    metrics[TEMP_SENT_OUT_METRIC_NAME] = random_state.choice([0.0, 50.0], num_hours + 1)
+    metrics_after_last_hour = {metric_name: column[-1] for metric_name, column in metrics.items()}
+    return np.datetime_as_string(timestamps, unit='m'), \
+        {metric_name: column[:-1] for metric_name, column in metrics.items()}, metrics_after_last_hour
+
+
+def sum_naively(timestamps, metrics, metrics_after_last_hour, period_length: int) -> dict:
+    """
+    :param period_length: 10 for days, 7 for months, of the ISO timestamps
+    :return: period -> [num_hours, sums...]
+    """
+    sums = collections.OrderedDict()
+    for hour, timestamp in enumerate(timestamps):
+        period_sums = sums.setdefault(timestamp[:period_length], [0] + [0.0] * len(ROLLUP_METRIC_NAMES))
+        period_sums[0] += 1
+        # the state after hour i is logged in row i + 1
+        if hour + 1 < len(timestamps):
+            state_after_hour = {metric_name: column[hour + 1] for metric_name, column in metrics.items()}
+        else:
+            state_after_hour = metrics_after_last_hour
+        for index, metric_name in enumerate(ROLLUP_METRIC_NAMES):
+            value = state_after_hour[metric_name]
+            if metric_name == "energy_consumed_by_heater":
+                value = -value if state_after_hour[TEMP_SENT_OUT_METRIC_NAME] > 0 else 0.0
+            period_sums[index + 1] += value
+    return sums
+
+
+@pytest.fixture
+def offline_request_defaults(offline_request_defaults):
+    return dict(offline_request_defaults, simulation_engine="fast_forward", checkpoint_interval_hours=0,
+                result_format="csv")
+
+
+class TestResultRollups:
+    def test_rollups_match_naive_sums(self):
+        # starts mid day and crosses a month and a leap day
+        timestamps, metrics, metrics_after_last_hour = make_hourly_metrics("2020-01-30T13:00", 24 * 40)
+        rollups = compute_rollups(timestamps, metrics, metrics_after_last_hour)
+
+        for period, period_length in (("day", 10), ("month", 7)):
+            expected = sum_naively(timestamps, metrics, metrics_after_last_hour, period_length)
+            period_rollups = rollups[period]
+            assert [str(period_start)[:period_length] for period_start in period_rollups["period_start"]] == \
+                list(expected)
+            assert period_rollups["num_hours"].tolist() == [sums[0] for sums in expected.values()]
+            for index, metric_name in enumerate(ROLLUP_METRIC_NAMES):
+                np.testing.assert_allclose(period_rollups[metric_name],
+                                           [sums[index + 1] for sums in expected.values()])
+
+        assert rollups["day"]["num_hours"][0] == 11  # partial first day
+        assert str(rollups["month"]["period_start"][0]) == "2020-01-01"
+        assert rollups["month"]["num_hours"].tolist() == [35, 29 * 24, 24 * 40 - 35 - 29 * 24]
+
+    def test_hours_are_counted_in_the_day_they_ran(self):
+        # rows hold the state going into each hour, the heater energy is carried over from 22:00 and logged negative
+        timestamps = ["2020-01-01T22:00", "2020-01-01T23:00", "2020-01-02T00:00", "2020-01-02T01:00"]
+        metrics = {"energy_captured_by_solar": [0.0, 5.0, 6.0, 7.0],
+                   "energy_consumed_by_heater": [0.0, -3.0, -3.0, -3.0],
+                   "volume_of_water_sent_out_of_water_container": [0.0, 10.0, 0.0, 0.0],
+                   TEMP_SENT_OUT_METRIC_NAME: [0.0, 50.0, 0.0, 0.0]}
+        metrics_after_last_hour = {"energy_captured_by_solar": 8.0, "energy_consumed_by_heater": -3.0,
+                                   "volume_of_water_sent_out_of_water_container": 4.0,
+                                   TEMP_SENT_OUT_METRIC_NAME: 50.0}
+        daily = compute_rollups(timestamps, metrics, metrics_after_last_hour)["day"]
+
+        assert daily["num_hours"].tolist() == [2, 2]
+        assert daily["energy_captured_by_solar"].tolist() == [5.0 + 6.0, 7.0 + 8.0]
+        assert daily["energy_consumed_by_heater"].tolist() == [3.0, 3.0]
+        assert daily["volume_of_water_sent_out_of_water_container"].tolist() == [10.0, 4.0]
+
+    def test_empty_simulation_has_no_rollups(self):
+        rollups = compute_rollups([], {metric_name: [] for metric_name in ROLLUP_METRIC_NAMES}, {})
+        assert all(len(period_rollups["num_hours"]) == 0 for period_rollups in rollups.values())
+
+    def test_rollups_csv_has_far_fewer_rows(self, tmp_path):
+        timestamps, metrics, metrics_after_last_hour = make_hourly_metrics("2020-01-01T00:00", 24 * 366)
+        rollups_file_path = tmp_path / "rollups.csv"
+        with open(rollups_file_path, 'w', newline='') as rollups_file:
+            write_rollups_csv(csv.writer(rollups_file), "simulation-a",
+                              compute_rollups(timestamps, metrics, metrics_after_last_hour))
+
+        with open(rollups_file_path, newline='') as rollups_file:
+            rows = list(csv.reader(rollups_file))
+        assert len(rows) == 366 + 12
+        assert rows[0][:4] == ["simulation-a", "day", "2020-01-01", "24"]
+        assert rows[-1][:4] == ["simulation-a", "month", "2020-12-01", "744"]
+
+    @pytest.mark.parametrize("upload_mode", ["aggregates", "both"])
+    def test_world_uploads_rollups_of_its_hourly_results(self, monkeypatch, offline_world, tmp_path,
+                                                         upload_mode):
+        sink = SQLiteResultSink(str(tmp_path / "results.sqlite3"))
+        monkeypatch.setattr(simulated_world_module, "get_result_sink", lambda result_sink_name=None: sink)
+        hourly_sink = SQLiteResultSink(str(tmp_path / "hourly.sqlite3"))
+
+        world = offline_world(simulation_uuid="simulation-a", upload_mode=upload_mode, num_hours_to_simulate=24 * 5)
+        world.run_entire_simulation()
+        world.wait_for_results_upload()
+        hourly_world = offline_world(simulation_uuid="simulation-a", upload_mode="hourly",
+                                     num_hours_to_simulate=24 * 5)
+        hourly_world._result_sink = hourly_sink
+        hourly_world.run_entire_simulation()
+        hourly_world.wait_for_results_upload()
+
+        num_hourly_rows = sink.query("SELECT COUNT(*) FROM simulation_results")[0][0]
+        assert num_hourly_rows == (24 * 5 if upload_mode == "both" else 0)
+        hourly_rows = hourly_sink.query(f"SELECT Timestamp, {', '.join(ROLLUP_METRIC_NAMES)}, "
+                                        f"{TEMP_SENT_OUT_METRIC_NAME} FROM simulation_results ORDER BY Timestamp")
+        columns = list(zip(*hourly_rows))
+        metric_names = ROLLUP_METRIC_NAMES + (TEMP_SENT_OUT_METRIC_NAME,)
+        expected_daily = sum_naively([timestamp[:16].replace(" ", "T") for timestamp in columns[0]],
+                                     dict(zip(metric_names, columns[1:])), hourly_world.get_current_metrics(), 10)
+        daily = sink.query(f"SELECT period_start, num_hours, {', '.join(ROLLUP_METRIC_NAMES)} "
+                           f"FROM simulation_rollups WHERE period = 'day' ORDER BY period_start")
+        assert [row[:2] for row in daily] == [(day, sums[0]) for day, sums in expected_daily.items()]
+        np.testing.assert_allclose([row[2:] for row in daily], [sums[1:] for sums in expected_daily.values()])
+        heater_index = ROLLUP_METRIC_NAMES.index("energy_consumed_by_heater")
+        assert all(row[2 + heater_index] >= 0 for row in daily)
+        assert sink.query("SELECT period_start, num_hours FROM simulation_rollups WHERE period = 'month' "
+                          "ORDER BY period_start") == hourly_sink.query(
+            "SELECT substr(Timestamp, 1, 7) || '-01', COUNT(*) FROM simulation_results GROUP BY 1 ORDER BY 1")
+
+    def test_rerun_replaces_rollups(self, recording_result_sink, offline_world):
+        for num_hours in (24 * 3, 24):
+            world = offline_world(simulation_uuid="simulation-a", upload_mode="aggregates",
+                                  num_hours_to_simulate=num_hours)
+            world.run_entire_simulation()
+            world.wait_for_results_upload()
+
+        assert "simulation-a" not in recording_result_sink.rows_by_uuid
+        rollups = recording_result_sink.rollups_by_uuid["simulation-a"]
+        assert [(row[1], row[3]) for row in rollups] == [("day", "24"), ("month", "24")]
+
+    def test_bigquery_sink_replaces_rollups_for_same_uuid(self, tmp_path):
+        bigquery_client = LocalBigQueryClient()
+        sink = BigQueryResultSink(bigquery_client=bigquery_client, table_id="project.dataset.table",
+                                  rollup_table_id="project.dataset.rollups")
+        timestamps, metrics, metrics_after_last_hour = make_hourly_metrics("2020-01-01T00:00", 24 * 3)
+        for simulation_uuid in ("simulation-a", "simulation-b", "simulation-a"):
+            rollups_file_path = tmp_path / f"{simulation_uuid}.csv"
+            with open(rollups_file_path, 'w', newline='') as rollups_file:
+                write_rollups_csv(csv.writer(rollups_file), simulation_uuid,
+                                  compute_rollups(timestamps, metrics, metrics_after_last_hour))
+            sink.write_rollups(simulation_uuid, str(rollups_file_path))
+
+        uuids = [row[0] for row in bigquery_client.tables["project.dataset.rollups"]]
+        assert (uuids.count("simulation-a"), uuids.count("simulation-b")) == (4, 4)
+        assert list(bigquery_client.tables) == ["project.dataset.rollups"]
+
+    def test_unknown_upload_mode(self, monkeypatch, offline_world):
+        with pytest.raises(KeyError):
+            offline_world(simulation_uuid="simulation-a", upload_mode="weekly")
+        monkeypatch.setenv("SIMULATION_UPLOAD_MODE", "both")
+        assert offline_world(simulation_uuid="simulation-a", upload_mode=None)._upload_mode == "both"
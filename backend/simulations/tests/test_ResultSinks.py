@@ -0,0 +1,210 @@
+import io
+import re
+import csv
+import os
+from unittest import mock
+
+import pytest
+
+# noinspection PyUnresolvedReferences
+from simulationObjects.CONSTANTS import BIGQUERY_SCHEMA
+# noinspection PyUnresolvedReferences
+from simulationObjects import ResultSinks as result_sinks_module
+# noinspection PyUnresolvedReferences
+from simulationObjects.MetricsBuffer import MetricsBuffer
+# noinspection PyUnresolvedReferences
+from simulationObjects.ResultSinks import ResultSink, SQLiteResultSink, NullResultSink, BigQueryResultSink, \
+    get_result_sink, get_result_format, submit_result_upload
+# noinspection PyUnresolvedReferences
+from simulationObjects import SimulatedWorld as simulated_world_module
+
+METRIC_NAMES = [column["name"] for column in BIGQUERY_SCHEMA[2:-1]]
+
+
+def write_output_file(path, simulation_uuid, num_hours):
+    metrics_buffer = MetricsBuffer(simulation_uuid, METRIC_NAMES, num_hours, num_padding_columns=1)
+    for hour in range(num_hours):
+        metrics_buffer.append_row(f"2023-03-03T{hour:02d}:00", [hour] * len(METRIC_NAMES))
+    if str(path).endswith(".parquet"):
+        metrics_buffer.write_parquet(str(path), BIGQUERY_SCHEMA)
+        return str(path)
+    with open(path, 'w', newline='') as output_file:
+        metrics_buffer.write_csv(csv.writer(output_file))
+    return str(path)
+
+
+class LocalBigQueryClient:
+    """
+    Local stand in for bigquery.Client, tables are lists of CSV rows - Parquet loads are turned into the same rows.
+    Only runs the load and MERGE that BigQueryResultSink sends, and keeps track of the jobs it was asked to run
+    """
+
+    def __init__(self):
+        self.tables = {}
+        self.jobs = []
+        self.queries = []
+        self.source_formats = []
+
+    def load_table_from_file(self, source_file, table_id, job_config):
+        self.source_formats.append(job_config.source_format)
+        if job_config.source_format == "PARQUET":
+            import pyarrow.parquet as pq
+            table = pq.read_table(source_file)
+            rows = [[value.strftime("%Y-%m-%dT%H:%M") if column_name == "Timestamp" else str(value)
+                     for column_name, value in row.items()] for row in table.to_pylist()]
+        else:
+            rows = list(csv.reader(io.TextIOWrapper(source_file, newline='')))
+        if job_config.write_disposition == "WRITE_TRUNCATE" or table_id not in self.tables:
+            self.tables[table_id] = []
+        self.tables[table_id] += rows
+        self.jobs.append(("load", table_id))
+        return mock.Mock(output_rows=len(rows))
+
+    def query(self, query, job_config):
+        merge = re.fullmatch(r"\s*MERGE `(?P<target>[^`]+)` t\s+USING `(?P<staging>[^`]+)` s\s+ON FALSE\s+"
+                             r"WHEN NOT MATCHED BY SOURCE AND t\.uuid = @simulation_uuid THEN DELETE\s+"
+                             r"WHEN NOT MATCHED THEN INSERT ROW\s*", query)
+        assert merge, query
+        simulation_uuid = {parameter.name: parameter.value
+                           for parameter in job_config.query_parameters}["simulation_uuid"]
+        target_rows = self.tables.get(merge["target"], [])
+        kept_rows = [row for row in target_rows if row[0] != simulation_uuid]
+        staged_rows = self.tables[merge["staging"]]
+        self.tables[merge["target"]] = kept_rows + staged_rows
+        self.jobs.append(("query", merge["target"]))
+        self.queries.append(query)
+        return mock.Mock(num_dml_affected_rows=len(target_rows) - len(kept_rows) + len(staged_rows))
+
+    def delete_table(self, table_id, not_found_ok=False):
+        if table_id not in self.tables and not not_found_ok:
+            raise LookupError(table_id)
+        self.tables.pop(table_id, None)
+
+
+class TestResultSinks:
+    def test_sqlite_sink_replaces_rows_for_same_uuid(self, tmp_path):
+        sink = SQLiteResultSink(str(tmp_path / "results.sqlite3"))
+        sink.write_results("simulation-a", write_output_file(tmp_path / "a.csv", "simulation-a", 24))
+        sink.write_results("simulation-b", write_output_file(tmp_path / "b.csv", "simulation-b", 10))
+        sink.write_results("simulation-a", write_output_file(tmp_path / "a.csv", "simulation-a", 5))
+
+        assert sink.query("SELECT uuid, COUNT(*) FROM simulation_results GROUP BY uuid ORDER BY uuid") == [
+            ("simulation-a", 5), ("simulation-b", 10)]
+        assert sink.query("SELECT energy_absorbed_from_pipes FROM simulation_results WHERE uuid = ? "
+                          "AND Timestamp = ?", ("simulation-a", "2023-03-03T04:00")) == [(4.0,)]
+
+    def test_sqlite_sink_is_indexed_on_uuid_and_timestamp(self, tmp_path):
+        sink = SQLiteResultSink(str(tmp_path / "results.sqlite3"))
+        query_plan = sink.query("EXPLAIN QUERY PLAN SELECT * FROM simulation_results WHERE uuid = 'a' "
+                                "AND Timestamp > '2023'")
+        assert "simulation_results_uuid_timestamp" in str(query_plan)
+
+    def test_bigquery_sink_replaces_rows_for_same_uuid(self, tmp_path):
+        bigquery_client = LocalBigQueryClient()
+        sink = BigQueryResultSink(bigquery_client=bigquery_client, table_id="project.dataset.table")
+        sink.write_results("simulation-a", write_output_file(tmp_path / "a.csv", "simulation-a", 24))
+        sink.write_results("simulation-b", write_output_file(tmp_path / "b.csv", "simulation-b", 10))
+        bigquery_client.jobs.clear()
+        sink.write_results("simulation-a", write_output_file(tmp_path / "a.csv", "simulation-a", 5))
+
+        uuids = [row[0] for row in bigquery_client.tables["project.dataset.table"]]
+        assert (uuids.count("simulation-a"), uuids.count("simulation-b")) == (5, 10)
+        # a staging load and one MERGE, whatever was there before
+        assert [job_type for job_type, _ in bigquery_client.jobs] == ["load", "query"]
+        assert list(bigquery_client.tables) == ["project.dataset.table"]  # staging tables are dropped
+
+    def test_bigquery_sink_passes_uuid_as_query_parameter(self, tmp_path):
+        bigquery_client = LocalBigQueryClient()
+        sink = BigQueryResultSink(bigquery_client=bigquery_client, table_id="project.dataset.table")
+        simulation_uuid = "a' OR '1'='1"
+        sink.write_results(simulation_uuid, write_output_file(tmp_path / "a.csv", simulation_uuid, 3))
+
+        assert simulation_uuid not in bigquery_client.queries[0]
+        assert sink.get_staging_table_id(simulation_uuid) != sink.get_staging_table_id("simulation-b")
+        assert [row[0] for row in bigquery_client.tables["project.dataset.table"]] == [simulation_uuid] * 3
+
+    def test_bigquery_sink_drops_staging_table_when_merge_fails(self, tmp_path):
+        bigquery_client = LocalBigQueryClient()
+        bigquery_client.query = mock.Mock(side_effect=ConnectionError("BigQuery unavailable"))
+        sink = BigQueryResultSink(bigquery_client=bigquery_client, table_id="project.dataset.table")
+        with pytest.raises(ConnectionError):
+            sink.write_results("simulation-a", write_output_file(tmp_path / "a.csv", "simulation-a", 3))
+        assert bigquery_client.tables == {}
+
+    def test_bigquery_sink_loads_parquet(self, tmp_path):
+        pytest.importorskip("pyarrow")
+        bigquery_client = LocalBigQueryClient()
+        sink = BigQueryResultSink(bigquery_client=bigquery_client, table_id="project.dataset.table")
+        sink.write_results("simulation-a", write_output_file(tmp_path / "a.csv", "simulation-a", 24))
+        csv_rows = bigquery_client.tables["project.dataset.table"]
+        sink.write_results("simulation-a", write_output_file(tmp_path / "a.parquet", "simulation-a", 24))
+
+        assert bigquery_client.source_formats == [None, "PARQUET"]  # None loads as CSV
+        assert bigquery_client.tables["project.dataset.table"] == csv_rows
+
+    @pytest.mark.parametrize("compress_idle_hours", [False, True])
+    def test_world_uploads_same_rows_as_parquet(self, monkeypatch, offline_world, compress_idle_hours):
+        pytest.importorskip("pyarrow")
+        bigquery_client = LocalBigQueryClient()
+        sink = BigQueryResultSink(bigquery_client=bigquery_client, table_id="project.dataset.table")
+        monkeypatch.setattr(simulated_world_module, "get_result_sink", lambda result_sink_name=None: sink)
+
+        rows_by_result_format = {}
+        for result_format in ("csv", "parquet"):
+            world = offline_world(simulation_uuid=f"simulation-{result_format}", num_hours_to_simulate=24 * 7,
+                                  simulation_engine="fast_forward", compress_idle_hours=compress_idle_hours,
+                                  checkpoint_interval_hours=0, result_format=result_format)
+            world.run_entire_simulation()
+            world.wait_for_results_upload()
+            rows_by_result_format[result_format] = [row[1:] for row in bigquery_client.tables["project.dataset.table"]
+                                                    if row[0] == f"simulation-{result_format}"]
+
+        assert bigquery_client.source_formats == [None, "PARQUET"]
+        assert rows_by_result_format["parquet"] == rows_by_result_format["csv"]
+        num_rows = len(rows_by_result_format["csv"])
+        assert num_rows < 24 * 7 if compress_idle_hours else num_rows == 24 * 7
+
+    def test_get_result_format(self, monkeypatch, tmp_path):
+        sqlite_sink = SQLiteResultSink(str(tmp_path / "results.sqlite3"))
+        monkeypatch.setattr(result_sinks_module, "is_pyarrow_installed", lambda: True)
+        assert get_result_format(BigQueryResultSink()) == "parquet"
+        assert get_result_format(BigQueryResultSink(), "csv") == "csv"
+        assert get_result_format(sqlite_sink) == "csv"  # only takes CSV
+        monkeypatch.setenv("SIMULATION_RESULT_FORMAT", "csv")
+        assert get_result_format(NullResultSink()) == "csv"
+        with pytest.raises(KeyError):
+            get_result_format(NullResultSink(), "avro")
+
+        monkeypatch.delenv("SIMULATION_RESULT_FORMAT")
+        monkeypatch.setattr(result_sinks_module, "is_pyarrow_installed", lambda: False)
+        assert get_result_format(BigQueryResultSink()) == "csv"
+        with pytest.raises(ImportError):
+            get_result_format(BigQueryResultSink(), "parquet")
+
+    def test_sink_missing_a_write_fails_when_built(self):
+        class ResultsOnlySink(ResultSink):
+            def write_results(self, simulation_uuid: str, output_file_path: str):
+                pass
+
+        with pytest.raises(TypeError):
+            ResultsOnlySink()
+
+    def test_get_result_sink(self, monkeypatch, tmp_path):
+        assert isinstance(get_result_sink("null"), NullResultSink)
+        assert get_result_sink("null") is get_result_sink("null")
+        monkeypatch.setenv("SIMULATION_RESULT_SINK", "null")
+        assert isinstance(get_result_sink(), NullResultSink)
+        with pytest.raises(KeyError):
+            get_result_sink("not-a-sink")
+
+    def test_upload_in_background_removes_private_copy(self, tmp_path):
+        output_file_path = write_output_file(tmp_path / "copy.csv", "simulation-a", 3)
+        submit_result_upload(NullResultSink(), "simulation-a", output_file_path, remove_file_when_done=True).result()
+        assert not os.path.exists(output_file_path)
+
+    def test_upload_in_background_raises_sink_error(self, tmp_path):
+        failing_sink = mock.Mock()
+        failing_sink.write_results.side_effect = ConnectionError("BigQuery unavailable")
+        upload = submit_result_upload(failing_sink, "simulation-a", str(tmp_path / "missing.csv"))
+        with pytest.raises(ConnectionError):
+            upload.result()
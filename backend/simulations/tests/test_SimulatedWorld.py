@@ -45,5 +45,5 @@ class TestSimulatedWorld:
 
         world.get_weather_data()
 
-        # assert world._meteo_weather_data["DNI_data"] == sample_correct_meteo_data["hourly"]["direct_normal_irradiance"]
-        assert len(world._meteo_weather_data["timestamps"]) >= len(sample_correct_meteo_data["hourly"]["time"])
+        # assert world._weather_dni.tolist() == sample_correct_meteo_data["hourly"]["direct_normal_irradiance"]
+        assert len(world._weather_timestamps) >= len(sample_correct_meteo_data["hourly"]["time"])
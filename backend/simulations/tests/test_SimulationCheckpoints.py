@@ -0,0 +1,144 @@
+import os
+import time
+
+import pytest
+import numpy as np
+
+# noinspection PyUnresolvedReferences
+from simulationObjects.SimulationCheckpoints import SimulationCheckpointStore
+# noinspection PyUnresolvedReferences
+from simulationObjects.ResultSinks import ResultSink
+
+
+class SimulatedCrash(Exception):
+    pass
+
+
+class FailingResultSink(ResultSink):
+    def write_results(self, simulation_uuid, output_file_path: str):
+        raise ConnectionError("Result sink is down")
+
+    def write_rollups(self, simulation_uuid, rollups_file_path: str):
+        raise ConnectionError("Result sink is down")
+
+
+def crash_at_hour(crash_hour):
+    def report_progress(iteration, total):
+        if iteration == crash_hour:
+            raise SimulatedCrash()
+
+    return report_progress
+
+
+@pytest.fixture
+def offline_request_defaults(offline_request_defaults):
+    return dict(offline_request_defaults, checkpoint_interval_hours=24)
+
+
+class TestSimulationCheckpoints:
+    def test_store_round_trip(self, tmp_path):
+        checkpoint_store = SimulationCheckpointStore(checkpoint_directory=str(tmp_path))
+        key = checkpoint_store.make_key("uuid-1", "request-hash")
+        assert checkpoint_store.load(key) is None
+
+        checkpoint_store.save_weather(key, ["2003-01-01T00:00", "2003-01-01T01:00", "2003-01-01T02:00"],
+                                      np.arange(3.0))
+        checkpoint_store.save(key, {"hours_simulated": 2}, 0, ["2003-01-01T00:00", "2003-01-01T01:00"],
+                              {"DNI_Value": np.array([1.0, 2.0])})
+        checkpoint_store.save(key, {"hours_simulated": 3}, 2, ["2003-01-01T02:00"], {"DNI_Value": np.array([3.0])})
+        # rows saved by a run that died before updating its state are ignored
+        checkpoint_store.save(key, {"hours_simulated": 3}, 5, ["2003-01-01T05:00"], {"DNI_Value": np.array([6.0])})
+
+        checkpoint = checkpoint_store.load(key)
+        assert checkpoint["state"] == {"hours_simulated": 3}
+        assert checkpoint["timestamps"] == ["2003-01-01T00:00", "2003-01-01T01:00", "2003-01-01T02:00"]
+        assert np.array_equal(checkpoint["metrics"]["DNI_Value"], [1, 2, 3])
+        assert np.array_equal(checkpoint["weather"]["dni_climatology"], [0, 1, 2])
+
+        checkpoint_store.delete(key)
+        assert checkpoint_store.load(key) is None
+        assert checkpoint_store.make_key("uuid-2", "request-hash") != key
+
+    def test_expired_checkpoints_are_swept(self, tmp_path):
+        checkpoint_store = SimulationCheckpointStore(checkpoint_directory=str(tmp_path), time_to_live_seconds=60)
+        for key in ("abandoned", "recent"):
+            checkpoint_store.save_weather(key, ["2003-01-01T00:00"], np.arange(1.0))
+            checkpoint_store.save(key, {"hours_simulated": 0}, 0, [], {})
+        an_hour_ago = time.time() - 60 * 60
+        os.utime(tmp_path / "abandoned", (an_hour_ago, an_hour_ago))
+
+        checkpoint_store.save_weather("new", ["2003-01-01T00:00"], np.arange(1.0))
+        assert sorted(os.listdir(tmp_path)) == ["new", "recent"]
+        assert checkpoint_store.expirations == 1
+
+    @pytest.mark.parametrize("resume_engine", ["object", "kernel"])
+    def test_resumed_run_matches_uninterrupted_run(self, offline_world, resume_engine):
+        uninterrupted_world = offline_world(simulation_uuid="uninterrupted")
+        uninterrupted_world.run_entire_simulation()
+        uninterrupted_world.wait_for_results_upload()
+        expected_output = offline_world.read_output()
+
+        crashing_world = offline_world(simulation_uuid="resumed")
+        crashing_world.set_progress_callback(crash_at_hour(60))
+        with pytest.raises(SimulatedCrash):
+            crashing_world.run_entire_simulation()
+        crashing_world._output_buffer.close()
+        assert offline_world.checkpoint_store.load(crashing_world._checkpoint_key)["state"]["hours_simulated"] == 48
+
+        resumed_world = offline_world(simulation_uuid="resumed", simulation_engine=resume_engine)
+        resumed_world.run_entire_simulation()
+        resumed_world.wait_for_results_upload()
+        resumed_output = offline_world.read_output()
+
+        assert resumed_world._resumed_from_checkpoint
+        assert len(offline_world.geocode_calls) == 2  # the resumed run didn't geocode again
+        assert [row[1:] for row in resumed_output] == [row[1:] for row in expected_output]
+        assert {row[0] for row in resumed_output} == {"resumed"}
+        assert offline_world.checkpoint_store.load(resumed_world._checkpoint_key) is None  # uploaded, so cleaned up
+
+    def test_failed_upload_is_retried_without_simulating_again(self, offline_world):
+        failing_world = offline_world()
+        failing_world._result_sink = FailingResultSink()
+        failing_world.run_entire_simulation()
+        with pytest.raises(ConnectionError):
+            failing_world.wait_for_results_upload()
+
+        progress_updates = []
+        retrying_world = offline_world()
+        retrying_world.set_progress_callback(lambda iteration, total: progress_updates.append(iteration))
+        retrying_world.run_entire_simulation()
+        retrying_world.wait_for_results_upload()
+
+        assert retrying_world._resumed_from_checkpoint
+        assert progress_updates == []
+        assert len(offline_world.read_output()) == 100
+
+    def test_checkpoints_turned_off(self, offline_world):
+        world = offline_world(checkpoint_interval_hours=0)
+        world.set_progress_callback(crash_at_hour(60))
+        with pytest.raises(SimulatedCrash):
+            world.run_entire_simulation()
+        world._output_buffer.close()
+
+        assert offline_world.checkpoint_store.load(world._checkpoint_key) is None
+        assert not offline_world(checkpoint_interval_hours=0).load_checkpoint()
+
+    def test_no_checkpoints_without_a_uuid(self, offline_world):
+        world = offline_world(simulation_uuid="")
+        world.set_progress_callback(crash_at_hour(60))
+        with pytest.raises(SimulatedCrash):
+            world.run_entire_simulation()
+        world._output_buffer.close()
+
+        assert os.listdir(offline_world.checkpoint_store._checkpoint_directory) == []
+
+    def test_bypass_result_cache_starts_from_scratch(self, offline_world):
+        crashing_world = offline_world()
+        crashing_world.set_progress_callback(crash_at_hour(60))
+        with pytest.raises(SimulatedCrash):
+            crashing_world.run_entire_simulation()
+        crashing_world._output_buffer.close()
+
+        bypassing_world = offline_world(bypass_result_cache=True)
+        bypassing_world.run_entire_simulation()
+        assert not bypassing_world._resumed_from_checkpoint
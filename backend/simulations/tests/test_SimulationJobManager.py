@@ -0,0 +1,130 @@
+import json
+import time
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+# noinspection PyUnresolvedReferences
+import main
+# noinspection PyUnresolvedReferences
+from simulationObjects.ConfigurationInputs import SimulationIncomingRequest
+# noinspection PyUnresolvedReferences
+from simulationObjects.SimulationJobManager import SimulationJobManager
+
+JOB_SECONDS = 1.0
+
+
+def slow_fake_job(job_id, request, progress_by_job_id):
+    # stands in for run_simulation_job, which needs Google Maps and BigQuery
+    total = request["num_hours_to_simulate"]
+    for iteration in range(1, 11):
+        time.sleep(JOB_SECONDS / 10)
+        progress_by_job_id[job_id] = {"status": "running", "iteration": total * iteration // 10, "total": total}
+    return {"simulation_uuid": request["simulation_uuid"], "num_hours_simulated": total}
+
+
+def failing_fake_job(job_id, request, progress_by_job_id):
+    raise EnvironmentError("Water coming back to water container colder than when it left")
+
+
+def load_sample_request():
+    with open('sampleData/sampleCorrectClientRequest.json') as sample_request_file:
+        return json.load(sample_request_file)
+
+
+def wait_for_job(job_manager, job_id, timeout_seconds=10):
+    deadline = time.time() + timeout_seconds
+    while job_manager.get_status(job_id)["status"] in ("queued", "running"):
+        assert time.time() < deadline, "job did not finish in time"
+        time.sleep(0.05)
+    return job_manager.get_status(job_id)
+
+
+@pytest.fixture
+def job_manager():
+    manager = SimulationJobManager(max_workers=2, job_function=slow_fake_job)
+    yield manager
+    manager.shutdown()
+
+
+class TestSimulationJobManager:
+    def test_submit_returns_before_job_finishes(self, job_manager):
+        start_time = time.time()
+        job_id = job_manager.submit(SimulationIncomingRequest(**load_sample_request()))
+        assert time.time() - start_time < JOB_SECONDS
+        assert job_manager.get_result(job_id) is None
+
+        assert wait_for_job(job_manager, job_id)["status"] == "succeeded"
+        assert job_manager.get_result(job_id)["num_hours_simulated"] == 170
+        progress = job_manager.get_progress(job_id)
+        assert (progress["iteration"], progress["total"], progress["percent_complete"]) == (170, 170, 100)
+
+    def test_jobs_run_concurrently(self, job_manager):
+        job_manager.submit(SimulationIncomingRequest(**load_sample_request()))  # warm up the worker processes
+        wait_for_job(job_manager, job_manager.submit(SimulationIncomingRequest(**load_sample_request())))
+
+        start_time = time.time()
+        job_ids = [job_manager.submit(SimulationIncomingRequest(**load_sample_request())) for _ in range(2)]
+        for job_id in job_ids:
+            assert wait_for_job(job_manager, job_id)["status"] == "succeeded"
+
+        # run one after the other they would take 2 * JOB_SECONDS
+        assert time.time() - start_time < 1.8 * JOB_SECONDS
+
+    def test_progress_is_reported_while_running(self, job_manager):
+        job_id = job_manager.submit(SimulationIncomingRequest(**load_sample_request()))
+        time.sleep(JOB_SECONDS / 2)
+
+        progress = job_manager.get_progress(job_id)
+        assert progress["status"] == "running"
+        assert 0 < progress["percent_complete"] < 100
+
+    def test_failed_job(self):
+        job_manager = SimulationJobManager(max_workers=1, job_function=failing_fake_job)
+        try:
+            job_id = job_manager.submit(SimulationIncomingRequest(**load_sample_request()))
+            status = wait_for_job(job_manager, job_id)
+            assert status["status"] == "failed"
+            assert "colder" in status["exception"]
+            with pytest.raises(EnvironmentError):
+                job_manager.get_result(job_id)
+        finally:
+            job_manager.shutdown()
+
+    def test_unknown_job(self, job_manager):
+        with pytest.raises(KeyError):
+            job_manager.get_status("not-a-job")
+
+    def test_job_endpoints(self, job_manager, monkeypatch):
+        monkeypatch.setattr(main, "simulation_job_manager", job_manager)
+        client = TestClient(main.app)
+
+        response = client.post("/simulationJobs", json=load_sample_request())
+        assert response.status_code == 202
+        job_id = response.json()["job_id"]
+        assert client.get(f"/simulationJobs/{job_id}/result").status_code == 202
+
+        wait_for_job(job_manager, job_id)
+        response = client.get(f"/simulationJobs/{job_id}/result")
+        assert response.status_code == 200
+        assert response.json()["result"]["num_hours_simulated"] == 170
+        assert client.get(f"/simulationJobs/{job_id}").json()["status"] == "succeeded"
+        assert client.get("/simulationJobs/not-a-job/progress").status_code == 404
+
+    def test_create_simulation_runs_off_the_event_loop(self, monkeypatch):
+        ran_on_event_loop = []
+
+        def run_entire_simulation(world):
+            try:
+                asyncio.get_running_loop()
+                ran_on_event_loop.append(True)
+            except RuntimeError:
+                ran_on_event_loop.append(False)
+
+        monkeypatch.setattr(main.SimulatedWorld, "__init__", lambda world, configuration: None)
+        monkeypatch.setattr(main.SimulatedWorld, "run_entire_simulation", run_entire_simulation)
+
+        response = TestClient(main.app).post("/createSimulation", json=load_sample_request())
+        assert response.status_code == 200
+        assert ran_on_event_loop == [False]
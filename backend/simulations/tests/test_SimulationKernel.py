@@ -0,0 +1,209 @@
+import copy
+import json
+from types import SimpleNamespace
+
+import pytest
+import numpy as np
+
+# noinspection PyUnresolvedReferences
+from simulationObjects.SimulationKernel import run_simulation_kernel, KERNEL_METRIC_COLUMNS, find_idle_runs, \
+    run_simulation_with_fast_forward
+# noinspection PyUnresolvedReferences
+from simulationObjects.HourOfYearClimatology import hour_of_year_indices
+# noinspection PyUnresolvedReferences
+from simulationObjects.SolarCollector import SolarCollector
+# noinspection PyUnresolvedReferences
+from simulationObjects.WaterPump import WaterPump
+# noinspection PyUnresolvedReferences
+from simulationObjects.WaterContainer import WaterContainer, compile_consumption_pattern
+
+SOLAR_CONFIG = {"length": 4.5, "width": 2, "solar_efficiency": 0.15}
+WATER_PUMP_CONFIG = {"max_flow_rate": 20, "maximum_temp_difference_between_water_incoming_and_outgoing_solar": 4,
+                     "minimum_temp_difference_between_water_incoming_and_outgoing_solar": 2}
+WATER_CONTAINER_CONFIG = {"water_capacity": 200,
+                          "percent_of_thermal_energy_absorbed_from_pipes": 0.85,
+                          "percent_of_thermal_energy_lost_to_waste_per_hour": 0.02,
+                          "temperature_of_external_water_source": 7,
+                          "efficiency_of_traditional_boiler": 0.75,
+                          "minimum_average_water_temperature": 50,
+                          "consumption_pattern": {
+                              f"{hour:02d}:00": {"water_used": [0, 0, 0, 0, 0, 0, 0, 55, 10, 10, 20, 0, 60, 0, 0, 5, 10,
+                                                                40, 10, 35, 10, 10, 0, 0][hour],
+                                                 "average_temperature_of_water_used": 0 if hour < 7 else
+                                                 [38, 50, 50, 30, 50, 15, 50, 50, 50, 50, 45, 50, 65, 50, 50, 50,
+                                                  50][hour - 7]}
+                              for hour in range(24)}}
+
+
+def to_namespace(config):
+    return json.loads(json.dumps(config), object_hook=lambda d: SimpleNamespace(**d))
+
+
+def make_components(water_pump_config=None, water_container_config=None):
+    return (SolarCollector(to_namespace(SOLAR_CONFIG)), WaterPump(to_namespace(water_pump_config or WATER_PUMP_CONFIG)),
+            WaterContainer(to_namespace(water_container_config or WATER_CONTAINER_CONFIG)))
+
+
+def make_dni_by_hour(num_hours):
+    hour_of_day = np.arange(num_hours) % 24
+    sunny = (hour_of_day > 6) & (hour_of_day < 19)
+    return np.where(sunny, np.random.default_rng(3).uniform(0, 900, num_hours), 0.0), hour_of_day
+
+
+def run_object_engine(solar_collector, water_pump, water_container, dni_by_hour, hour_of_year_by_hour):
+    """
+    Same steps as SimulatedWorld.start_simulation and run_one_hourly_iteration_of_simulation
+    """
+    logged_rows = []
+    dni = 0
+    for hour in range(len(dni_by_hour)):
+        row = {"DNI_Value": dni}
+        for loggable_object in (solar_collector, water_pump, water_container):
+            row.update(loggable_object.get_loggable_metrics())
+        logged_rows.append(row)
+
+        dni = dni_by_hour[hour]
+        flow_rate_for_the_hour = water_pump.get_flow_rate()
+        starting_temperature_into_solar = water_container.outgoing_water_temperature
+        temperature_of_water_in_pipes = solar_collector.add_one_hour_solar_energy(dni, flow_rate_for_the_hour,
+                                                                                  starting_temperature_into_solar)
+        water_container.run_hour_of_usage(temperature_of_water_in_pipes, flow_rate_for_the_hour,
+                                          hour_of_year=int(hour_of_year_by_hour[hour]))
+        water_pump.adjust_flow_to_current_state(starting_temperature_into_solar, temperature_of_water_in_pipes)
+    return logged_rows
+
+
+class TestSimulationKernel:
+    def test_matches_object_engine(self, capsys):
+        num_hours = 24 * 21
+        dni_by_hour, hour_of_day = make_dni_by_hour(num_hours)
+        logged_rows = run_object_engine(*make_components(), dni_by_hour, hour_of_day)
+        capsys.readouterr()
+
+        solar_collector, water_pump, water_container = make_components()
+        volume_by_hour, temperature_by_hour = compile_consumption_pattern(water_container._consumption_pattern)
+        metrics = run_simulation_kernel(solar_collector, water_pump, water_container, dni_by_hour, hour_of_day,
+                                        volume_by_hour, temperature_by_hour)
+
+        assert tuple(metrics.keys()) == KERNEL_METRIC_COLUMNS
+        for metric_name in KERNEL_METRIC_COLUMNS:
+            expected = np.array([row[metric_name] for row in logged_rows], dtype=np.float64)
+            assert metrics[metric_name] == pytest.approx(expected, rel=1e-9, abs=1e-6), metric_name
+
+    def test_writes_back_end_state(self, capsys):
+        dni_by_hour, hour_of_day = make_dni_by_hour(48)
+        object_components = make_components()
+        run_object_engine(*object_components, dni_by_hour, hour_of_day)
+        capsys.readouterr()
+
+        kernel_components = make_components()
+        run_simulation_kernel(*kernel_components, dni_by_hour, hour_of_day,
+                              *compile_consumption_pattern(kernel_components[2]._consumption_pattern))
+
+        for object_component, kernel_component in zip(object_components, kernel_components):
+            assert kernel_component.get_loggable_metrics() == pytest.approx(object_component.get_loggable_metrics())
+        assert kernel_components[2].outgoing_water_temperature == pytest.approx(
+            object_components[2].outgoing_water_temperature)
+
+    def test_water_coming_back_colder(self):
+        solar_collector, water_pump, water_container = make_components()
+        water_container.outgoing_water_temperature = 40
+        with pytest.raises(EnvironmentError):
+            run_simulation_kernel(solar_collector, water_pump, water_container, [0], [1],
+                                  *compile_consumption_pattern(water_container._consumption_pattern))
+
+    def test_compile_consumption_pattern_missing_hour(self):
+        config = copy.deepcopy(WATER_CONTAINER_CONFIG)
+        del config["consumption_pattern"]["17:00"]
+        with pytest.raises(KeyError):
+            compile_consumption_pattern(to_namespace(config).consumption_pattern)
+
+    def test_find_idle_runs(self):
+        volume_by_slot = [0, 5, 0]
+        dni_by_hour = [0, 0, 0, 0, 0, 100, 0, 0, 0, 0]
+        slot_by_hour = [0, 0, 2, 1, 0, 0, 0, 2, 0, 2]
+        assert find_idle_runs(dni_by_hour, slot_by_hour, volume_by_slot, min_run_length=3) == [(0, 3), (6, 10)]
+        assert find_idle_runs(dni_by_hour, slot_by_hour, volume_by_slot, min_run_length=1) == [(0, 3), (4, 5),
+                                                                                               (6, 10)]
+
+    @pytest.mark.parametrize("temp_differences, percent_lost_per_hour", [
+        ((2, 4), 0.02),  # pump slows down, tank falls under its minimum overnight
+        ((2, 4), 0),  # no heat lost
+        ((-4, -2), 0.02),  # pump speeds up
+        ((-1, 1), 0.3),  # pump holds, tank cools quickly
+    ])
+    def test_fast_forward_matches_kernel(self, temp_differences, percent_lost_per_hour):
+        water_pump_config = dict(WATER_PUMP_CONFIG, minimum_temp_difference_between_water_incoming_and_outgoing_solar=
+                                 temp_differences[0],
+                                 maximum_temp_difference_between_water_incoming_and_outgoing_solar=temp_differences[1])
+        water_container_config = dict(WATER_CONTAINER_CONFIG,
+                                      percent_of_thermal_energy_lost_to_waste_per_hour=percent_lost_per_hour)
+        dni_by_hour, hour_of_day = make_dni_by_hour(24 * 21)
+        dni_by_hour[24 * 3:24 * 5] = 0  # a couple of cloudy days
+
+        kernel_components = make_components(water_pump_config, water_container_config)
+        consumption_tables = compile_consumption_pattern(kernel_components[2]._consumption_pattern)
+        expected_metrics = run_simulation_kernel(*kernel_components, dni_by_hour, hour_of_day, *consumption_tables,
+                                                 initial_dni=10)
+
+        fast_forward_components = make_components(water_pump_config, water_container_config)
+        metrics, interpolated_by_hour = run_simulation_with_fast_forward(
+            *fast_forward_components, dni_by_hour, hour_of_day, *consumption_tables, initial_dni=10)
+
+        assert tuple(metrics.keys()) == KERNEL_METRIC_COLUMNS
+        for metric_name in KERNEL_METRIC_COLUMNS:
+            assert metrics[metric_name] == pytest.approx(expected_metrics[metric_name], rel=1e-9, abs=1e-6), \
+                metric_name
+        for kernel_component, fast_forward_component in zip(kernel_components, fast_forward_components):
+            assert fast_forward_component.get_state() == pytest.approx(kernel_component.get_state(), rel=1e-9)
+
+        # overnight 22:00 - 06:00 has no sun and no water used, the first row of each run is simulated
+        assert interpolated_by_hour[23] and interpolated_by_hour[24 * 3 + 3] and not interpolated_by_hour[22]
+        assert not interpolated_by_hour[24 * 3 + 14]  # cloudy 13:00 - 14:00 is idle but too short to jump over
+
+    def test_fast_forward_over_single_hours(self):
+        dni_by_hour, hour_of_day = make_dni_by_hour(24 * 7)
+        kernel_components = make_components()
+        consumption_tables = compile_consumption_pattern(kernel_components[2]._consumption_pattern)
+        expected_metrics = run_simulation_kernel(*kernel_components, dni_by_hour, hour_of_day, *consumption_tables)
+
+        fast_forward_components = make_components()
+        metrics, interpolated_by_hour = run_simulation_with_fast_forward(
+            *fast_forward_components, dni_by_hour, hour_of_day, *consumption_tables, min_idle_run_length=1)
+
+        for metric_name in KERNEL_METRIC_COLUMNS:
+            assert metrics[metric_name] == pytest.approx(expected_metrics[metric_name], rel=1e-9, abs=1e-6), \
+                metric_name
+        for kernel_component, fast_forward_component in zip(kernel_components, fast_forward_components):
+            assert fast_forward_component.get_state() == pytest.approx(kernel_component.get_state(), rel=1e-9)
+        assert interpolated_by_hour[1] and not interpolated_by_hour[0]
+
+    def test_matches_object_engine_with_weekend_and_seasonal_patterns(self, capsys):
+        water_container_config = copy.deepcopy(WATER_CONTAINER_CONFIG)
+        water_container_config["weekend_consumption_pattern"] = {
+            hour: dict(usage, water_used=usage["water_used"] * 2)
+            for hour, usage in WATER_CONTAINER_CONFIG["consumption_pattern"].items()}
+        water_container_config["monthly_consumption_patterns"] = {"February": {
+            hour: dict(usage, average_temperature_of_water_used=usage["average_temperature_of_water_used"] + 5)
+            for hour, usage in WATER_CONTAINER_CONFIG["consumption_pattern"].items()}}
+        dni_by_hour, _ = make_dni_by_hour(24 * 45)
+        hour_of_year_by_hour = hour_of_year_indices(
+            np.datetime64("2021-01-20T00:00") + np.arange(24 * 45).astype("timedelta64[h]"))
+
+        def make_calendar_components():
+            solar_collector, water_pump, _ = make_components()
+            return solar_collector, water_pump, WaterContainer(to_namespace(water_container_config),
+                                                               calendar_year=2021)
+
+        logged_rows = run_object_engine(*make_calendar_components(), dni_by_hour, hour_of_year_by_hour)
+        capsys.readouterr()
+        kernel_components = make_calendar_components()
+        metrics = run_simulation_kernel(*kernel_components, dni_by_hour, hour_of_year_by_hour,
+                                        *kernel_components[2]._consumption_by_hour_of_year.T)
+
+        for metric_name in KERNEL_METRIC_COLUMNS:
+            expected = np.array([row[metric_name] for row in logged_rows], dtype=np.float64)
+            assert metrics[metric_name] == pytest.approx(expected, rel=1e-9, abs=1e-6), metric_name
+        # Wednesday 20-Jan, then Saturday: weekends use twice the water, logged the row after the hour
+        assert metrics["volume_of_water_sent_out_of_water_container"][8] == 55
+        assert metrics["volume_of_water_sent_out_of_water_container"][24 * 3 + 8] == 110
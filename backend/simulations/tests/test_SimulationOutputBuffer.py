@@ -0,0 +1,123 @@
+import os
+import csv
+import glob
+import json
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+import pytest
+
+# noinspection PyUnresolvedReferences
+from simulationObjects.SimulationOutputBuffer import SimulationOutputBuffer
+# noinspection PyUnresolvedReferences
+from simulationObjects.SimulatedWorld import SimulatedWorld
+# noinspection PyUnresolvedReferences
+from simulationObjects.ConfigurationInputs import SimulationIncomingRequest
+# noinspection PyUnresolvedReferences
+from simulationObjects.ResultSinks import ResultSink
+# noinspection PyUnresolvedReferences
+from simulationObjects.SimulationResultCache import SimulationResultCache
+
+SIMULATION_UUIDS = ["simulation-a", "simulation-b", "simulation-c", "simulation-d"]
+
+
+class CollectingResultSink(ResultSink):
+    def __init__(self):
+        self.rows = None
+
+    def write_results(self, simulation_uuid: str, output_file_path: str):
+        with open(output_file_path, newline='') as output_file:
+            self.rows = list(csv.reader(output_file))
+
+    def write_rollups(self, simulation_uuid: str, rollups_file_path: str):
+        pass
+
+
+def run_offline_simulation(simulation_uuid: str, num_hours_to_simulate: int) -> list:
+    """
+    Whole simulation with synthetic weather and no geocoding, module level so process pools can run it
+    :return: rows uploaded
+    """
+    with open('sampleData/sampleCorrectClientRequest.json') as sample_request_file:
+        request = json.load(sample_request_file)
+    request.update(simulation_uuid=simulation_uuid, num_hours_to_simulate=num_hours_to_simulate,
+                   optional_date_of_simulation="1-January-2020", weather_provider="synthetic",
+                   result_format="csv", checkpoint_interval_hours=0)
+    world = SimulatedWorld(SimulationIncomingRequest(**request))
+    world._latitude, world._longitude = 40.67, -111.82
+    world.generate_lat_long = lambda: None
+    world._result_sink = CollectingResultSink()
+    world._simulation_result_cache = SimulationResultCache(max_entries=0)  # every run simulates and uploads
+    world.run_entire_simulation()
+    world.wait_for_results_upload()
+    return world._result_sink.rows
+
+
+class TestSimulationOutputBuffer:
+    def test_stays_in_memory_below_threshold(self, tmp_path):
+        output_buffer = SimulationOutputBuffer("simulation-a", max_memory_bytes=1024, directory=str(tmp_path))
+        csv.writer(output_buffer).writerow(["simulation-a", "2020-01-01T00:00", 1.5])
+        assert output_buffer.file_path is None
+        assert output_buffer.getvalue() == "simulation-a,2020-01-01T00:00,1.5\r\n"
+        assert os.listdir(tmp_path) == []
+
+    def test_spills_to_a_file_of_its_own(self, tmp_path):
+        output_buffer = SimulationOutputBuffer("../simulation a", max_memory_bytes=64, directory=str(tmp_path))
+        writer = csv.writer(output_buffer)
+        for hour in range(10):
+            writer.writerow(["../simulation a", hour])
+
+        file_name = os.path.basename(output_buffer.file_path)
+        assert os.path.dirname(output_buffer.file_path) == str(tmp_path)
+        assert file_name.startswith("simulationOutput-___simulation_a-") and file_name.endswith(".csv")
+        assert [int(row[1]) for row in csv.reader(output_buffer.getvalue().splitlines())] == list(range(10))
+
+        other_buffer = SimulationOutputBuffer("../simulation a", max_memory_bytes=0, directory=str(tmp_path))
+        other_buffer.write("x")
+        assert other_buffer.file_path != output_buffer.file_path
+        other_buffer.close()
+
+    def test_detached_file_belongs_to_the_caller(self, tmp_path):
+        output_buffer = SimulationOutputBuffer("simulation-a", directory=str(tmp_path))
+        output_buffer.write("a,b\r\n")
+        file_path = output_buffer.detach_file_path()
+        assert output_buffer.closed
+
+        output_buffer.close()  # already handed over, so the file stays
+        with open(file_path, newline='') as detached_file:
+            assert detached_file.read() == "a,b\r\n"
+
+    def test_file_for_other_formats(self, tmp_path):
+        output_buffer = SimulationOutputBuffer("simulation-a", max_memory_bytes=0, directory=str(tmp_path))
+        output_buffer.write("a,b\r\n")
+        file_path = output_buffer.make_file_path(".parquet")
+        assert file_path.endswith(".parquet") and os.listdir(tmp_path) == [os.path.basename(file_path)]
+
+        output_buffer.close()
+        assert os.listdir(tmp_path) == []
+
+    def test_close_removes_spilled_file(self, tmp_path):
+        output_buffer = SimulationOutputBuffer("simulation-a", max_memory_bytes=0, directory=str(tmp_path))
+        output_buffer.write("a,b\r\n")
+        assert os.path.exists(output_buffer.file_path)
+        output_buffer.close()
+        assert output_buffer.closed
+        assert os.listdir(tmp_path) == []
+
+    @pytest.mark.parametrize("max_memory_bytes", ["0", "16777216"])
+    @pytest.mark.parametrize("executor_class", [ThreadPoolExecutor, ProcessPoolExecutor])
+    def test_parallel_worlds_keep_their_own_output(self, monkeypatch, executor_class, max_memory_bytes):
+        monkeypatch.setenv("SIMULATION_OUTPUT_BUFFER_MAX_MEMORY_BYTES", max_memory_bytes)
+        num_hours = [100 + 10 * index for index in range(len(SIMULATION_UUIDS))]
+        expected_rows = [run_offline_simulation(simulation_uuid, hours)
+                         for simulation_uuid, hours in zip(SIMULATION_UUIDS, num_hours)]
+
+        with executor_class(max_workers=len(SIMULATION_UUIDS)) as executor:
+            parallel_rows = list(executor.map(run_offline_simulation, SIMULATION_UUIDS, num_hours))
+
+        for simulation_uuid, hours, rows, expected in zip(SIMULATION_UUIDS, num_hours, parallel_rows, expected_rows):
+            assert len(rows) == hours
+            assert {row[0] for row in rows} == {simulation_uuid}
+            assert rows == expected
+        # spilled files are gone once uploaded
+        assert not glob.glob(os.path.join(tempfile.gettempdir(), "simulationOutput-simulation-?-*.csv"))
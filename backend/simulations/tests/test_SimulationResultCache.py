@@ -0,0 +1,103 @@
+import json
+
+import pytest
+import numpy as np
+
+# noinspection PyUnresolvedReferences
+from simulationObjects.ConfigurationInputs import SimulationIncomingRequest
+# noinspection PyUnresolvedReferences
+from simulationObjects.SimulationResultCache import SimulationResultCache, make_request_hash
+
+
+def load_sample_request(**overrides):
+    with open('sampleData/sampleCorrectClientRequest.json') as sample_request_file:
+        request = json.load(sample_request_file)
+    request.update(num_hours_to_simulate=48, weather_provider="synthetic", result_sink="null", **overrides)
+    return request
+
+
+def make_metrics(num_hours=3):
+    return ["2003-03-03T00:00", "2003-03-03T01:00", "2003-03-03T02:00"][:num_hours], \
+        {"DNI_Value": np.arange(num_hours, dtype=float)}, {"DNI_Value": float(num_hours)}
+
+
+@pytest.fixture
+def offline_request_defaults():
+    return {"num_hours_to_simulate": 48, "weather_provider": "synthetic", "result_sink": "null"}
+
+
+@pytest.fixture
+def offline_result_cache():
+    return SimulationResultCache()
+
+
+class TestSimulationResultCache:
+    def test_request_hash_ignores_uuid_and_formatting(self):
+        request = load_sample_request()
+        same_request = load_sample_request(simulation_uuid="another-uuid", simulation_engine="kernel")
+        same_request["solar"]["width"] = float(request["solar"]["width"])
+        same_request["water_container"]["consumption_pattern"] = dict(
+            reversed(request["water_container"]["consumption_pattern"].items()))
+        different_request = load_sample_request()
+        different_request["water_container"]["consumption_pattern"]["12:00"]["water_used"] += 1
+
+        request_hash = make_request_hash(SimulationIncomingRequest(**request))
+        assert make_request_hash(SimulationIncomingRequest(**same_request)) == request_hash
+        assert make_request_hash(SimulationIncomingRequest(**different_request)) != request_hash
+        assert make_request_hash(SimulationIncomingRequest(**request), {"date": "2023-03-10"}) != request_hash
+
+    def test_lru_eviction(self):
+        result_cache = SimulationResultCache(max_entries=2)
+        result_cache.put("a", *make_metrics())
+        result_cache.put("b", *make_metrics())
+        result_cache.get("a")
+        result_cache.put("c", *make_metrics())
+
+        assert result_cache.get("b") is None
+        timestamps, metrics, metrics_after_last_hour = result_cache.get("a")
+        assert timestamps == make_metrics()[0]
+        assert np.array_equal(metrics["DNI_Value"], [0, 1, 2])
+        assert metrics_after_last_hour == {"DNI_Value": 3.0}
+        assert result_cache.get_stats() == {"hits": 2, "misses": 1, "entries": 2}
+
+    def test_resubmitted_request_is_served_from_cache(self, offline_world):
+        first_world = offline_world(simulation_uuid="first-uuid", optional_date_of_simulation="1-January-2020")
+        first_world.run_entire_simulation()
+        first_world.wait_for_results_upload()
+        first_output = offline_world.read_output()
+
+        second_world = offline_world(simulation_uuid="second-uuid", optional_date_of_simulation="1-January-2020")
+        second_world.run_entire_simulation()
+        second_world.wait_for_results_upload()
+        second_output = offline_world.read_output()
+
+        assert not first_world._served_from_result_cache
+        assert second_world._served_from_result_cache
+        assert len(offline_world.geocode_calls) == 1
+        assert len(second_output) == 48
+        assert [row[1:] for row in second_output] == [row[1:] for row in first_output]
+        assert {row[0] for row in second_output} == {"second-uuid"}
+
+    def test_bypass_result_cache(self, offline_world):
+        offline_world(optional_date_of_simulation="2-January-2020").run_entire_simulation()
+        bypassing_world = offline_world(optional_date_of_simulation="2-January-2020", bypass_result_cache=True)
+        bypassing_world.run_entire_simulation()
+
+        assert not bypassing_world._served_from_result_cache
+        assert len(offline_world.geocode_calls) == 2
+
+    def test_resubmission_replaces_rows_uploaded_under_the_same_uuid_since(self, offline_world,
+                                                                           recording_result_sink):
+        def run(optional_date_of_simulation):
+            world = offline_world(simulation_uuid="U", optional_date_of_simulation=optional_date_of_simulation)
+            world.run_entire_simulation()
+            world.wait_for_results_upload()
+            return world, [row[1:] for row in recording_result_sink.rows_by_uuid["U"]]
+
+        _, first_rows = run("3-January-2020")
+        _, second_rows = run("4-January-2020")
+        resubmitted_world, resubmitted_rows = run("3-January-2020")
+
+        assert second_rows != first_rows
+        assert resubmitted_world._served_from_result_cache
+        assert resubmitted_rows == first_rows
@@ -0,0 +1,107 @@
+import json
+import time
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+
+# noinspection PyUnresolvedReferences
+import main
+# noinspection PyUnresolvedReferences
+from simulationObjects import SimulationStream as simulation_stream_module
+# noinspection PyUnresolvedReferences
+from simulationObjects.SimulationStream import SimulationStream, TooManySimulationStreams
+
+
+def parse_server_sent_events(lines):
+    events = []
+    for line in lines:
+        line = line.rstrip("\n")
+        if line.startswith("event: "):
+            event_name = line[len("event: "):]
+        elif line.startswith("data: "):
+            events.append((event_name, json.loads(line[len("data: "):])))
+    return events
+
+
+class TestSimulationStream:
+    @pytest.mark.parametrize("simulation_engine", ["object", "kernel"])
+    def test_stream_endpoint(self, offline_world, simulation_engine):
+        client = TestClient(main.app)
+        with client.stream("POST", "/simulationStream",
+                           json=offline_world.make_request(simulation_engine=simulation_engine)) as response:
+            assert response.status_code == 200
+            assert response.headers["content-type"].startswith("text/event-stream")
+            events = parse_server_sent_events(response.iter_lines())
+
+        event_names = [event_name for event_name, _ in events]
+        assert event_names[0] == "start" and event_names[-1] == "done"
+        assert event_names.count("rows") == 5  # 100 hours, a day at a time
+
+        start = events[0][1]
+        assert start["num_hours_to_simulate"] == 100 and start["columns"][:2] == ["Timestamp", "DNI_Value"]
+        rows_events = [data for event_name, data in events if event_name == "rows"]
+        assert len(rows_events[0]["rows"]) == 24
+        assert [rows_event["first_row"] for rows_event in rows_events] == [0, 24, 48, 72, 96]
+
+        streamed_rows = [row for rows_event in rows_events for row in rows_event["rows"]]
+        written_rows = offline_world.read_output()
+        assert len(streamed_rows) == 100
+        assert [[float(value) for value in row[2:2 + len(start["columns"]) - 1]] for row in written_rows] == \
+               [row[1:] for row in streamed_rows]
+        assert [row[1] for row in written_rows] == [row[0] for row in streamed_rows]
+
+        progress = [data for event_name, data in events if event_name == "progress"][-1]
+        assert (progress["iteration"], progress["total"], progress["percent_complete"]) == (100, 100, 100)
+        assert progress["eta_seconds"] == 0 and progress["iterations_per_second"] > 0
+
+    def test_slow_client_holds_the_simulation_back(self, offline_world):
+        world = offline_world()
+        simulation_stream = SimulationStream(world, rows_per_batch=1, max_queued_events=2)
+        simulation_stream.start()
+        time.sleep(0.5)
+
+        # nothing read yet, so the simulation is parked on the third event
+        assert world._num_hours_simulated <= 2
+        assert simulation_stream.get_event(timeout=1)[0] == "start"
+
+        simulation_stream.close()
+        simulation_stream._thread.join(timeout=5)
+        assert not simulation_stream._thread.is_alive()
+        assert world._num_hours_simulated < 100
+        assert world._output_buffer.closed
+
+    def test_stream_ends_with_error(self, offline_world):
+        world = offline_world()
+        world._water_container._efficiency_of_traditional_boiler = 0  # divides by zero once the boiler kicks in
+        world._water_container._minimum_average_water_temp = 1000
+        simulation_stream = SimulationStream(world)
+        simulation_stream.start()
+
+        events = []
+        while not events or events[-1][0] not in ("done", "error"):
+            events.append(simulation_stream.get_event(timeout=5))
+        assert events[-1][0] == "error"
+        assert "division by zero" in events[-1][1]["exception"]
+        simulation_stream._thread.join(timeout=5)
+        assert world._output_buffer.closed
+
+    def test_streams_beyond_the_limit_are_turned_away(self, offline_world, monkeypatch):
+        stream_slots = threading.BoundedSemaphore(1)
+        monkeypatch.setattr(simulation_stream_module, "get_shared_simulation_stream_slots", lambda: stream_slots)
+        parked_stream = SimulationStream(offline_world(), max_queued_events=1)
+        parked_stream.start()
+
+        response = TestClient(main.app).post("/simulationStream", json=offline_world.make_request())
+        assert response.status_code == 503
+        with pytest.raises(TooManySimulationStreams):
+            SimulationStream(offline_world()).start()
+
+        # the slot is given back once the stream stops, whichever way it stops
+        parked_stream.close()
+        parked_stream._thread.join(timeout=5)
+        finished_stream = SimulationStream(offline_world())
+        finished_stream.start()
+        finished_stream._thread.join(timeout=5)
+        assert finished_stream.get_event(timeout=1)[0] == "start"
+        assert stream_slots.acquire(blocking=False)
@@ -35,6 +35,10 @@ Test Plan:
 from simulationObjects.WaterContainer import WaterContainer
 # noinspection PyUnresolvedReferences
 from simulationObjects.CONSTANTS import SPECIFIC_HEAT_CAPACITY_OF_WATER
+# noinspection PyUnresolvedReferences
+from simulationObjects.HourOfYearClimatology import hour_of_year_index
+
+import numpy as np
 
 import copy
 import json
@@ -114,6 +118,10 @@ COMPLETE_CONFIG = {"water_capacity": 200,
                            "water_used": 10,
                            "average_temperature_of_water_used": 50
                        },
+                       "17:00": {
+                           "water_used": 40,
+                           "average_temperature_of_water_used": 50
+                       },
                        "18:00": {
                            "water_used": 10,
                            "average_temperature_of_water_used": 50
@@ -154,15 +162,14 @@ class TestWaterContainer:
         assert container.get_loggable_metrics()[
                    "current_thermal_energy_in_water_container"] == 50 * 50 * SPECIFIC_HEAT_CAPACITY_OF_WATER
 
-    def test_process_energy_outflow_for_hour_of_day(self):
+    def test_process_energy_outflow_for_hour_of_year(self):
         config = copy.deepcopy(COMPLETE_CONFIG)
         config["water_capacity"] = 50
-        config["consumption_pattern"] = {
-            "01:00": {'water_used': 10, "average_temperature_of_water_used": 60}}
+        config["consumption_pattern"]["01:00"] = {'water_used': 10, "average_temperature_of_water_used": 60}
         config = json.dumps(config)
         config = json.loads(config, object_hook=lambda d: SimpleNamespace(**d))
         container = WaterContainer(config)
-        container.process_energy_outflow_for_hour_of_day("01:00")
+        container.process_energy_outflow_for_hour_of_year(1)
         assert container._volume_of_water_sent_out_of_water_container == 10
         assert container._average_temp_of_water_sent_out_of_water_container == 60
         assert container._energy_sent_out_of_water_container == 10 * 60 * SPECIFIC_HEAT_CAPACITY_OF_WATER
@@ -174,7 +181,7 @@ class TestWaterContainer:
         config = json.loads(config, object_hook=lambda d: SimpleNamespace(**d))
         container = WaterContainer(config)
         with pytest.raises(EnvironmentError):
-            container.run_hour_of_usage(40, 5, "01:00")
+            container.run_hour_of_usage(40, 5, 1)
 
     def test_hashing_and_equality_methods(self):
         config = copy.deepcopy(COMPLETE_CONFIG)
@@ -189,10 +196,68 @@ class TestWaterContainer:
     def test_run_hour_of_usage(self):
         config = copy.deepcopy(COMPLETE_CONFIG)
         config["water_capacity"] = 50
-        config["consumption_pattern"] = {
-            "01:00": {"water_used": 10, "average_temperature_of_water_used": 60}}
+        config["consumption_pattern"]["01:00"] = {"water_used": 10, "average_temperature_of_water_used": 60}
         config = json.dumps(config)
         config = json.loads(config, object_hook=lambda d: SimpleNamespace(**d))
         container = WaterContainer(config)
-        container.run_hour_of_usage(52, 8, "01:00")
+        container.run_hour_of_usage(52, 8, 1)
         assert container.outgoing_water_temperature == pytest.approx(65, rel=1e-2)
+
+    def test_consumption_pattern_compiled_at_construction(self):
+        config = copy.deepcopy(COMPLETE_CONFIG)
+        config = json.loads(json.dumps(config), object_hook=lambda d: SimpleNamespace(**d))
+        container = WaterContainer(config)
+        assert container._consumption_by_hour_of_year.shape == (24 * 366, 2)
+        assert container._consumption_by_hour_of_year.dtype == np.float32
+        # same pattern every day of the year
+        assert (container._consumption_volume_by_hour_of_year[19],
+                container._consumption_temperature_by_hour_of_year[19]) == (35, 65)
+        assert (container._consumption_volume_by_hour_of_year[24 * 200 + 19],
+                container._consumption_temperature_by_hour_of_year[24 * 200 + 19]) == (35, 65)
+        assert type(container._consumption_volume_by_hour_of_year[19]) is float
+
+    def test_weekend_monthly_and_holiday_patterns(self):
+        def pattern(water_used):
+            return {f"{hour:02d}:00": {"water_used": water_used, "average_temperature_of_water_used": 50}
+                    for hour in range(24)}
+
+        config = copy.deepcopy(COMPLETE_CONFIG)
+        config.update(consumption_pattern=pattern(1), weekend_consumption_pattern=pattern(2),
+                      monthly_consumption_patterns={"July": pattern(3)}, holiday_consumption_pattern=pattern(4),
+                      holidays=["07-04", "12-25"])
+        config = json.loads(json.dumps(config), object_hook=lambda d: SimpleNamespace(**d))
+        water_used_by_day = WaterContainer(config, calendar_year=2021)._consumption_by_hour_of_year[::24, 0]
+
+        def day_of_year(month, day):
+            return hour_of_year_index(month, day, 0) // 24
+
+        assert water_used_by_day[day_of_year(1, 4)] == 1  # Monday
+        assert water_used_by_day[day_of_year(1, 9)] == 2  # Saturday
+        assert water_used_by_day[day_of_year(7, 5)] == 3  # Monday in July
+        assert water_used_by_day[day_of_year(7, 10)] == 2  # Saturday in July, weekends win over months
+        assert water_used_by_day[day_of_year(7, 4)] == 4  # Sunday, but a holiday
+        assert water_used_by_day[day_of_year(12, 25)] == 4
+        assert water_used_by_day[day_of_year(2, 29)] == 1  # 2021 isn't a leap year, follows Sunday 28-Feb
+        # weekends move with the year
+        assert WaterContainer(config, calendar_year=2022)._consumption_by_hour_of_year[
+                   day_of_year(1, 9) * 24, 0] == 2  # Sunday
+        assert WaterContainer(config, calendar_year=2022)._consumption_by_hour_of_year[
+                   day_of_year(1, 4) * 24, 0] == 1  # Tuesday
+
+    @pytest.mark.parametrize("profiles", [
+        {"monthly_consumption_patterns": {"Julember": COMPLETE_CONFIG["consumption_pattern"]}},  # not a month
+        {"holidays": ["12-25"]},  # no holiday pattern
+        {"holidays": ["25-12"], "holiday_consumption_pattern": COMPLETE_CONFIG["consumption_pattern"]},  # not MM-DD
+    ])
+    def test_invalid_consumption_profiles(self, profiles):
+        config = dict(copy.deepcopy(COMPLETE_CONFIG), **profiles)
+        config = json.loads(json.dumps(config), object_hook=lambda d: SimpleNamespace(**d))
+        with pytest.raises(KeyError):
+            WaterContainer(config)
+
+    def test_consumption_pattern_not_defined(self):
+        config = copy.deepcopy(COMPLETE_CONFIG)
+        del config["consumption_pattern"]["17:00"]
+        config = json.loads(json.dumps(config), object_hook=lambda d: SimpleNamespace(**d))
+        with pytest.raises(KeyError, match="17:00"):
+            WaterContainer(config)
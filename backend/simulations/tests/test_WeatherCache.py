@@ -0,0 +1,102 @@
+import pytest
+import numpy as np
+
+# noinspection PyUnresolvedReferences
+from simulationObjects import WeatherCache as weather_cache_module
+# noinspection PyUnresolvedReferences
+from simulationObjects.WeatherCache import WeatherCache
+
+START_DATE = "2003-03-03"
+END_DATE = "2023-03-03"
+
+
+def make_weather_data(num_hours=24 * 30):
+    timestamps = np.arange(np.datetime64('2003-03-03T00:00'), num_hours, dtype='datetime64[h]').astype('datetime64[m]')
+    dni_values = np.linspace(0, 900, num_hours, dtype=np.float32)
+    dni_values[5] = np.nan
+    return timestamps, dni_values
+
+
+class TestWeatherCache:
+    def test_miss_then_memory_hit(self, tmp_path):
+        cache = WeatherCache(cache_directory=str(tmp_path))
+        assert cache.get(43.6443, -79.3836, START_DATE, END_DATE) is None
+
+        timestamps, dni_values = make_weather_data()
+        cache.put(43.6443, -79.3836, START_DATE, END_DATE, timestamps, dni_values)
+        cached_timestamps, cached_dni_values = cache.get(43.6443, -79.3836, START_DATE, END_DATE)
+
+        assert np.array_equal(cached_timestamps, timestamps)
+        assert np.array_equal(cached_dni_values, dni_values, equal_nan=True)
+        assert cache.get_stats()["misses"] == 1
+        assert cache.get_stats()["memory_hits"] == 1
+
+    def test_disk_hit_is_memory_mapped(self, tmp_path):
+        timestamps, dni_values = make_weather_data()
+        WeatherCache(cache_directory=str(tmp_path)).put(43.6443, -79.3836, START_DATE, END_DATE, timestamps,
+                                                        dni_values)
+
+        fresh_cache = WeatherCache(cache_directory=str(tmp_path))  # e.g. after a restart
+        cached_timestamps, cached_dni_values = fresh_cache.get(43.6443, -79.3836, START_DATE, END_DATE)
+
+        assert isinstance(cached_dni_values, np.memmap)
+        assert cached_timestamps.dtype == np.dtype('datetime64[m]')
+        assert str(cached_timestamps[0]) == "2003-03-03T00:00"
+        assert np.array_equal(cached_dni_values, dni_values, equal_nan=True)
+        assert fresh_cache.get_stats()["disk_hits"] == 1
+
+    def test_nearby_coordinates_share_entry(self, tmp_path):
+        cache = WeatherCache(cache_directory=str(tmp_path), grid_size_degrees=0.1)
+        timestamps, dni_values = make_weather_data()
+        cache.put(43.6443, -79.3836, START_DATE, END_DATE, timestamps, dni_values)
+
+        assert cache.get(43.6201, -79.4102, START_DATE, END_DATE) is not None
+        assert cache.get(43.8443, -79.3836, START_DATE, END_DATE) is None
+        assert cache.get(43.6443, -79.3836, "2003-03-04", END_DATE) is None
+
+    def test_entries_expire(self, tmp_path, monkeypatch):
+        cache = WeatherCache(cache_directory=str(tmp_path), time_to_live_seconds=60)
+        timestamps, dni_values = make_weather_data()
+        cache.put(43.6443, -79.3836, START_DATE, END_DATE, timestamps, dni_values)
+
+        real_time = weather_cache_module.time.time
+        monkeypatch.setattr(weather_cache_module.time, "time", lambda: real_time() + 120)
+
+        assert cache.get(43.6443, -79.3836, START_DATE, END_DATE) is None
+        assert cache.get_stats()["expirations"] == 1  # once, although both tiers held it
+        assert list(tmp_path.glob("*.npy")) == []
+
+        cache.put(43.6443, -79.3836, START_DATE, END_DATE, timestamps, dni_values)
+        cache = WeatherCache(cache_directory=str(tmp_path), time_to_live_seconds=60)  # only on disk
+        assert cache.get(43.6443, -79.3836, START_DATE, END_DATE) is None
+        assert cache.get_stats()["expirations"] == 1
+
+    def test_disk_tier_evicts_least_recently_used(self, tmp_path):
+        timestamps, dni_values = make_weather_data()
+        entry_bytes = 2 * 128 + timestamps.nbytes + dni_values.nbytes  # .npy header is 128 bytes
+        cache = WeatherCache(cache_directory=str(tmp_path), max_disk_bytes=2 * entry_bytes)
+
+        cache.put(10, 10, START_DATE, END_DATE, timestamps, dni_values)
+        cache.put(20, 20, START_DATE, END_DATE, timestamps, dni_values)
+        cache.get(10, 10, START_DATE, END_DATE)
+        cache.put(30, 30, START_DATE, END_DATE, timestamps, dni_values)
+
+        assert len(list(tmp_path.glob("*.dni.npy"))) == 2
+        assert cache.get(20, 20, START_DATE, END_DATE) is None
+        assert cache.get(10, 10, START_DATE, END_DATE) is not None
+        assert cache.get_stats()["evictions"] == 1
+
+    def test_memory_tier_is_bounded(self, tmp_path):
+        timestamps, dni_values = make_weather_data()
+        cache = WeatherCache(cache_directory=str(tmp_path), max_memory_bytes=timestamps.nbytes + dni_values.nbytes)
+
+        cache.put(10, 10, START_DATE, END_DATE, timestamps, dni_values)
+        cache.put(20, 20, START_DATE, END_DATE, timestamps, dni_values)
+
+        assert cache.get_stats()["memory_entries"] == 1
+        assert cache.get(10, 10, START_DATE, END_DATE) is not None  # still on disk
+        assert cache.get_stats()["disk_hits"] == 1
+
+    def test_invalid_grid_size(self, tmp_path):
+        with pytest.raises(ValueError):
+            WeatherCache(cache_directory=str(tmp_path), grid_size_degrees=0)
@@ -0,0 +1,119 @@
+import time
+from unittest import mock
+
+import pytest
+import numpy as np
+
+# noinspection PyUnresolvedReferences
+from simulationObjects.WeatherCache import WeatherCache
+# noinspection PyUnresolvedReferences
+from simulationObjects.WeatherProviders import SyntheticClearSkyWeatherProvider, OpenMeteoWeatherProvider, \
+    WeatherProvider, clear_sky_dni, get_weather_provider, split_into_yearly_chunks, fetch_weather_history
+
+
+class SlowFakeWeatherProvider(WeatherProvider):
+    """Synthetic weather that takes a while and remembers what it was asked for, like a slow Open Meteo"""
+
+    def __init__(self, seconds_per_request=0):
+        self.requested_chunks = []
+        self._seconds_per_request = seconds_per_request
+
+    def get_hourly_dni(self, latitude, longitude, start_date, end_date):
+        self.requested_chunks.append((start_date, end_date))
+        time.sleep(self._seconds_per_request)
+        return SyntheticClearSkyWeatherProvider().get_hourly_dni(latitude, longitude, start_date, end_date)
+
+
+def noon_dni(latitude, date):
+    return clear_sky_dni(np.array([f"{date}T12:00"], dtype='datetime64[m]'), latitude)[0]
+
+
+class TestWeatherProviders:
+    def test_synthetic_twenty_years_is_fast_and_deterministic(self):
+        provider = SyntheticClearSkyWeatherProvider()
+        start_time = time.time()
+        timestamps, dni_values = provider.get_hourly_dni(40.67, -111.82, "2003-03-03", "2023-03-03")
+        assert time.time() - start_time < 1
+
+        assert str(timestamps[0]) == "2003-03-03T00:00"
+        assert str(timestamps[-1]) == "2023-03-03T23:00"  # end date is included, like Open Meteo
+        assert dni_values.dtype == np.float32
+        assert np.array_equal(dni_values, provider.get_hourly_dni(40.67, -111.82, "2003-03-03", "2023-03-03")[1])
+
+    def test_clear_sky_follows_the_sun(self):
+        timestamps = np.arange(np.datetime64("2023-06-21T00:00"), np.datetime64("2023-06-22T00:00"),
+                               np.timedelta64(1, 'h'))
+        dni_values = clear_sky_dni(timestamps, 40.67)
+
+        assert dni_values[0] == 0 and dni_values[23] == 0  # night
+        assert np.argmax(dni_values) == 12
+        assert 800 < dni_values[12] < 1353
+        assert noon_dni(40.67, "2023-06-21") > noon_dni(40.67, "2023-12-21")
+        assert noon_dni(-33.9, "2023-12-21") > noon_dni(-33.9, "2023-06-21")  # southern hemisphere summer
+        assert noon_dni(78.2, "2023-12-21") == 0  # polar night
+
+    def test_synthetic_cloudiness(self):
+        clear_dni = SyntheticClearSkyWeatherProvider().get_hourly_dni(40.67, -111.82, "2023-01-01", "2023-01-31")[1]
+        cloudy_dni = SyntheticClearSkyWeatherProvider(cloudiness_seed=1).get_hourly_dni(
+            40.67, -111.82, "2023-01-01", "2023-01-31")[1]
+
+        assert np.all(cloudy_dni <= clear_dni)
+        assert cloudy_dni.sum() < clear_dni.sum()
+        assert np.array_equal(cloudy_dni, SyntheticClearSkyWeatherProvider(cloudiness_seed=1).get_hourly_dni(
+            40.67, -111.82, "2023-01-01", "2023-01-31")[1])
+
+    def test_open_meteo(self):
+        meteo_response = mock.Mock()
+        meteo_response.json.return_value = {"hourly": {"time": ["2003-03-03T00:00", "2003-03-03T01:00"],
+                                                       "direct_normal_irradiance": [0.0, None]}}
+        session = mock.Mock()
+        session.get.return_value = meteo_response
+        provider = OpenMeteoWeatherProvider(timezone="auto", timeout_seconds=(1, 2), session=session)
+
+        timestamps, dni_values = provider.get_hourly_dni(43.64, -79.38, "2003-03-03", "2023-03-03")
+
+        assert session.get.call_args.kwargs["params"]["timezone"] == "auto"
+        assert session.get.call_args.kwargs["params"]["start_date"] == "2003-03-03"
+        assert session.get.call_args.kwargs["timeout"] == (1, 2)
+        assert str(timestamps[1]) == "2003-03-03T01:00"
+        assert np.isnan(dni_values[1])  # missing hours become NaN
+
+    def test_get_weather_provider(self, monkeypatch):
+        assert isinstance(get_weather_provider("synthetic"), SyntheticClearSkyWeatherProvider)
+        assert isinstance(get_weather_provider("open_meteo"), OpenMeteoWeatherProvider)
+        monkeypatch.setenv("SIMULATION_WEATHER_PROVIDER", "synthetic")
+        assert get_weather_provider() is get_weather_provider("synthetic")
+        with pytest.raises(KeyError):
+            get_weather_provider("not-a-provider")
+
+    def test_split_into_yearly_chunks(self):
+        assert split_into_yearly_chunks("2003-03-03", "2005-02-24") == [
+            ("2003-01-01", "2003-12-31"), ("2004-01-01", "2004-12-31"), ("2005-01-01", "2005-02-24")]
+        assert split_into_yearly_chunks("2023-01-05", "2023-01-06") == [("2023-01-01", "2023-01-06")]
+
+    def test_fetch_weather_history_only_fetches_missing_years(self, tmp_path):
+        weather_cache = WeatherCache(cache_directory=str(tmp_path))
+        provider = SlowFakeWeatherProvider()
+
+        timestamps, dni_values = fetch_weather_history(provider, weather_cache, 40.67, -111.82, "2003-03-03",
+                                                       "2023-03-03")
+        assert len(provider.requested_chunks) == 21
+        assert str(timestamps[0]) == "2003-03-03T00:00" and str(timestamps[-1]) == "2023-03-03T23:00"
+        expected_timestamps, expected_dni_values = SyntheticClearSkyWeatherProvider().get_hourly_dni(
+            40.67, -111.82, "2003-03-03", "2023-03-03")
+        assert np.array_equal(timestamps, expected_timestamps)
+        assert np.array_equal(dni_values, expected_dni_values)
+
+        # a simulation starting a week later only needs the current partial year again
+        provider.requested_chunks.clear()
+        timestamps, _ = fetch_weather_history(provider, weather_cache, 40.67, -111.82, "2003-03-10", "2023-03-10")
+        assert provider.requested_chunks == [("2023-01-01", "2023-03-10")]
+        assert str(timestamps[0]) == "2003-03-10T00:00" and str(timestamps[-1]) == "2023-03-10T23:00"
+
+    def test_fetch_weather_history_fetches_concurrently(self, tmp_path):
+        provider = SlowFakeWeatherProvider(seconds_per_request=0.3)
+        start_time = time.time()
+        fetch_weather_history(provider, WeatherCache(cache_directory=str(tmp_path)), 40.67, -111.82, "2020-01-01",
+                              "2023-12-31", max_concurrent_requests=4)
+        assert len(provider.requested_chunks) == 4
+        assert time.time() - start_time < 2 * 0.3
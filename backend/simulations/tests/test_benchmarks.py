@@ -0,0 +1,79 @@
+import os
+
+import numpy as np
+
+# noinspection PyUnresolvedReferences
+from benchmarks.benchmarkSimulation import run_benchmarks
+# noinspection PyUnresolvedReferences
+from benchmarks.benchmarkComponentMemory import run_component_memory_benchmark
+# noinspection PyUnresolvedReferences
+from benchmarks.benchmarkWeatherMemory import run_weather_memory_benchmark
+# noinspection PyUnresolvedReferences
+from benchmarks.benchmarkColdStart import run_cold_start_benchmark
+# noinspection PyUnresolvedReferences
+from benchmarks.benchmarkExternalClients import run_external_clients_benchmark
+# noinspection PyUnresolvedReferences
+from benchmarks.benchmarkResultFormats import run_result_formats_benchmark
+# noinspection PyUnresolvedReferences
+from benchmarks.syntheticWeather import make_synthetic_weather, save_weather_fixture, load_weather_fixture
+
+
+class TestBenchmarks:
+    def test_synthetic_weather(self):
+        timestamps, dni_values = make_synthetic_weather("2003-03-03", num_years=1)
+        assert len(timestamps) == 24 * 366  # 2003-03-03 to 2004-03-03 crosses 29 February
+        assert str(timestamps[0]) == "2003-03-03T00:00"
+        assert dni_values[0] == 0  # midnight
+        assert dni_values[12] > 0  # noon
+        assert np.array_equal(dni_values, make_synthetic_weather("2003-03-03", num_years=1)[1])
+
+    def test_weather_fixture_round_trip(self, tmp_path):
+        timestamps, dni_values = make_synthetic_weather("2003-03-03", num_years=1)
+        save_weather_fixture(str(tmp_path / "weather.npz"), timestamps, dni_values)
+        loaded_timestamps, loaded_dni_values = load_weather_fixture(str(tmp_path / "weather.npz"))
+        assert np.array_equal(loaded_timestamps, timestamps)
+        assert np.array_equal(loaded_dni_values, dni_values)
+
+    def test_week_benchmark_runs_offline(self):
+        working_directory = os.getcwd()
+        results = run_benchmarks(["week"], repeats=1)
+
+        assert os.getcwd() == working_directory
+        for phase_name in ("get_weather_data", "write_out_simulation_results",
+                           "run_one_hourly_iteration_of_simulation", "WaterContainer.run_hour_of_usage",
+                           "start_simulation", "start_simulation_with_kernel", "start_simulation_with_fast_forward"):
+            assert results["week"][phase_name] > 0
+
+    def test_slotted_components_use_less_memory(self):
+        results = run_component_memory_benchmark(num_components=200)
+        assert set(results) == {"SolarCollector", "WaterPump", "WaterContainer"}
+        for allocated_bytes in results.values():
+            assert 0 < allocated_bytes["slotted"] < allocated_bytes["instance_dict"]
+        # one shared consumption schedule instead of 70KB per container
+        assert results["WaterContainer"]["slotted"] < 200 * 24 * 366 * 2 * 4 / 10
+
+    def test_typed_weather_uses_less_memory(self):
+        results = run_weather_memory_benchmark(num_years=1)
+        # 8 byte timestamp + 4 byte DNI per hour
+        assert results["typed"]["bytes"] <= results["num_hours"] * 12 * 1.1
+        assert results["typed"]["bytes"] * 4 < results["string_indexed"]["bytes"]
+
+    def test_first_request_skips_heavy_imports(self):
+        results = run_cold_start_benchmark(repeats=1)
+        # geocoded from the cache and uploaded nowhere, so neither Google client nor its libraries are needed
+        assert {"googlemaps", "google.cloud.bigquery", "pandas", "requests"}.isdisjoint(
+            results["lazy"]["heavy_modules_loaded"])
+        assert "googlemaps" in results["eager"]["heavy_modules_loaded"]
+
+    def test_shared_clients_reuse_connections(self):
+        results = run_external_clients_benchmark(concurrency=4, num_simulations=40, max_connections=3)
+        assert results["shared"]["connections_opened"] <= 3
+        assert results["per_simulation"]["connections_opened"] == 40
+
+    def test_result_formats_are_smaller_than_csv(self):
+        results = run_result_formats_benchmark(num_hours=24 * 30, repeats=1)
+        assert results["num_rows"] == 24 * 30
+        for format_name, measurement in results["formats"].items():
+            assert measurement["seconds"] > 0
+            if format_name != "csv":
+                assert measurement["bytes"] < results["formats"]["csv"]["bytes"]